@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import Iterator
+from streamllm.framework.providers import LLMProvider, LLMParams
+
+"""
+确定性的 mock LLM provider，通过 register_provider 注册实例后接入 LLMQueryClient / AsyncLLMQueryClient。
+每个 prompt 的延迟由 (seed, prompt) 决定：latency ± jitter，与线程调度无关，因此多次运行结果可比较。
+"""
+
+
+class MockProvider(LLMProvider):
+    name = "mock"
+    display_name = "Mock"
+    default_model = "mock"
+    requires_api_key = False
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, seed: int = 0, chunks: int = 4):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.chunks = chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def delay(self, prompt: str) -> float:
+        rng = random.Random(f"{self.seed}:{prompt}")
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def response(self, prompt: str) -> str:
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]
+        return f"mock answer {digest}"
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def query(self, prompt: str, params: LLMParams = None) -> str:
+        self._count()
+        time.sleep(self.delay(prompt))
+        return self.response(prompt)
+
+    def stream(self, prompt: str, params: LLMParams = None) -> Iterator[str]:
+        # 把总延迟平均分到每个片段上
+        self._count()
+        response = self.response(prompt)
+        step = max(1, len(response) // self.chunks)
+        pieces = [response[i:i + step] for i in range(0, len(response), step)]
+        for piece in pieces:
+            time.sleep(self.delay(prompt) / len(pieces))
+            yield piece
+
+    async def aquery(self, prompt: str, params: LLMParams = None) -> str:
+        self._count()
+        await asyncio.sleep(self.delay(prompt))
+        return self.response(prompt)
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+"""
+Stream / Agent 运行时的基准测试。
+
+    python benchmarks/run.py                          # 运行所有拓扑，结果写入 benchmarks/results/<commit>.json
+    python benchmarks/run.py -t chain -t diamond --items 500 --latency 0.02 --jitter 0.005
+    python benchmarks/run.py --compare benchmarks/results/<baseline>.json
+    python benchmarks/run.py --coalesce                # 开启 single-flight，LLM 调用数与默认结果对比即为合并的效果
+
+每个拓扑在独立的子进程中运行，峰值 RSS 互不影响。
+每条数据的延迟是从 emit 到该数据在所有 Agent 上处理完成的时间（由追踪 span 计算），
+吞吐量为输入条数除以从第一次 emit 到全部处理完成的时间。
+"""
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    # 最近秩法
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def run_topology(name: str, items: int, latency: float, jitter: float, seed: int, rate: float,
+                 coalesce: bool = False) -> Dict[str, Any]:
+    from streamllm import tracer
+    from streamllm.framework.llm import inflight_queries
+    from streamllm.framework.providers import register_provider
+    from streamllm.framework.tracing import SpanExporter
+    from mock_provider import MockProvider
+    from topologies import TOPOLOGIES
+
+    class CompletionExporter(SpanExporter):
+        # 记录每条 trace 的开始时间（根 span）和最后一个 span 的结束时间
+        def __init__(self):
+            self.starts: Dict[str, float] = {}
+            self.ends: Dict[str, float] = {}
+            self._lock = threading.Lock()
+
+        def export(self, span):
+            with self._lock:
+                if span.parent_id is None:
+                    self.starts[span.trace_id] = span.start
+                self.ends[span.trace_id] = max(self.ends.get(span.trace_id, 0.0), span.end)
+
+        def latencies(self) -> List[float]:
+            with self._lock:
+                return [self.ends[trace_id] - start for trace_id, start in self.starts.items()]
+
+    provider = MockProvider(latency=latency, jitter=jitter, seed=seed)
+    register_provider("mock", provider)
+    topology = TOPOLOGIES[name]()
+    topology.set_coalesce(coalesce)
+    exporter = CompletionExporter()
+    tracer.add_exporter(exporter)
+
+    interval = 1.0 / rate if rate > 0 else 0.0
+    start = time.perf_counter()
+    for i in range(items):
+        if interval:
+            # 按固定速率发送，测量非饱和状态下的延迟
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        topology.sources[i % len(topology.sources)].emit(f"{name} item {i}")
+    topology.stream_manager.wait_idle()
+    elapsed = time.perf_counter() - start
+
+    latencies = exporter.latencies()
+    return {
+        'items': items,
+        'streams': len(topology.stream_manager.list_streams()),
+        'agents': len(topology.agents),
+        'llm_calls': provider.calls,
+        # single-flight 合并掉的调用次数（--coalesce 时），llm_calls + coalesced_calls 为 Agent 发起的查询次数
+        'coalesced_calls': inflight_queries.get_stats()['shared'],
+        'elapsed': elapsed,
+        'throughput': items / elapsed,
+        'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p99': percentile(latencies, 0.99),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    打印两次结果的对比，返回吞吐量下降或 p99 上升超过 threshold（比例）的拓扑。
+    """
+    regressions = []
+    print(f"{'topology':<10} {'throughput':>22} {'p99 (ms)':>22}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if not base:
+            continue
+        throughput_change = result['throughput'] / base['throughput'] - 1
+        p99_change = result['latency_p99'] / base['latency_p99'] - 1 if base['latency_p99'] else 0.0
+        print(f"{name:<10} {base['throughput']:>8.1f} -> {result['throughput']:>7.1f} ({throughput_change:+.0%})"
+              f" {base['latency_p99'] * 1000:>8.1f} -> {result['latency_p99'] * 1000:>7.1f} ({p99_change:+.0%})")
+        if throughput_change < -threshold or p99_change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StreamLLM runtime benchmarks with a mock LLM provider")
+    parser.add_argument("-t", "--topology", action="append", help="topology to run (chain, fanout, diamond, industry); repeatable, default all")
+    parser.add_argument("--items", type=int, default=200, help="items emitted per topology")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="mock LLM latency jitter in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0.0, help="emit rate in items/s, 0 for as fast as possible")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="let agents share in-flight identical LLM calls (single-flight); off by default so fan-out cost is measured")
+    parser.add_argument("--output", help="result file, default benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="regression threshold for --compare")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # 子进程：运行单个拓扑，把结果以 JSON 输出到 stdout
+        result = run_topology(args.worker, args.items, args.latency, args.jitter, args.seed, args.rate, args.coalesce)
+        print(json.dumps(result))
+        return
+
+    from topologies import TOPOLOGIES
+    names = args.topology or list(TOPOLOGIES)
+    config = {'items': args.items, 'latency': args.latency, 'jitter': args.jitter, 'seed': args.seed, 'rate': args.rate}
+    results = {}
+    for name in names:
+        if name not in TOPOLOGIES:
+            parser.error(f"unknown topology: {name}")
+        command = [sys.executable, os.path.abspath(__file__), "--worker", name] + \
+                  [f"--{key}={value}" for key, value in config.items()] + (["--coalesce"] if args.coalesce else [])
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+        result = results[name]
+        print(f"{name:<10} {result['throughput']:8.1f} items/s  p50 {result['latency_p50'] * 1000:8.1f} ms"
+              f"  p99 {result['latency_p99'] * 1000:8.1f} ms  peak RSS {result['peak_rss_mb']:6.1f} MB"
+              f"  ({result['llm_calls']} LLM calls, {result['coalesced_calls']} coalesced)")
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {**config, 'coalesce': args.coalesce},
+        'results': results,
+    }
+    output_path = args.output or os.path.join(RESULTS_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
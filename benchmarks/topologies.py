@@ -0,0 +1,102 @@
+import os
+import tempfile
+from typing import Callable, Dict, List
+
+import yaml
+from streamllm import StreamManager, AgentStore, DSLParser, PromptAgent, Agent
+from streamllm.framework.stream import Stream
+
+"""
+基准测试使用的标准拓扑。所有 LLM Agent 都使用 mock provider（llm_type="mock"）。
+拓扑中的各 Agent 对同一条数据生成相同的 prompt，默认关闭 single-flight 合并（coalesce=False），
+LLM 调用次数反映扇出的真实成本；合并的效果由 run.py 的 --coalesce 单独测量。
+"""
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDUSTRY_TEMPLATE = os.path.join(REPO_ROOT, "src", "webserver", "config", "industry_template.yaml")
+
+
+class Topology:
+    def __init__(self, name: str, stream_manager: StreamManager, sources: List[Stream], agents: List[Agent]):
+        self.name = name
+        self.stream_manager = stream_manager
+        self.sources = sources   # 基准数据轮流 emit 到这些 Stream
+        self.agents = agents
+
+    def set_coalesce(self, coalesce: bool):
+        # 设置所有 LLM 客户端（包括路由中的各个备选客户端）是否合并并发的相同请求
+        for agent in self.agents:
+            client = getattr(agent, 'client', None)
+            clients = [route.client for route in client.routes] if hasattr(client, 'routes') else [client]
+            for client in clients:
+                if hasattr(client, 'coalesce'):
+                    client.coalesce = coalesce
+
+
+def _prompt_agent(name: str, stream: Stream) -> PromptAgent:
+    agent = PromptAgent(name, llm_type="mock")
+    agent.subscribe(stream)
+    return agent
+
+
+def linear_chain(length: int = 5) -> Topology:
+    # s0 -> s1 -> ... -> s{length-1}，每个 Stream 一个 LLM Agent
+    manager = StreamManager()
+    streams = [manager.create_stream(f"chain_{i}") for i in range(length)]
+    for upstream, downstream in zip(streams, streams[1:]):
+        upstream.connect_stream(downstream)
+    agents = [_prompt_agent(f"chain_agent_{i}", stream) for i, stream in enumerate(streams)]
+    return Topology("chain", manager, streams[:1], agents)
+
+
+def wide_fanout(width: int = 16) -> Topology:
+    # 一个源 Stream 连接 width 个下游 Stream，每个下游一个 LLM Agent
+    manager = StreamManager()
+    source = manager.create_stream("fanout_source")
+    agents = []
+    for i in range(width):
+        stream = manager.create_stream(f"fanout_{i}")
+        source.connect_stream(stream)
+        agents.append(_prompt_agent(f"fanout_agent_{i}", stream))
+    return Topology("fanout", manager, [source], agents)
+
+
+def diamond() -> Topology:
+    # source -> left / right -> sink，sink 每条数据只应收到一次
+    manager = StreamManager()
+    source, left, right, sink = (manager.create_stream(name) for name in ("diamond_source", "diamond_left", "diamond_right", "diamond_sink"))
+    source.connect_stream(left)
+    source.connect_stream(right)
+    left.connect_stream(sink)
+    right.connect_stream(sink)
+    agents = [_prompt_agent(f"diamond_agent_{stream.name}", stream) for stream in (source, left, right, sink)]
+    return Topology("diamond", manager, [source], agents)
+
+
+def industry_template(path: str = INDUSTRY_TEMPLATE) -> Topology:
+    # README 中的工业模板，LLM Agent 改为使用 mock provider；数据轮流 emit 到所有被订阅的 Stream
+    with open(path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    for agent_conf in config.get('agents', []):
+        if 'llm_type' in agent_conf:
+            agent_conf['llm_type'] = "mock"
+    # DSLParser 可能回写配置文件，使用临时副本
+    with tempfile.NamedTemporaryFile('w', suffix=".yaml", delete=False, encoding='utf-8') as file:
+        yaml.dump(config, file, sort_keys=False)
+        temp_path = file.name
+    try:
+        parser = DSLParser(config_path=temp_path, stream_manager=StreamManager(), agent_store=AgentStore())
+        parser.parse()
+    finally:
+        os.remove(temp_path)
+    manager = parser.get_stream_manager()
+    sources = [stream for stream in manager.list_streams() if stream.handlers]
+    return Topology("industry", manager, sources, parser.get_agent_store().list_agents())
+
+
+TOPOLOGIES: Dict[str, Callable[[], Topology]] = {
+    'chain': linear_chain,
+    'fanout': wide_fanout,
+    'diamond': diamond,
+    'industry': industry_template,
+}
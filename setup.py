@@ -11,10 +11,16 @@ setup(
     install_requires=[
         'zhipuai',
         'openai',
+        'httpx',
         'flask',
         'flask-socketio',
         'pyyaml',
     ],
+    extras_require={
+        'filters': ['numpy'],
+        'cache': ['numpy'],
+        'tokens': ['tiktoken'],
+    },
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Developers',
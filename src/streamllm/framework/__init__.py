@@ -1,8 +1,16 @@
 from .agent_store import AgentStore
 from .stream_manager import StreamManager
+from .stream import StreamFullError
 from .agent_family import *
 from .dsl_parser import DSLParser
 from .agent import Agent, PromptAgent, AssistAgent
+from .log import setup_logging
+from .metrics import get_metrics, render_metrics, agent_status
+from .tracing import tracer, configure_tracing, InMemoryExporter, JSONExporter, summarize_trace
+from .resilience import LLMQueryError, LLMTimeoutError, CircuitOpenError, configure_resilience
+from .router import LLMRouter
 
-__all__ = [ 'AgentStore', 'StreamManager', 'DSLParser', 'Agent', 'PromptAgent', 'AssistAgent']
+__all__ = [ 'AgentStore', 'StreamManager', 'StreamFullError', 'DSLParser', 'Agent', 'PromptAgent', 'AssistAgent', 'setup_logging', 'get_metrics', 'render_metrics', 'agent_status',
+            'tracer', 'configure_tracing', 'InMemoryExporter', 'JSONExporter', 'summarize_trace',
+            'LLMQueryError', 'LLMTimeoutError', 'CircuitOpenError', 'configure_resilience', 'LLMRouter']
 __all__ += agent_family.__all__
\ No newline at end of file
@@ -1,88 +1,356 @@
+import asyncio
+import logging
 from openai import OpenAI
-from typing import Any
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple, Union
 from flask_socketio import SocketIO
-from .llm import LLMQueryClient
+from .llm import LLMQueryClient, AsyncLLMQueryClient
+from .router import build_router
+from .resilience import LLMQueryError
 from .stream import Stream
+from .dispatcher import AsyncDispatcher
+from .batcher import MicroBatcher, build_batch_prompt, split_batch_response
+from .cache import ResponseCache
+from .prompt_builder import PromptBuilder
+from .executor import run_task
+from .payload import is_binary
+from .telemetry import get_telemetry
+from .tracing import tracer, current_span, use_span, Span
+from .metrics import AGENT_LLM_SECONDS, AGENT_ERRORS, AGENT_INPUT_TOKENS, AGENT_OUTPUT_TOKENS, agent_status
+
+logger = logging.getLogger(__name__)
 
 class Agent:
+    # 接受的数据类型（见 payload.PAYLOAD_KINDS），None 表示接受所有类型；Stream 只把符合的数据分发给该 Agent
+    accepts: Optional[Tuple[str, ...]] = None
+
     def __init__(self, name: str, socketio: SocketIO=None):
         self.category = "Agent"
         self.name = name
         self.socketio = socketio
+        self.telemetry = get_telemetry(socketio)
         self.subscribed_streams = []
+        self.partial_stream: Optional[Stream] = None   # 接收流式输出片段的下游 Stream（可选）
+        self.dead_letter_stream: Optional[Stream] = None   # 接收处理失败的数据的死信 Stream（可选）
+        self.output_streams: List[Stream] = []   # 每个回答都发送到这些 Stream，用于串联多个 Agent
+        self.executor = "inline"   # CPU 密集型处理的执行方式：inline / thread / process
+        self.predicate: Optional[Callable[[Any], bool]] = None   # 额外的过滤条件，在分发前由 Stream 执行
 
     def process_data(self, data: Any):
         raise NotImplementedError("Subclasses should implement this method")
     
-    def subscribe(self, stream: Stream):
+    def offload(self, fn, data: Any) -> Any:
+        # 按 self.executor 执行 CPU 密集型的处理函数（process 模式下 fn 必须是模块顶层函数）
+        return run_task(self.executor, fn, data)
+
+    def subscribe(self, stream: Stream, replay_from: Union[str, int] = None):
+        # replay_from 只对 persistent 的 Stream 有效：earliest 或 offset 表示先回放历史数据
         self.subscribed_streams.append(stream)
-        stream.register_handler(self.process_data)
+        stream.register_handler(self.process_data, replay_from=replay_from, kinds=self.accepts, predicate=self.predicate)
 
     def unsubscribe(self, stream: Stream):
         if stream in self.subscribed_streams:
             self.subscribed_streams.remove(stream)
             stream.unregister_handler(self.process_data)
     
+    def close(self):
+        # 删除 Agent 时调用：退订所有 Stream，子类在此释放自己的线程等资源
+        for stream in list(self.subscribed_streams):
+            self.unsubscribe(stream)
+
+    def add_output_stream(self, stream: Stream):
+        # 订阅的 Stream 同时作为输出会让回答无限循环，直接拒绝
+        if stream in self.subscribed_streams:
+            raise ValueError(f"Agent {self.name} cannot output to stream {stream.name} it subscribes to")
+        if stream not in self.output_streams:
+            self.output_streams.append(stream)
+
+    def remove_output_stream(self, stream: Stream):
+        if stream in self.output_streams:
+            self.output_streams.remove(stream)
+
+    def handle_partial_response(self, chunk: str, index: int):
+        # 流式输出的增量片段：推送到前端，并可选地发送到下游 Stream
+        if self.telemetry:
+            self.telemetry.record_response(self.name, chunk, partial=True)
+        if self.partial_stream:
+            self.partial_stream.emit(chunk, wait=False)
+
+    def get_status(self) -> dict:
+        # 处理状态（processing / done / error / idle）以及计数和耗时分位数
+        return agent_status(self.name)
+
+    def handle_failure(self, data: Any, error: Exception):
+        # 重试后仍失败的数据不再当作回答处理，而是连同错误信息发送到死信 Stream（与输出 Stream 一样入队不等待）
+        logger.warning("Agent %s failed to process data: %s", self.name, error)
+        tracer.event(f"dead_letter {self.name}", agent=self.name, error=str(error))
+        if self.telemetry:
+            self.telemetry.record_response(self.name, f"An error occurred: {error}")
+        if self.dead_letter_stream:
+            self.dead_letter_stream.emit({
+                'agent': self.name,
+                'provider': getattr(error, 'provider', None),
+                'error': str(error),
+                'data': data,
+            }, wait=False)
+
     def handle_response(self, response: str):
-        print(f"Agent {self.name} received response: {response}")
+        logger.debug("Agent %s received response: %s", self.name, response)
+        # 把回答挂到当前数据的追踪链路上
+        tracer.event(f"response {self.name}", agent=self.name)
         # 进一步处理响应，如存储、触发其他操作等
         
-        # 向前端发送处理结果
-        if self.socketio:
-            self.socketio.emit('agent_response', {
-                'agent': self.name,
-                'response': response
-            })
+        # 向前端发送处理结果（由遥测聚合器合并后批量推送）
+        if self.telemetry:
+            self.telemetry.record_response(self.name, response)
+
+        # 把回答发送到输出 Stream，入队不等待，下游的背压不会阻塞当前 Handler
+        for stream in self.output_streams:
+            stream.emit(response, wait=False)
 
 class PromptAgent(Agent):
     """
     Agent 类代表一个能够与 LLM 交互的实体。它可以通过提示（prompt）向 LLM 发起查询，并处理 Stream 中的数据。
     每个 Agent 可以订阅一个或多个 Stream，并基于收到的数据进行相应的处理。
     """
-    def __init__(self, name: str, llm_type: str, socketio: SocketIO=None):
+    # generate_prompt 使用的指令，创建时检查 max_input_tokens 是否给数据留有空间
+    instructions: Tuple[str, ...] = ("请分析以下文本数据并提供见解：", "收到数据：")
+
+    def __init__(self, name: str, llm_type: str, socketio: SocketIO=None, batch_size: int = 1, batch_wait: float = 1.0,
+                 streaming: bool = False, cache: ResponseCache = None, model: str = None, max_tokens: int = None,
+                 temperature: float = None, timeout: float = None, routing: dict = None, max_input_tokens: int = None,
+                 overflow: str = "truncate"):
         super().__init__(name, socketio)
         self.category = "PromptAgent"
         self.llm_type = llm_type
         self.socketio = socketio
-        self.client = LLMQueryClient(provider=self.llm_type)
+        # model / max_tokens / temperature / timeout 未设置时使用 provider 的默认值，
+        # 对延迟敏感的 Stream 可以为 Agent 选择更小、更快的模型
+        params = dict(model=model, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
+        self.llm_params = params
+        # routing 为 DSL 中的 llm_routing：主路由失败或过慢时改用 / 对冲到备选的 provider 或模型
+        if routing:
+            self.client = build_router(self.llm_type, routing, **params)
+        else:
+            self.client = LLMQueryClient(provider=self.llm_type, **params)
+        # batch_size > 1 时开启微批处理：攒够 batch_size 条或等待 batch_wait 秒后合并为一次 LLM 调用
+        self.batcher = MicroBatcher(self._flush_batch, batch_size, batch_wait) if batch_size > 1 else None
+        # streaming 为 True 时逐片段推送 LLM 的输出，而不是等待完整回答
+        self.streaming = streaming
+        # 响应缓存（可选），相同 provider / model / system prompt / prompt 的查询直接返回缓存结果
+        self.cache = cache
+        # 输入的 token 预算：数据超出 max_input_tokens 时截断或分块概括（overflow），输出的上限为 max_tokens
+        self.prompt_builder = PromptBuilder(name, max_input_tokens, overflow, model=self.client.model,
+                                            system_prompt=self.client.system_prompt, summarize=self._summarize_chunks)
+        for instruction in self.instructions:
+            self.prompt_builder.validate(instruction)
 
     def process_data(self, data: Any):
+        if self.batcher:
+            # 同时记下当前的追踪 span，批处理完成后每条回答仍能关联到各自的输入。
+            # 返回的 Future 在所在的批处理完成后结束，持久化 Stream 此时才提交该数据的 offset
+            done = Future()
+            self.batcher.add((data, current_span(), done))
+            return done
         prompt = self.generate_prompt(data)
-        response = self.query_llm(prompt)
+        try:
+            if self.streaming:
+                response = self.stream_llm(prompt)
+            else:
+                response = self.query_llm(prompt)
+        except LLMQueryError as e:
+            self.handle_failure(data, e)
+            return
+        self.handle_response(response)
+
+    def stream_llm(self, prompt: str) -> str:
+        # 流式查询 LLM，每个片段都通过 handle_partial_response 发出，返回拼接后的完整回答；失败时抛出 LLMQueryError
+        logger.debug("Agent %s streaming LLM with prompt: %s", self.name, prompt)
+        cached = self._cache_get(prompt)
+        if cached is not None:
+            self.handle_partial_response(cached, 0)
+            return cached
+        start = time.time()
+        chunks = []
+        with tracer.span(f"llm {self.name}", provider=self.client.provider, streaming=True) as span:
+            try:
+                for index, chunk in enumerate(self.client.stream_llm(prompt)):
+                    chunks.append(chunk)
+                    self.handle_partial_response(chunk, index)
+            except Exception as e:
+                AGENT_ERRORS.labels(self.name).inc()
+                if span:
+                    span.set_attribute('error', repr(e))
+                raise
+            finally:
+                AGENT_LLM_SECONDS.labels(self.name).observe(time.time() - start)
+            response = "".join(chunks).strip()
+            self._record_usage(prompt, response, span)
+        latency = time.time() - start
+        self._cache_set(prompt, response, latency)
+        return response
+
+    def _flush_batch(self, items: List[Tuple[Any, Optional[Span], Future]]):
+        try:
+            self.process_batch([data for data, _, _ in items], [span for _, span, _ in items])
+        finally:
+            for _, _, done in items:
+                done.set_result(None)
+
+    def process_batch(self, batch: List[Any], spans: List[Optional[Span]] = None):
+        # spans 为每条数据入批时的追踪 span，合并后的 LLM 调用记在第一条数据的链路上
+        spans = spans or [None] * len(batch)
+        if len(batch) > 1:
+            # 合并后的 prompt 整体受 max_input_tokens 限制：每条数据只分到 1/N 的预算，再扣除编号和说明
+            overhead = self.prompt_builder.tokenizer.count(build_batch_prompt([""] * len(batch)))
+            with self.prompt_builder.shared(len(batch), overhead):
+                prompts = [self.generate_prompt(data) for data in batch]
+        else:
+            prompts = [self.generate_prompt(data) for data in batch]
+        if len(prompts) == 1:
+            with use_span(spans[0]):
+                self._query_and_handle(batch[0], prompts[0])
+            return
+        with use_span(spans[0]):
+            try:
+                # 合并的回答需要容纳每条数据的回答，输出上限按条数放大，否则回答被截断后无法拆分，又退回逐条查询
+                max_tokens = self.client.max_tokens * len(prompts) if self.client.max_tokens else None
+                response = self.query_llm(build_batch_prompt(prompts), max_tokens=max_tokens)
+            except LLMQueryError as e:
+                # 合并的查询在重试后仍失败，整批数据进入死信
+                for data, span in zip(batch, spans):
+                    with use_span(span):
+                        self.handle_failure(data, e)
+                return
+        responses = split_batch_response(response, len(prompts))
+        if responses is None:
+            # 无法按编号拆分合并的回答，退回逐条查询
+            logger.warning("Agent %s failed to split batch response, falling back to per-item queries", self.name)
+            for data, prompt, span in zip(batch, prompts, spans):
+                with use_span(span):
+                    self._query_and_handle(data, prompt)
+            return
+        for response, span in zip(responses, spans):
+            with use_span(span):
+                self.handle_response(response)
+
+    def _query_and_handle(self, data: Any, prompt: str):
+        try:
+            response = self.query_llm(prompt)
+        except LLMQueryError as e:
+            self.handle_failure(data, e)
+            return
         self.handle_response(response)
 
     def generate_prompt(self, data: Any) -> str:
         # 根据数据生成提示
         if isinstance(data, str):
-            return f"请分析以下文本数据并提供见解：{data}"
-        elif isinstance(data, bytes):
+            return self.fit_prompt("请分析以下文本数据并提供见解：", data)
+        elif is_binary(data):
             return f"请分析以下图像数据并描述其内容。"
         else:
-            return f"收到数据：{data}"
+            return self.fit_prompt("收到数据：", str(data))
 
-    def query_llm(self, prompt: str) -> str:
-        print(f"Agent {self.name} querying LLM with prompt: {prompt}")
+    def fit_prompt(self, instruction: str, content: str) -> str:
+        # 指令 + 数据，数据按 Agent 的 token 预算截断或概括，子类的 generate_prompt 也应通过它拼接数据
+        return self.prompt_builder.build(instruction, content)
 
-        try:
-            response = self.client.query_llm(prompt)
-            return response
-        except Exception as e:
-            return f"An error occurred: {e}"
+    def _summarize_chunks(self, prompts: List[str], max_tokens: int) -> List[str]:
+        # 各块的概括通过异步客户端在分发器的事件循环中并发执行（只使用主路由），命中缓存的块不再查询
+        results = [self._cache_get(prompt) for prompt in prompts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        client = AsyncLLMQueryClient(provider=self.llm_type, system_prompt=self.client.system_prompt,
+                                     **{**self.llm_params, 'max_tokens': max_tokens})
+
+        async def query_all():
+            return await asyncio.gather(*(client.query_llm(prompts[i]) for i in missing))
+
+        start = time.time()
+        with tracer.span(f"llm {self.name} summarize", provider=self.client.provider, chunks=len(missing)) as span:
+            try:
+                responses = AsyncDispatcher.get_instance().run(query_all())
+            except Exception as e:
+                AGENT_ERRORS.labels(self.name).inc()
+                if span:
+                    span.set_attribute('error', repr(e))
+                raise
+            finally:
+                AGENT_LLM_SECONDS.labels(self.name).observe(time.time() - start)
+            for i, response in zip(missing, responses):
+                self._record_usage(prompts[i], response, None)
+                self._cache_set(prompts[i], response, time.time() - start)
+                results[i] = response
+        return results
+
+    def _record_usage(self, prompt: str, response: str, span: Optional[Span]):
+        # 用本地分词器统计每次调用的 token 数，用于估算延迟和费用
+        tokenizer = self.prompt_builder.tokenizer
+        input_tokens = self.prompt_builder.system_tokens + tokenizer.count(prompt)
+        output_tokens = tokenizer.count(response)
+        AGENT_INPUT_TOKENS.labels(self.name).inc(input_tokens)
+        AGENT_OUTPUT_TOKENS.labels(self.name).inc(output_tokens)
+        if span:
+            span.set_attribute('input_tokens', input_tokens)
+            span.set_attribute('output_tokens', output_tokens)
+        logger.debug("Agent %s used %d input and %d output tokens", self.name, input_tokens, output_tokens)
+
+    def query_llm(self, prompt: str, max_tokens: int = None) -> str:
+        # 重试和熔断由 LLMQueryClient 处理，最终失败时抛出 LLMQueryError；max_tokens 覆盖本次查询的输出上限
+        logger.debug("Agent %s querying LLM with prompt: %s", self.name, prompt)
+
+        cached = self._cache_get(prompt)
+        if cached is not None:
+            return cached
+        start = time.time()
+        with tracer.span(f"llm {self.name}", provider=self.client.provider) as span:
+            try:
+                response = self.client.query_llm(prompt, max_tokens=max_tokens)
+            except Exception as e:
+                AGENT_ERRORS.labels(self.name).inc()
+                if span:
+                    span.set_attribute('error', repr(e))
+                raise
+            finally:
+                AGENT_LLM_SECONDS.labels(self.name).observe(time.time() - start)
+            self._record_usage(prompt, response, span)
+        self._cache_set(prompt, response, time.time() - start)
+        return response
+
+    def _cache_get(self, prompt: str) -> Optional[str]:
+        if not self.cache:
+            return None
+        return self.cache.get(self.client.provider, self.client.model, self.client.system_prompt, prompt)
+
+    def _cache_set(self, prompt: str, response: str, latency: float):
+        if not self.cache:
+            return
+        self.cache.set(self.client.provider, self.client.model, self.client.system_prompt, prompt, response, latency)
 
 class AssistAgent(PromptAgent):
     """
     AssistAgent 类代表一个能够与 LLM 交互的实体。它可以通过提示（prompt）向 LLM 发起查询，并处理 Stream 中的数据。
     每个 Agent 可以订阅一个或多个 Stream，并基于收到的数据进行相应的处理。
     """
-    def __init__(self, name: str, llm_type: str, socketio: SocketIO=None):
-        super().__init__(name, llm_type, socketio=socketio)
+    instructions = ("收到数据：",)
+
+    def __init__(self, name: str, llm_type: str, socketio: SocketIO=None, batch_size: int = 1, batch_wait: float = 1.0,
+                 streaming: bool = False, cache: ResponseCache = None, model: str = None, max_tokens: int = None,
+                 temperature: float = None, timeout: float = None, routing: dict = None, max_input_tokens: int = None,
+                 overflow: str = "truncate"):
+        super().__init__(name, llm_type, socketio=socketio, batch_size=batch_size, batch_wait=batch_wait,
+                         streaming=streaming, cache=cache, model=model, max_tokens=max_tokens,
+                         temperature=temperature, timeout=timeout, routing=routing,
+                         max_input_tokens=max_input_tokens, overflow=overflow)
         self.category = "AssistAgent"
 
     def generate_prompt(self, data: Any) -> str:
         # 根据数据生成提示
         if isinstance(data, str):
             return f"我是一个乐于解答各种问题的助手，您可以问我任何问题。"
-        elif isinstance(data, bytes):
+        elif is_binary(data):
             return f"我是一个乐于解答各种问题的助手，可以处理图像数据。"
         else:
-            return f"收到数据：{data}"
\ No newline at end of file
+            return self.fit_prompt("收到数据：", str(data))
\ No newline at end of file
@@ -1,35 +1,57 @@
+import logging
 from PIL import Image
-import io
-from typing import Any
+from typing import Any, Dict, List, Union
 from ..stream import Stream
 from ..agent import Agent
 from flask_socketio import SocketIO
+from ..payload import Payload, open_buffer, describe
+from ..filter_engine import FilterSpec
+from ..window import WindowOperator, DEFAULT_KEY_IDLE
+
+logger = logging.getLogger(__name__)
 
 """
 为了支持多模态数据处理，Stream 可以根据数据类型将数据分发给不同的 HandlerAgent
 例如，可以为文本、图像、音频等不同类型的数据注册不同的处理器。
 """
 
+# CPU 密集型的解码函数定义在模块顶层，以便通过 Agent.offload 在进程池中执行
+def _image_size(data) -> tuple:
+    image = Image.open(open_buffer(data))
+    return image.size
+
+def _audio_duration(data) -> float:
+    import wave
+    with wave.open(open_buffer(data), 'rb') as wf:
+        frames = wf.getnframes()
+        rate = wf.getframerate()
+        return frames / float(rate)
+
 class TextHandlerAgent(Agent):
+    # 除文本外也处理结构化数据（如 WindowAgent 的窗口摘要），只把二进制数据留给对应的 HandlerAgent
+    accepts = ("text", "dict", "other")
+
     def __init__(self, name: str, socketio : SocketIO = None):
         super().__init__(name=name, socketio=socketio)
         self.category = "TextHandlerAgent"
 
     def process_data(self, data: str):
-        print(f"Text Handler processing data: {data}")
+        logger.debug("Text Handler processing data: %s", data)
         self.handle_response(f"Processed text data: {data}")
 
 class ImageHandlerAgent(Agent):
+    accepts = ("image",)
+
     def __init__(self, name: str, socketio : SocketIO = None):
         super().__init__(name=name, socketio=socketio)
         self.category = "ImageHandlerAgent"
 
-    def process_data(self, data: bytes):
+    def process_data(self, data: Union[bytes, Payload]):
         try:
-            image = Image.open(io.BytesIO(data))
-            print(f"[Image Handler] Received image with size: {image.size}")
+            size = self.offload(_image_size, data)
+            logger.debug("[Image Handler] Received image with size: %s", size)
         except Exception as e:
-            print(f"[Image Handler] Failed to process data: {e}")
+            logger.warning("[Image Handler] Failed to process data: %s", e)
 
         self.handle_response(f"Processed image data: <data>")
 
@@ -39,19 +61,29 @@ class LoggingHandlerAgent(Agent):
         self.category = "LoggingHandlerAgent"
 
     def process_data(self, data: Any):
-        print(f"[Logging Handler] Data: {data}")
-        self.handle_response(f"Logged data: {data}")
+        logger.info("[Logging Handler] Data: %s", describe(data))
+        self.handle_response(f"Logged data: {describe(data)}")
 
 class DataFilterHandlerAgent(Agent):
-    def __init__(self, name: str, keyword: str, socketio : SocketIO = None):
+    """
+    只处理满足过滤条件的数据：keyword / keywords（文本包含任一关键字）、regex（文本匹配任一正则）
+    或 fields（dict 数据的所有字段条件都满足）。条件以 FilterSpec 交给 Stream，与同一 Stream 上
+    其他 DataFilterHandlerAgent 的条件编译在一起，每条数据只匹配一次，不匹配的数据不会进入该 Agent 的 inbox。
+    """
+    def __init__(self, name: str, keyword: str = None, socketio : SocketIO = None, keywords: List[str] = None,
+                 regex: Union[str, List[str]] = None, fields: Dict[str, Any] = None):
         super().__init__(name=name, socketio=socketio)
         self.category = "DataFilterHandlerAgent"
         self.keyword = keyword
+        self.spec = FilterSpec(keywords=([keyword] if keyword else []) + list(keywords or []), regex=regex, fields=fields)
+        if not self.spec.kinds:
+            raise ValueError("DataFilterHandlerAgent needs a keyword, keywords, regex or fields")
+        self.accepts = self.spec.kinds
+        self.predicate = self.spec
 
     def process_data(self, data: Any):
-        if isinstance(data, str) and self.keyword in data:
-            print(f"[Data Filter Handler] '{self.keyword}' found in data: {data}")
-        self.handle_response(f"Filtered data: {data}")
+        logger.debug("[Data Filter Handler] %s matched data: %s", self.name, describe(data))
+        self.handle_response(f"Filtered data: {describe(data)}")
 
 class ForwardingHandlerAgent(Agent):
     def __init__(self, name: str, target_stream: Stream, socketio : SocketIO = None):
@@ -60,27 +92,49 @@ class ForwardingHandlerAgent(Agent):
         self.target_stream = target_stream
 
     def process_data(self, data: Any):
-        print(f"Forwarding handler forwarding data to stream {self.target_stream.name}: {data}")
-        self.target_stream.emit(data)
+        logger.debug("Forwarding handler forwarding data to stream %s", self.target_stream.name)
+        # 入队不等待：在分发线程池中阻塞等待下游的空位，可能与下游的 worker 互相等待而死锁
+        self.target_stream.emit(data, wait=False)
         self.handle_response(f"Forwarded data to stream {self.target_stream.name}")
 
 class AudioHandlerAgent(Agent):
+    accepts = ("audio",)
+
     def __init__(self, name: str, socketio : SocketIO = None):
         super().__init__(name=name, socketio=socketio)
         self.category = "AudioHandlerAgent"
 
-    def process_data(self, data: bytes):
+    def process_data(self, data: Union[bytes, Payload]):
         try:
             # 假设处理音频数据，例如获取音频时长
-            import wave
-            with wave.open(io.BytesIO(data), 'rb') as wf:
-                frames = wf.getnframes()
-                rate = wf.getframerate()
-                duration = frames / float(rate)
-                print(f"[Audio Handler] Received audio with duration: {duration} seconds")
+            duration = self.offload(_audio_duration, data)
+            logger.debug("[Audio Handler] Received audio with duration: %s seconds", duration)
         except Exception as e:
-            print(f"[Audio Handler] Failed to process data: {e}")
+            logger.warning("[Audio Handler] Failed to process data: %s", e)
+
+        self.handle_response(f"Processed audio data: {describe(data)}")
+
+class WindowAgent(Agent):
+    """
+    窗口聚合：订阅的数据按窗口增量聚合，每个窗口结束时输出一条摘要（dict）到 output_streams，
+    下游的 Agent 处理窗口摘要而不是每一条原始数据。参数见 window.WindowOperator。
+    """
+    def __init__(self, name: str, socketio : SocketIO = None, window: str = "tumbling", size: Union[int, float, str] = None,
+                 slide: Union[int, float, str] = None, gap: Union[float, str] = None, aggregates: List[Any] = None,
+                 key_by: str = None, idle: Union[float, str] = DEFAULT_KEY_IDLE):
+        super().__init__(name=name, socketio=socketio)
+        self.category = "WindowAgent"
+        self.window = WindowOperator(self.handle_response, kind=window, size=size, slide=slide, gap=gap,
+                                     aggregates=aggregates, key_by=key_by, idle=idle)
+
+    def process_data(self, data: Any):
+        self.window.add(data)
+
+    def close(self):
+        super().close()
+        self.window.close()
 
-        self.handle_response(f"Processed audio data: {data}")
+    def get_stats(self) -> Dict[str, Any]:
+        return self.window.get_stats()
 
-__all__ = [ "TextHandlerAgent", "ImageHandlerAgent", "LoggingHandlerAgent", "DataFilterHandlerAgent", "ForwardingHandlerAgent", "AudioHandlerAgent" ]
\ No newline at end of file
+__all__ = [ "TextHandlerAgent", "ImageHandlerAgent", "LoggingHandlerAgent", "DataFilterHandlerAgent", "ForwardingHandlerAgent", "AudioHandlerAgent", "WindowAgent" ]
\ No newline at end of file
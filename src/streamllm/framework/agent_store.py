@@ -1,7 +1,14 @@
+import logging
 from .agent import Agent, AssistAgent
+from .cache import get_cache
+from .executor import EXECUTOR_KINDS
+from .payload import PAYLOAD_KINDS
 from typing import List
 from flask_socketio import SocketIO
-from .agent_family.handler_agent import TextHandlerAgent, ImageHandlerAgent, LoggingHandlerAgent, DataFilterHandlerAgent, ForwardingHandlerAgent, AudioHandlerAgent
+from .window import DEFAULT_KEY_IDLE
+from .agent_family.handler_agent import TextHandlerAgent, ImageHandlerAgent, LoggingHandlerAgent, DataFilterHandlerAgent, ForwardingHandlerAgent, AudioHandlerAgent, WindowAgent
+
+logger = logging.getLogger(__name__)
 
 class AgentStore:
     """
@@ -16,7 +23,8 @@ class AgentStore:
             "AudioHandlerAgent",
             "LoggingHandlerAgent", 
             "DataFilterHandlerAgent", 
-            "ForwardingHandlerAgent"
+            "ForwardingHandlerAgent",
+            "WindowAgent"
         ]
         self.socketio = socketio
 
@@ -27,7 +35,18 @@ class AgentStore:
             llm_type = kwargs.get("llm_type")
             if llm_type is None:
                 raise ValueError("llm_type is required for AssistAgent")
-            return AssistAgent(name=name, llm_type=llm_type, socketio=self.socketio)
+            return AssistAgent(name=name, llm_type=llm_type, socketio=self.socketio,
+                               batch_size=kwargs.get("batch_size", 1),
+                               batch_wait=kwargs.get("batch_wait", 1.0),
+                               streaming=kwargs.get("streaming", False),
+                               cache=get_cache(kwargs["cache"]) if kwargs.get("cache") else None,
+                               model=kwargs.get("model"),
+                               max_tokens=kwargs.get("max_tokens"),
+                               temperature=kwargs.get("temperature"),
+                               timeout=kwargs.get("timeout"),
+                               routing=kwargs.get("llm_routing"),
+                               max_input_tokens=kwargs.get("max_input_tokens"),
+                               overflow=kwargs.get("overflow", "truncate"))
         elif category == "TextHandlerAgent":
             return TextHandlerAgent(name=name, socketio=self.socketio)
         elif category == "ImageHandlerAgent":
@@ -37,16 +56,20 @@ class AgentStore:
         elif category == "AudioHandlerAgent":
             return AudioHandlerAgent(name=name, socketio=self.socketio)
         elif category == "DataFilterHandlerAgent":
-            keyword = kwargs.get("keyword")
-            if keyword is None:
-                raise ValueError("keyword is required for DataFilterHandlerAgent")
-            return DataFilterHandlerAgent(name=name, keyword=keyword, socketio=self.socketio)
+            return DataFilterHandlerAgent(name=name, keyword=kwargs.get("keyword"), socketio=self.socketio,
+                                          keywords=kwargs.get("keywords"), regex=kwargs.get("regex"),
+                                          fields=kwargs.get("fields"))
         elif category == "ForwardingHandlerAgent":
             target_stream_name = kwargs.get("target_stream")
             target_stream = self.get_agent(target_stream_name)
             if target_stream is None:
                 raise ValueError(f"Target stream {target_stream_name} not found")
             return ForwardingHandlerAgent(name=name, target_stream=target_stream, socketio=self.socketio)
+        elif category == "WindowAgent":
+            return WindowAgent(name=name, socketio=self.socketio, window=kwargs.get("window", "tumbling"),
+                               size=kwargs.get("size"), slide=kwargs.get("slide"), gap=kwargs.get("gap"),
+                               aggregates=kwargs.get("aggregates"), key_by=kwargs.get("key_by"),
+                               idle=kwargs.get("idle", DEFAULT_KEY_IDLE))
         else:
             raise ValueError(f"Unknown agent category: {category}")
 
@@ -59,8 +82,18 @@ class AgentStore:
         category = kwargs.get("category")
         if category not in self.agent_categories:
             raise ValueError(f"Unknown agent category: {category}")
+        executor = kwargs.get("executor", "inline")
+        if executor not in EXECUTOR_KINDS:
+            raise ValueError(f"Failed to create agent {name}: unknown executor {executor}")
         try:
             agent = self.__create_agent_helper(**kwargs)
+            agent.executor = executor
+            # 覆盖该类 Agent 默认接受的数据类型
+            if kwargs.get("accepts"):
+                unknown = set(kwargs["accepts"]) - set(PAYLOAD_KINDS)
+                if unknown:
+                    raise ValueError(f"unknown payload kind(s) {', '.join(sorted(unknown))}")
+                agent.accepts = tuple(kwargs["accepts"])
             self.add_agent(agent)
             return agent
         except ValueError as e:
@@ -68,15 +101,15 @@ class AgentStore:
 
     def add_agent(self, agent: Agent):
         if agent.name in self.agents:
-            print(f"Agent {agent.name} already exists in the store.")
+            logger.warning("Agent %s already exists in the store.", agent.name)
             return
         self.agents[agent.name] = agent
-        print(f"Agent {agent.name} added to the store.")
+        logger.info("Agent %s added to the store.", agent.name)
 
     def remove_agent(self, agent_name: str):
         if agent_name in self.agents:
-            del self.agents[agent_name]
-            print(f"Agent {agent_name} removed from the store.")
+            self.agents.pop(agent_name).close()
+            logger.info("Agent %s removed from the store.", agent_name)
 
     def get_all_agents(self) -> List[Agent]:
         return list(self.agents.values())
@@ -0,0 +1,77 @@
+import re
+import threading
+from typing import Callable, Any, List, Dict, Optional
+
+"""
+微批处理：把 Stream 中连续到达的数据攒成一批，
+达到 batch_size 条或等待超过 batch_wait 秒时整体交给 flush 回调处理。
+"""
+
+class MicroBatcher:
+    def __init__(self, flush: Callable[[List[Any]], None], batch_size: int, batch_wait: float):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self._flush = flush
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.items: List[Any] = []
+        self.histogram: Dict[int, int] = {}   # 批大小 -> 次数
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, item: Any):
+        batch = None
+        with self._lock:
+            self.items.append(item)
+            if len(self.items) >= self.batch_size:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.batch_wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._flush(batch)
+
+    def flush(self):
+        # 立即处理当前已攒下的数据（等待超时或手动调用）
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._flush(batch)
+
+    def _take(self) -> List[Any]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.items = self.items, []
+        if batch:
+            self.histogram[len(batch)] = self.histogram.get(len(batch), 0) + 1
+        return batch
+
+    def get_histogram(self) -> Dict[int, int]:
+        with self._lock:
+            return dict(sorted(self.histogram.items()))
+
+
+def build_batch_prompt(prompts: List[str]) -> str:
+    # 将多个独立的提示合并为一个带编号的提示
+    parts = [f"[{i}] {prompt}" for i, prompt in enumerate(prompts, start=1)]
+    return (f"请依次回答以下 {len(prompts)} 个相互独立的请求。"
+            f"每个回答以对应的编号（如 [1]）开头并单独成段，不要遗漏、合并或改变顺序。\n\n"
+            + "\n\n".join(parts))
+
+
+_ANSWER_MARK = re.compile(r"^\s*\[(\d+)\]\s*", re.MULTILINE)
+
+def split_batch_response(response: str, count: int) -> Optional[List[str]]:
+    """
+    按编号把合并的回答拆回每条数据各自的回答，编号不完整时返回 None。
+    """
+    marks = list(_ANSWER_MARK.finditer(response))
+    answers = {}
+    for i, mark in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(response)
+        answers.setdefault(int(mark.group(1)), response[mark.end():end].strip())
+    if sorted(answers) != list(range(1, count + 1)):
+        return None
+    return [answers[i] for i in range(1, count + 1)]
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:   # numpy 为可选依赖，没有时语义缓存逐个计算相似度
+    np = None
+
+"""
+LLM 响应缓存。
+缓存键由 (provider, model, system prompt, 渲染后的 prompt) 组成，支持 LRU 容量限制和 TTL 过期。
+后端有内存（MemoryCache）和 SQLite 磁盘（SQLiteCache）两种；SemanticCache 可包装任一后端，
+在精确匹配未命中时按 embedding 相似度查找近似重复的 prompt。
+"""
+
+def make_cache_key(provider: str, model: str, system_prompt: str, prompt: str) -> str:
+    raw = json.dumps([provider, model, system_prompt, prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    缓存基类，负责命中统计；子类实现 _get / _set。
+    每个条目记录原始查询耗时，命中时累加到 saved_latency。
+    条目因 LRU 或过期被删除时以缓存键列表调用 on_evict（SemanticCache 用于同步删除向量索引）。
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict: Optional[Callable[[List[str]], None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _evicted(self, keys: List[str]):
+        # 在释放子类的锁之后调用
+        if keys and self.on_evict:
+            self.on_evict(keys)
+
+    def _get(self, key: str) -> Optional[Tuple[str, float]]:
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def _set(self, key: str, response: str, latency: float):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def get(self, provider: str, model: str, system_prompt: str, prompt: str) -> Optional[str]:
+        entry = self._get(make_cache_key(provider, model, system_prompt, prompt))
+        self._record(entry)
+        return entry[0] if entry else None
+
+    def set(self, provider: str, model: str, system_prompt: str, prompt: str, response: str, latency: float):
+        self._set(make_cache_key(provider, model, system_prompt, prompt), response, latency)
+
+    def _record(self, entry: Optional[Tuple[str, float]]):
+        with self._stats_lock:
+            if entry:
+                self.hits += 1
+                self.saved_latency += entry[1]
+            else:
+                self.misses += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'saved_latency': self.saved_latency,
+                'size': len(self),
+            }
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(ResponseCache):
+    def __init__(self, max_size: int = 1024, ttl: float = None):
+        super().__init__(max_size, ttl)
+        self.entries: 'OrderedDict[str, Tuple[str, float, float]]' = OrderedDict()   # key -> (response, latency, created)
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expired = self._expired(entry[2])
+            if expired:
+                del self.entries[key]
+            else:
+                self.entries.move_to_end(key)
+        if expired:
+            self._evicted([key])
+            return None
+        return entry[0], entry[1]
+
+    def _set(self, key: str, response: str, latency: float):
+        evicted = []
+        with self._lock:
+            self.entries[key] = (response, latency, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                evicted.append(self.entries.popitem(last=False)[0])
+        self._evicted(evicted)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SQLiteCache(ResponseCache):
+    """
+    基于 SQLite 的磁盘缓存，进程重启后仍然有效。按最近访问时间做 LRU 淘汰。
+    """
+    def __init__(self, path: str = "llm_cache.db", max_size: int = 10000, ttl: float = None):
+        super().__init__(max_size, ttl)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                latency REAL NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    def _get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self.conn.execute("SELECT response, latency, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            expired = self._expired(row[2])
+            if expired:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            else:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        if expired:
+            self._evicted([key])
+            return None
+        return row[0], row[1]
+
+    def _set(self, key: str, response: str, latency: float):
+        now = time.time()
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, response, latency, now, now))
+            evicted = [row[0] for row in self.conn.execute(
+                "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?", (self.max_size,))]
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", [(evicted_key,) for evicted_key in evicted])
+            self.conn.commit()
+        self._evicted(evicted)
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def hashed_ngram_embedding(text: str, dim: int = 256) -> List[float]:
+    # 默认的本地 embedding：字符 bigram 哈希（crc32，跨进程稳定）到固定维度并归一化，无需额外依赖
+    vector = [0.0] * dim
+    for i in range(max(len(text) - 1, 1)):
+        vector[zlib.crc32(text[i:i + 2].encode('utf-8')) % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+# 语义缓存每个分组保存的向量数上限：安装了 numpy 时一次矩阵乘法完成查找，
+# 否则在 Handler 线程中逐个计算点积（每个候选 dim 次乘法），上限相应降低
+DEFAULT_MAX_CANDIDATES = 1024 if np is not None else 256
+
+
+class _VectorIndex:
+    """
+    一个分组的向量，超过 capacity 时淘汰最早加入的。安装了 numpy 时向量存为矩阵的行，
+    查找时一次矩阵乘法算出所有相似度；删除的行清零后复用。
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rows: 'OrderedDict[str, int]' = OrderedDict()   # 缓存键 -> 行号，按加入顺序
+        self.keys: List[Optional[str]] = []   # 行号 -> 缓存键，空行为 None
+        self.free: List[int] = []
+        self.vectors: List[Optional[List[float]]] = []   # 没有 numpy 时使用
+        self.matrix: Any = None
+
+    def add(self, key: str, vector: List[float]) -> List[str]:
+        # 返回因超过 capacity 被淘汰的缓存键
+        evicted = []
+        row = self.rows.pop(key, None)
+        if row is None:
+            while len(self.rows) >= self.capacity:
+                old_key, old_row = self.rows.popitem(last=False)
+                self._clear(old_row)
+                evicted.append(old_key)
+            row = self.free.pop() if self.free else self._new_row(len(vector))
+        self.rows[key] = row
+        self.keys[row] = key
+        if np is not None:
+            self.matrix[row] = vector
+        else:
+            self.vectors[row] = vector
+        return evicted
+
+    def remove(self, key: str):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self._clear(row)
+
+    def _clear(self, row: int):
+        self.keys[row] = None
+        if np is not None:
+            self.matrix[row] = 0.0   # 相似度为 0，不会超过阈值
+        else:
+            self.vectors[row] = None
+        self.free.append(row)
+
+    def _new_row(self, dim: int) -> int:
+        row = len(self.keys)
+        self.keys.append(None)
+        if np is None:
+            self.vectors.append(None)
+        elif self.matrix is None or row >= len(self.matrix):
+            # 按需成倍扩容，最多 capacity 行
+            grown = np.zeros((min(self.capacity, max(64, row * 2)), dim))
+            if self.matrix is not None:
+                grown[:row] = self.matrix
+            self.matrix = grown
+        return row
+
+    def nearest(self, vector: List[float], threshold: float) -> Optional[str]:
+        # 安装了 numpy 时使用（调用方持有锁）
+        scores = self.matrix[:len(self.keys)] @ np.asarray(vector, dtype=float)
+        best = int(scores.argmax())
+        return self.keys[best] if scores[best] >= threshold else None
+
+    def candidates(self) -> List[Tuple[str, List[float]]]:
+        return [(key, self.vectors[row]) for key, row in self.rows.items()]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class SemanticCache(ResponseCache):
+    """
+    在精确匹配之外按 embedding 余弦相似度查找近似重复的 prompt。
+    只在 (provider, model, system prompt) 相同的条目之间比较。后端淘汰的条目同时从向量索引中删除。
+    每次精确匹配未命中都要与同一分组的最多 max_candidates 个向量比较：安装了 numpy 时为一次矩阵乘法，
+    否则逐个计算点积，默认上限较低（见 DEFAULT_MAX_CANDIDATES）。
+    """
+    def __init__(self, backend: ResponseCache, threshold: float = 0.95,
+                 embed: Callable[[str], List[float]] = hashed_ngram_embedding,
+                 max_candidates: int = DEFAULT_MAX_CANDIDATES):
+        super().__init__(backend.max_size, backend.ttl)
+        self.backend = backend
+        self.threshold = threshold
+        self.embed = embed
+        self.max_candidates = max_candidates
+        self.indexes: Dict[str, _VectorIndex] = {}   # 分组键 -> 向量索引
+        self.groups: Dict[str, str] = {}   # 缓存键 -> 分组键
+        self._lock = threading.Lock()
+        backend.on_evict = self._forget
+
+    def get(self, provider: str, model: str, system_prompt: str, prompt: str) -> Optional[str]:
+        entry = self.backend._get(make_cache_key(provider, model, system_prompt, prompt))
+        if entry is None:
+            entry = self._nearest(make_cache_key(provider, model, system_prompt, ""), prompt)
+        self._record(entry)
+        return entry[0] if entry else None
+
+    def _nearest(self, group: str, prompt: str) -> Optional[Tuple[str, float]]:
+        vector = self.embed(prompt)
+        with self._lock:
+            index = self.indexes.get(group)
+            if index is None:
+                return None
+            if np is not None:
+                best_key = index.nearest(vector, self.threshold)
+            else:
+                candidates = index.candidates()
+        if np is None:
+            # 在锁外逐个计算，不阻塞其他线程写入
+            best_key, best_score = None, self.threshold
+            for key, other in candidates:
+                score = sum(a * b for a, b in zip(vector, other))
+                if score >= best_score:
+                    best_key, best_score = key, score
+        return self.backend._get(best_key) if best_key else None
+
+    def set(self, provider: str, model: str, system_prompt: str, prompt: str, response: str, latency: float):
+        key = make_cache_key(provider, model, system_prompt, prompt)
+        self.backend._set(key, response, latency)
+        group = make_cache_key(provider, model, system_prompt, "")
+        vector = self.embed(prompt)
+        with self._lock:
+            index = self.indexes.get(group)
+            if index is None:
+                index = self.indexes[group] = _VectorIndex(self.max_candidates)
+            self.groups[key] = group
+            for evicted in index.add(key, vector):
+                del self.groups[evicted]
+
+    def _forget(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                group = self.groups.pop(key, None)
+                index = self.indexes.get(group)
+                if index is None:
+                    continue
+                index.remove(key)
+                if not index:
+                    del self.indexes[group]
+
+    def __len__(self):
+        return len(self.backend)
+
+
+# 按配置共享缓存实例，使用相同配置的 Agent 共用同一个缓存
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(config: Dict) -> ResponseCache:
+    """
+    根据 DSL 中 Agent 的 cache 配置创建或获取共享的缓存，例如：
+    {backend: sqlite, path: cache.db, max_size: 1000, ttl: 3600, similarity: 0.95}
+    """
+    key = json.dumps(config, sort_keys=True)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            backend = config.get('backend', 'memory')
+            if backend == 'memory':
+                cache = MemoryCache(max_size=config.get('max_size', 1024), ttl=config.get('ttl'))
+            elif backend == 'sqlite':
+                cache = SQLiteCache(path=config.get('path', 'llm_cache.db'),
+                                    max_size=config.get('max_size', 10000), ttl=config.get('ttl'))
+            else:
+                raise ValueError(f"Unknown cache backend: {backend}")
+            if config.get('similarity'):
+                cache = SemanticCache(cache, threshold=config['similarity'])
+            _caches[key] = cache
+        return cache
+
+def list_caches() -> Dict[str, ResponseCache]:
+    with _caches_lock:
+        return dict(_caches)
@@ -0,0 +1,112 @@
+import logging
+import asyncio
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from zhipuai import ZhipuAI
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+"""
+进程级的 LLM 客户端池。
+同一 (provider, api_key, base_url) 只创建一个客户端，所有 Agent 共享它以及它底层的 HTTP keep-alive 连接，
+避免每次查询都重新建立 TCP/TLS 连接和初始化客户端。
+SDK 自带的重试关闭（max_retries=0），重试和熔断统一由 resilience 模块处理。
+"""
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_IDLE_TIMEOUT = 60.0   # 空闲连接保持时间（秒）
+
+# 智谱的 OpenAI 兼容接口，异步客户端通过它访问
+ZHIPU_OPENAI_BASE_URL = "https://open.bigmodel.cn/api/paas/v4/"
+
+class ClientPool:
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.clients: Dict[Tuple[str, str, str], Any] = {}
+        self.async_clients: Dict[Tuple[str, str, str, asyncio.AbstractEventLoop], Any] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, max_connections: int = None, idle_timeout: float = None):
+        # 修改连接上限或空闲超时，之后新建的客户端生效；已有客户端会被关闭并在下次使用时重建。
+        # 设置未变化时保留已有客户端（正在使用的连接不会被关闭）
+        with self._lock:
+            if (max_connections is None or max_connections == self.max_connections) and \
+                    (idle_timeout is None or idle_timeout == self.idle_timeout):
+                return
+            if max_connections is not None:
+                self.max_connections = max_connections
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            self._close_all()
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                            keepalive_expiry=self.idle_timeout)
+
+    def _create_client(self, provider: str, api_key: str, base_url: str = None):
+        if provider == "openai":
+            return OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                          http_client=DefaultHttpxClient(limits=self._limits()))
+        elif provider == "zhipu":
+            return ZhipuAI(api_key=api_key, base_url=base_url, max_retries=0,
+                           http_client=httpx.Client(limits=self._limits()))
+        else:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    def _create_async_client(self, provider: str, api_key: str, base_url: str = None):
+        if provider == "openai":
+            return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                               http_client=DefaultAsyncHttpxClient(limits=self._limits()))
+        elif provider == "zhipu":
+            # zhipuai SDK 没有异步客户端，使用智谱的 OpenAI 兼容接口
+            return AsyncOpenAI(api_key=api_key, base_url=base_url or ZHIPU_OPENAI_BASE_URL, max_retries=0,
+                               http_client=DefaultAsyncHttpxClient(limits=self._limits()))
+        else:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    def get_async_client(self, provider: str, api_key: str, base_url: str = None):
+        # 异步客户端的连接绑定事件循环，因此按事件循环分别缓存。
+        # 键为事件循环对象本身（id 在循环销毁后可能被复用），已关闭的事件循环的客户端在创建新客户端时丢弃
+        key = (provider, api_key, base_url, asyncio.get_running_loop())
+        with self._lock:
+            client = self.async_clients.get(key)
+            if client is None:
+                for closed in [k for k in self.async_clients if k[3].is_closed()]:
+                    del self.async_clients[closed]
+                client = self._create_async_client(provider, api_key, base_url)
+                self.async_clients[key] = client
+            return client
+
+    def get_client(self, provider: str, api_key: str, base_url: str = None):
+        key = (provider, api_key, base_url)
+        with self._lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self._create_client(provider, api_key, base_url)
+                self.clients[key] = client
+            return client
+
+    def _close_all(self):
+        for client in self.clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning("Failed to close LLM client: %s", e)
+        self.clients.clear()
+        # 异步客户端需要在各自的事件循环中关闭，这里只丢弃引用
+        self.async_clients.clear()
+
+    def close(self):
+        with self._lock:
+            self._close_all()
+
+    def __len__(self):
+        return len(self.clients)
+
+
+# 全局共享的客户端池
+client_pool = ClientPool()
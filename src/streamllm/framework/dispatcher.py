@@ -0,0 +1,230 @@
+import logging
+import asyncio
+import atexit
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+"""
+异步分发器：进程内共享一个运行在后台线程中的 asyncio 事件循环。
+每个 (Stream, Handler) 拥有独立的有界 inbox 和 worker 任务，Stream.emit 只负责入队，
+Handler 在线程池中执行，互不阻塞。
+"""
+
+DEFAULT_CAPACITY = 100
+
+# inbox 已满时的背压策略
+# block: 阻塞 emit 直到有空位
+# drop_oldest: 丢弃 inbox 中最旧的一条数据
+# drop_newest: 丢弃本次 emit 的数据
+# reject: 拒绝本次 emit 并抛出 asyncio.QueueFull
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "drop_newest", "reject")
+
+
+class HandlerWorker:
+    """
+    HandlerWorker 为单个 Handler 维护一个有界队列和一个消费任务。
+    队列中的元素为 (data, enqueued_at, context)，设置了 invoke 时以 invoke(data, enqueued_at) 代替 handler(data)，
+    由调用方（Stream）记录排队和处理耗时。Handler 在入队时复制的 contextvars 上下文中执行（用于追踪）。
+    """
+    def __init__(self, dispatcher: 'AsyncDispatcher', name: str, handler: Callable[[Any], None], capacity: int,
+                 invoke: Callable[[Any, float], None] = None):
+        self.dispatcher = dispatcher
+        self.name = name
+        self.handler = handler
+        self.invoke = invoke
+        self.capacity = capacity
+        self.queue: asyncio.Queue = None
+        self.task: asyncio.Task = None
+        self.stopped = False
+        self._blocked_puts = set()   # block 策略下等待空位的入队任务，停止时唤醒
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.capacity)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            data, enqueued_at, context = await self.queue.get()
+            try:
+                if self.invoke:
+                    await loop.run_in_executor(self.dispatcher.executor, context.run, self.invoke, data, enqueued_at)
+                else:
+                    await loop.run_in_executor(self.dispatcher.executor, context.run, self.handler, data)
+            except Exception as e:
+                logger.exception("Handler %s failed to process data: %s", self.name, e)
+            finally:
+                self.queue.task_done()
+                self.dispatcher._task_done()
+
+    async def put(self, item: tuple) -> bool:
+        # 返回是否已入队；worker 已停止或在等待空位期间被停止时返回 False
+        if self.stopped:
+            return False
+        if not self.queue.full():
+            self.queue.put_nowait(item)
+            return True
+        put = asyncio.ensure_future(self.queue.put(item))
+        self._blocked_puts.add(put)
+        try:
+            # 不直接 await put：调用方被取消时由 finally 取消入队，stop 取消入队时这里正常返回
+            await asyncio.wait([put])
+        finally:
+            self._blocked_puts.discard(put)
+            put.cancel()
+        return not put.cancelled()
+
+    def stop(self):
+        self.stopped = True
+        if self.task:
+            self.task.cancel()
+        # 唤醒 block 策略下等待空位的入队，这些数据不再入队
+        for put in list(self._blocked_puts):
+            put.cancel()
+        # 丢弃尚未处理的数据，避免 wait_idle 永远等待
+        while self.queue and not self.queue.empty():
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.dispatcher._task_done()
+
+    def qsize(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+
+class AsyncDispatcher:
+    """
+    AsyncDispatcher 管理后台事件循环、Handler 线程池以及所有 HandlerWorker。
+    通过 get_instance 获取进程级共享实例。
+    """
+    _instance: Optional['AsyncDispatcher'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers: int = 32):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="streamllm-handler")
+        self._pending = 0
+        self._idle = threading.Condition()
+        self.thread = threading.Thread(target=self._run_loop, name="streamllm-dispatcher", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get_instance(cls) -> 'AsyncDispatcher':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = AsyncDispatcher()
+                atexit.register(cls._instance.shutdown)
+            return cls._instance
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def shutdown(self):
+        # 取消所有 worker 任务并停止事件循环
+        async def _cancel_all():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(_cancel_all(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.executor.shutdown(wait=False)
+
+    def _in_loop(self) -> bool:
+        return threading.current_thread() is self.thread
+
+    def _call(self, coro):
+        # 在事件循环中执行协程并等待结果（从事件循环线程以外调用）
+        if self._in_loop():
+            raise RuntimeError("AsyncDispatcher._call must not be used from the dispatcher loop")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def run(self, coro):
+        # 在共享的事件循环中执行协程并等待结果，Handler 可以借此并发执行异步的 LLM 调用
+        return self._call(coro)
+
+    def create_worker(self, name: str, handler: Callable[[Any], None], capacity: int = DEFAULT_CAPACITY,
+                      invoke: Callable[[Any, float], None] = None) -> HandlerWorker:
+        worker = HandlerWorker(self, name, handler, capacity, invoke)
+        self._call(worker.start())
+        return worker
+
+    def stop_worker(self, worker: HandlerWorker):
+        self.loop.call_soon_threadsafe(worker.stop)
+
+    def submit(self, workers: Dict[Any, HandlerWorker], data: Any, policy: str = "block") -> int:
+        """
+        将数据放入每个 worker 的 inbox，inbox 已满时按 policy 处理。
+        返回被丢弃的数据条数；policy 为 reject 且有 inbox 已满时抛出 asyncio.QueueFull。
+        """
+        if not workers:
+            return 0
+        self._task_added(len(workers))
+        return self._call(self._put_all(list(workers.values()), data, policy, time.perf_counter(), contextvars.copy_context()))
+
+    def submit_nowait(self, workers: Dict[Any, HandlerWorker], data: Any, policy: str = "block",
+                      on_done: Callable[[Future], None] = None):
+        """
+        与 submit 相同，但不等待入队完成：入队在事件循环中进行，policy 为 block 时在事件循环中等待空位，
+        不占用调用方线程。Handler 中向下游 emit 时使用，避免线程池中的 Handler 互相等待。
+        on_done 收到一个 Future，结果为丢弃条数或 asyncio.QueueFull 异常。
+        """
+        if not workers:
+            return
+        self._task_added(len(workers))
+        future = asyncio.run_coroutine_threadsafe(
+            self._put_all(list(workers.values()), data, policy, time.perf_counter(), contextvars.copy_context()), self.loop)
+        if on_done:
+            future.add_done_callback(on_done)
+
+    async def _put_all(self, workers, data: Any, policy: str, enqueued_at: float, context: contextvars.Context) -> int:
+        # 在事件循环线程中执行，检查与入队之间没有 await，因此是原子的
+        if policy == "reject" and any(worker.queue.full() for worker in workers):
+            for _ in workers:
+                self._task_done()
+            raise asyncio.QueueFull()
+        dropped = 0
+        for worker in workers:
+            if worker.stopped:
+                # 已停止的 worker（Stream 被删除或 Handler 已退订）不再接收数据
+                self._task_done()
+                continue
+            # 同一个 Context 不能在多个线程中同时进入，每个 worker 使用一份副本
+            item = (data, enqueued_at, context.copy())
+            if policy == "block" or not worker.queue.full():
+                if not await worker.put(item):
+                    self._task_done()
+            elif policy == "drop_oldest":
+                worker.queue.get_nowait()
+                worker.queue.task_done()
+                self._task_done()
+                worker.queue.put_nowait(item)
+                dropped += 1
+            else:
+                self._task_done()
+                dropped += 1
+        return dropped
+
+    def _task_added(self, count: int):
+        with self._idle:
+            self._pending += count
+
+    def _task_done(self):
+        with self._idle:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """
+        阻塞直到所有已入队的数据都被处理完成。返回是否在超时前完成。
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
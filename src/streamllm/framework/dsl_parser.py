@@ -1,10 +1,22 @@
+import logging
 from copy import deepcopy
 import yaml
-from typing import Dict, Union, List, Tuple
+from typing import Any, Dict, Union, List, Tuple
 from .stream_manager import StreamManager
 from .agent_store import AgentStore
 from .agent import Agent
 from .stream import Stream
+from .topology import CycleError
+from .dispatcher import DEFAULT_CAPACITY
+from .client_pool import client_pool
+from .rate_limit import configure_provider_limits
+from .providers import configure_providers
+from .resilience import configure_resilience
+from .executor import configure_executors
+from .log import setup_logging
+from .tracing import configure_tracing
+
+logger = logging.getLogger(__name__)
 
 Node = Union[Stream, Agent]
 Link = Tuple[Node, Node]
@@ -23,29 +35,94 @@ class DSLParser:
             self.agent_store = AgentStore()
         self.nodes = []   # 存储所有节点, 包括Stream和Agent
         self.links = []    # 存储所有边, 用于构建拓扑图, 包括Stream-Stream, Stream-Agent
+        self.tracing_exporter = None   # parse 可能被多次调用，exporter 只创建一次
+        # 已应用的进程级配置（日志、连接池、provider、限流等），重复 parse 时只重新应用变化的部分
+        self._applied: Dict[str, Any] = {}
 
         # 读取配置文件
         with open(self.config_path, 'r', encoding='utf-8') as file:
             initconfig = yaml.safe_load(file)
             self.config = deepcopy(initconfig)
 
+    def _changed(self, section: str) -> bool:
+        # 进程级配置在每次 parse（如页面刷新触发的 /load_graph）时都会读到，
+        # 未变化时不再重新应用，避免关闭正在使用的连接、丢弃限流器等
+        return section not in self._applied or self._applied[section] != self.config.get(section)
+
+    def _mark_applied(self, section: str):
+        self._applied[section] = deepcopy(self.config.get(section))
+
     def parse(self) -> Tuple[List[Node], List[Link]]:
+        # 日志级别：logging: {level: INFO, modules: {stream: DEBUG}, queue: true}
+        logging_conf = self.config.get('logging')
+        if logging_conf and self._changed('logging'):
+            setup_logging(level=logging_conf.get('level', 'INFO'),
+                          module_levels=logging_conf.get('modules'),
+                          use_queue=logging_conf.get('queue', True))
+            self._mark_applied('logging')
+        # 端到端追踪：tracing: {exporter: memory | json, path: traces.jsonl}
+        tracing_conf = self.config.get('tracing')
+        if tracing_conf and not self.tracing_exporter:
+            self.tracing_exporter = configure_tracing(tracing_conf.get('exporter'), tracing_conf.get('path'))
+        # LLM 客户端连接池配置
+        pool_conf = self.config.get('llm_pool')
+        if pool_conf and self._changed('llm_pool'):
+            client_pool.configure(max_connections=pool_conf.get('max_connections'),
+                                  idle_timeout=pool_conf.get('idle_timeout'))
+            self._mark_applied('llm_pool')
+        # 自定义 provider（如本地的 OpenAI 兼容服务），Agent 的 llm_type 可以引用这里的名称
+        if self._changed('llm_providers'):
+            configure_providers(self.config.get('llm_providers'))
+            self._mark_applied('llm_providers')
+        # 各 provider 的并发数与 RPM / TPM 限制（AsyncLLMQueryClient 使用）
+        if self._changed('llm_limits'):
+            for provider, limits in self.config.get('llm_limits', {}).items():
+                configure_provider_limits(provider, **limits)
+            self._mark_applied('llm_limits')
+        # 各 provider 的超时、重试与熔断配置，例如 llm_resilience: {openai: {timeout: 20, retries: 3, failure_threshold: 5}}
+        if self._changed('llm_resilience'):
+            for provider, resilience in self.config.get('llm_resilience', {}).items():
+                configure_resilience(provider, **resilience)
+            self._mark_applied('llm_resilience')
+        # CPU 密集型 Handler 的线程池 / 进程池大小
+        executors_conf = self.config.get('executors')
+        if executors_conf and self._changed('executors'):
+            configure_executors(thread_workers=executors_conf.get('thread_workers'),
+                                process_workers=executors_conf.get('process_workers'))
+            self._mark_applied('executors')
+
         # 创建Streams
         # 遍历配置中的 streams，为每个流创建 Stream 实例，并注册相应的处理器。
         for stream_conf in self.config.get('streams', []):
             stream = self.stream_manager.get_stream(stream_conf['name'])
             if not stream:
-                stream = self.stream_manager.create_stream(stream_conf['name'])
+                stream = self.stream_manager.create_stream(
+                    stream_conf['name'],
+                    mode=stream_conf.get('mode', 'async'),
+                    capacity=stream_conf.get('capacity', DEFAULT_CAPACITY),
+                    policy=stream_conf.get('policy', 'block'),
+                    persistent=stream_conf.get('persistent'))
                 # nodes.push({id: agentName, type: 'agent'});
                 self.nodes.append({'id': stream.name, 'type': 'stream'})
 
-            # connection stream
-            connections = stream_conf.get('connections', [])
-            for connection in connections:
+        # connection stream
+        # 所有 Stream 创建完成后再连接，连接时增量编译每个 Stream 的分发路由
+        # on_cycle: reject（默认）遇到环时报错；break 跳过形成环的连接
+        on_cycle = self.config.get('on_cycle', 'reject')
+        for stream_conf in self.config.get('streams', []):
+            stream = self.stream_manager.get_stream(stream_conf['name'])
+            for connection in stream_conf.get('connections', []):
                 target_stream = self.stream_manager.get_stream(connection)
-                if target_stream:
+                if not target_stream:
+                    continue
+                try:
                     stream.connect_stream(target_stream)
-                    self.links.append({"source": stream.name, "target": target_stream.name})
+                except CycleError as e:
+                    if on_cycle != 'break':
+                        raise
+                    logger.warning("Skipping connection %s -> %s: %s", stream.name, target_stream.name, e)
+                    continue
+                self.links.append({"source": stream.name, "target": target_stream.name})
 
         # 创建Agents
         for agent_conf in self.config.get('agents', []):
@@ -65,8 +142,22 @@ class DSLParser:
             for stream_name in agent_conf.get('subscribed_streams', []):
                 stream = self.stream_manager.get_stream(stream_name)
                 if stream:  # Stream不存在, 跳过
-                    agent.subscribe(stream)
+                    agent.subscribe(stream, replay_from=agent_conf.get('replay_from'))
                     self.links.append({"source": stream.name, "target": agent.name})
+            # 接收流式输出片段的下游 Stream
+            partial_stream_name = agent_conf.get('partial_stream')
+            if partial_stream_name:
+                agent.partial_stream = self.stream_manager.get_stream(partial_stream_name)
+            # 输出 Stream：Agent 的每个回答都发送到这些 Stream
+            for stream_name in agent_conf.get('output_streams', []):
+                stream = self.stream_manager.get_stream(stream_name)
+                if stream:
+                    agent.add_output_stream(stream)
+                    self.links.append({"source": agent.name, "target": stream.name})
+            # 死信 Stream：Agent 未指定时使用顶层的 dead_letter_stream
+            dead_letter_name = agent_conf.get('dead_letter_stream', self.config.get('dead_letter_stream'))
+            if dead_letter_name:
+                agent.dead_letter_stream = self.stream_manager.get_stream(dead_letter_name)
 
         return self.nodes, self.links
 
@@ -111,7 +202,18 @@ class DSLParser:
                     updated_subscriptions = existing_subscriptions.union(set(streams_to_add))
                     existing_agent['subscribed_streams'] = list(updated_subscriptions)
                 else:
-                    print(f"Agent '{agent_name}' not found.")
+                    logger.warning("Agent '%s' not found.", agent_name)
+
+        # 为现有的agent添加output_streams
+        if "agent_outputs" in part_config:
+            for agent_output in part_config["agent_outputs"]:
+                agent_name = agent_output['name']
+                existing_agent = next((a for a in self.config['agents'] if a['name'] == agent_name), None)
+                if existing_agent:
+                    output_streams = existing_agent.setdefault('output_streams', [])
+                    output_streams.extend(name for name in agent_output.get('output_streams', []) if name not in output_streams)
+                else:
+                    logger.warning("Agent '%s' not found.", agent_name)
 
         # 写回配置文件
         self.writeback_config()
@@ -0,0 +1,98 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Callable
+from .payload import Payload
+
+"""
+CPU 密集型 Handler 的执行器。
+每个 Agent 可以选择 inline（在当前线程执行）、thread（独立线程池）或 process（进程池）。
+process 模式下二进制数据写入共享内存，子进程直接按名称映射读取，避免对大块数据做 pickle。
+任务函数必须定义在模块顶层（可被 pickle），并接收一个 memoryview / bytes 参数。
+"""
+
+EXECUTOR_KINDS = ("inline", "thread", "process")
+
+_thread_workers = 4
+_process_workers = os.cpu_count() or 1
+_thread_pool: ThreadPoolExecutor = None
+_process_pool: ProcessPoolExecutor = None
+_lock = threading.Lock()
+
+def configure_executors(thread_workers: int = None, process_workers: int = None):
+    # 修改线程池 / 进程池大小，已创建的池会被关闭并在下次使用时重建；大小未变化的池保持不变
+    global _thread_workers, _process_workers, _thread_pool, _process_pool
+    with _lock:
+        if thread_workers is not None and thread_workers != _thread_workers:
+            _thread_workers = thread_workers
+            if _thread_pool:
+                _thread_pool.shutdown(wait=False)
+                _thread_pool = None
+        if process_workers is not None and process_workers != _process_workers:
+            _process_workers = process_workers
+            if _process_pool:
+                _process_pool.shutdown(wait=False)
+                _process_pool = None
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=_thread_workers, thread_name_prefix="streamllm-cpu")
+        return _thread_pool
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            if os.name == "posix":
+                # 先启动 resource tracker，子进程（fork / spawn / forkserver）都继承父进程的 tracker，
+                # 而不是各自启动一个在子进程退出时 unlink 共享内存的 tracker
+                resource_tracker.ensure_running()
+            _process_pool = ProcessPoolExecutor(max_workers=_process_workers)
+        return _process_pool
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    # 共享内存由父进程负责创建和 unlink，子进程只映射。
+    # Python 3.13 以前映射时总会登记到 resource tracker：子进程共用父进程的 tracker（见 _get_process_pool），
+    # 同名登记只记一次，父进程 unlink 时撤销；子进程不能自行 unregister，否则会撤销父进程的登记
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def _run_shared(fn: Callable[[memoryview], Any], name: str, size: int) -> Any:
+    # 在子进程中执行：映射共享内存并把只读视图交给任务函数
+    shm = _attach_shared_memory(name)
+    try:
+        view = shm.buf[:size].toreadonly()
+        try:
+            return fn(view)
+        finally:
+            view.release()
+    finally:
+        shm.close()
+
+def run_task(kind: str, fn: Callable[[Any], Any], data: Any) -> Any:
+    """
+    按执行器类型运行 fn(data) 并返回结果。非二进制数据总是 inline 执行。
+    """
+    if kind not in EXECUTOR_KINDS:
+        raise ValueError(f"Unknown executor: {kind}")
+    if isinstance(data, Payload):
+        data = data.view
+    if kind == "inline" or not isinstance(data, (bytes, bytearray, memoryview)):
+        return fn(data)
+    if kind == "thread":
+        return _get_thread_pool().submit(fn, data).result()
+
+    view = memoryview(data).cast('B')
+    size = view.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        shm.buf[:size] = view
+        return _get_process_pool().submit(_run_shared, fn, shm.name, size).result()
+    finally:
+        shm.close()
+        shm.unlink()
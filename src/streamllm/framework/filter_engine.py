@@ -0,0 +1,394 @@
+import operator
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:   # numpy 为可选依赖，没有时批量匹配逐条执行
+    np = None
+
+"""
+Stream 级的过滤引擎：把订阅同一个 Stream 的所有过滤条件编译到一起，每条数据只匹配一次，
+开销随数据条数增长，而不是数据条数 × 过滤条件数。
+- 关键字：所有关键字构建成一棵前缀树，再渲染为一个正则（在 re 的 C 实现中按前缀树匹配），
+  以前瞻的方式在每个位置找出最长的关键字，其前缀关键字由预先计算的表补全；
+- 正则：合并成一个正则做预筛，只有预筛命中的数据才逐个检查各条正则；
+- 字段（dict 数据）：按 (字段, 运算) 建索引，eq / in 用哈希表，gt / ge / lt / le 用有序阈值二分查找，
+  contains 复用关键字匹配；一批数据的数值比较在安装了 numpy 时用 searchsorted 向量化执行。
+"""
+
+FIELD_OPS = ("eq", "ne", "in", "gt", "ge", "lt", "le", "contains")
+
+_COMPARE = {'eq': operator.eq, 'ne': operator.ne, 'gt': operator.gt, 'ge': operator.ge,
+            'lt': operator.lt, 'le': operator.le,
+            'in': lambda value, options: value in options,
+            'contains': lambda value, keyword: isinstance(value, str) and keyword in value}
+
+_MISSING = object()
+
+
+def get_field(record: Dict[str, Any], path: str) -> Any:
+    # 支持以 . 分隔的嵌套字段
+    value = record
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
+
+
+class FilterSpec:
+    """
+    一个订阅者的过滤条件。文本数据在任一关键字或正则命中时匹配；dict 数据在所有字段条件都满足时匹配。
+    fields 的写法：{field: value}（等于）或 {field: {op: value}}，op 见 FIELD_OPS。
+    """
+    def __init__(self, keywords: Iterable[str] = None, regex: Iterable[str] = None, fields: Dict[str, Any] = None):
+        self.keywords = [keyword for keyword in (keywords or []) if keyword]
+        self.regex = [regex] if isinstance(regex, str) else list(regex or [])
+        self.fields: List[Tuple[str, str, Any]] = []
+        for field, condition in (fields or {}).items():
+            conditions = condition.items() if isinstance(condition, dict) else [('eq', condition)]
+            for op, value in conditions:
+                if op not in FIELD_OPS:
+                    raise ValueError(f"Unknown field operator: {op}")
+                self.fields.append((field, op, value))
+        self._compiled = [re.compile(pattern) for pattern in self.regex]
+
+    @property
+    def kinds(self) -> Tuple[str, ...]:
+        # 该条件能匹配的数据类型
+        kinds = ()
+        if self.keywords or self.regex:
+            kinds += ("text",)
+        if self.fields:
+            kinds += ("dict",)
+        return kinds
+
+    def __call__(self, data: Any) -> bool:
+        # 单独求值（不经过引擎），与引擎的结果一致
+        if isinstance(data, str):
+            return any(keyword in data for keyword in self.keywords) or any(p.search(data) for p in self._compiled)
+        if isinstance(data, dict) and self.fields:
+            for field, op, expected in self.fields:
+                value = get_field(data, field)
+                if value is _MISSING or not _safe_compare(op, value, expected):
+                    return False
+            return True
+        return False
+
+    def __repr__(self):
+        return f"FilterSpec(keywords={self.keywords}, regex={self.regex}, fields={self.fields})"
+
+
+def _safe_compare(op: str, value: Any, expected: Any) -> bool:
+    try:
+        return bool(_COMPARE[op](value, expected))
+    except TypeError:
+        return False
+
+
+def _hashable(value: Any) -> bool:
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+def _is_nan(value: Any) -> bool:
+    return isinstance(value, float) and value != value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not _is_nan(value)
+
+
+def _indexable(op: str, value: Any) -> bool:
+    # 条件能否放入索引，且索引的结果与 _safe_compare 一致（NaN 在哈希表中按同一对象匹配，而 == 总是 False）
+    if op == 'in':
+        return isinstance(value, (list, tuple, set, frozenset)) and \
+            all(_hashable(option) and not _is_nan(option) for option in value)
+    if op in ('eq', 'ne'):
+        return _hashable(value) and not _is_nan(value)
+    if op == 'contains':
+        return isinstance(value, str) and value != ''
+    # 有序阈值只对数值或字符串建索引，其他类型的大小关系不一定是全序
+    return _is_number(value) or isinstance(value, str)
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    # 把关键字构建成前缀树并渲染为正则，如 alarm / alert -> al(?:arm|ert)
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def render(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # 已到达一个关键字的结尾：更长的部分可选（贪婪，优先匹配最长的关键字）
+        return f'(?:{body})?' if '' in node else body
+
+    return render(trie)
+
+
+class KeywordMatcher:
+    """
+    多关键字匹配：一次扫描返回文本中出现的所有关键字。
+    """
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = sorted(set(keywords))
+        self.pattern = re.compile(f"(?=({_trie_pattern(self.keywords)}))") if self.keywords else None
+        # 匹配到最长关键字 k 时，同一位置上 k 的所有前缀关键字也出现了
+        self.covers = {keyword: [other for other in self.keywords if keyword.startswith(other)] for keyword in self.keywords}
+
+    def find(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        if self.pattern is None:
+            return found
+        for match in self.pattern.finditer(text):
+            keyword = match.group(1)
+            if keyword not in found:
+                found.update(self.covers[keyword])
+        return found
+
+
+class _RangeIndex:
+    """
+    同一字段、同一比较运算（gt / ge / lt / le）的所有阈值，排序后二分查找满足条件的条件编号。
+    """
+    def __init__(self, op: str, entries: List[Tuple[Any, int]]):
+        self.op = op
+        entries.sort(key=lambda entry: entry[0])
+        self.thresholds = [threshold for threshold, _ in entries]
+        self.conditions = [condition for _, condition in entries]
+
+    def _cut(self, value: Any) -> int:
+        # gt: 阈值 < value 的条件满足（前缀）；ge: 阈值 <= value；lt: 阈值 > value（后缀）；le: 阈值 >= value
+        if self.op == 'gt':
+            return bisect_left(self.thresholds, value)
+        if self.op == 'ge':
+            return bisect_right(self.thresholds, value)
+        if self.op == 'lt':
+            return bisect_right(self.thresholds, value)
+        return bisect_left(self.thresholds, value)
+
+    def _slice(self, cut: int) -> List[int]:
+        return self.conditions[:cut] if self.op in ('gt', 'ge') else self.conditions[cut:]
+
+    def match(self, value: Any) -> List[int]:
+        if _is_nan(value):
+            # NaN 与任何阈值比较都不成立，二分查找的结果没有意义
+            return []
+        try:
+            return self._slice(self._cut(value))
+        except TypeError:
+            return []
+
+    def match_many(self, values: List[Any]) -> List[List[int]]:
+        # 一批数值一次 searchsorted
+        if np is not None and values and all(_is_number(value) and not isinstance(value, bool) for value in values) \
+                and all(isinstance(threshold, (int, float)) for threshold in self.thresholds):
+            side = 'left' if self.op in ('gt', 'le') else 'right'
+            cuts = np.searchsorted(np.asarray(self.thresholds, dtype=float), np.asarray(values, dtype=float), side=side)
+            return [self._slice(int(cut)) for cut in cuts]
+        return [self.match(value) for value in values]
+
+
+class _Compiled:
+    """
+    某一时刻所有过滤条件的编译结果，只读；条件变化时整体重建。
+    """
+    def __init__(self, specs: Dict[Hashable, FilterSpec]):
+        self.owners: List[Hashable] = []   # 条件编号 -> 订阅者
+        keyword_owners: Dict[str, Set[Hashable]] = {}
+        regex_owners: List[Tuple[re.Pattern, Hashable]] = []
+        # 字段条件：每个条件一个编号，dict 数据满足某订阅者的全部条件时匹配
+        self.required: Dict[Hashable, int] = {}
+        self.equals: Dict[Tuple[str, str], Dict[Any, List[int]]] = {}
+        self.not_equals: Dict[str, Dict[Any, List[int]]] = {}
+        self.not_equal_all: Dict[str, List[int]] = {}
+        ranges: Dict[Tuple[str, str], List[Tuple[Any, int]]] = {}
+        contains: Dict[str, Dict[str, List[int]]] = {}
+        self.slow: List[Tuple[str, str, Any, int]] = []   # 无法建索引的条件（如不可哈希的值），逐个比较
+
+        for owner, spec in specs.items():
+            for keyword in spec.keywords:
+                keyword_owners.setdefault(keyword, set()).add(owner)
+            for pattern in spec._compiled:
+                regex_owners.append((pattern, owner))
+            if spec.fields:
+                self.required[owner] = len(spec.fields)
+            for field, op, value in spec.fields:
+                condition = len(self.owners)
+                self.owners.append(owner)
+                if not _indexable(op, value):
+                    # 字符串的 in（子串判断）、不可哈希的值等无法建索引，与 FilterSpec 一样逐个比较
+                    self.slow.append((field, op, value, condition))
+                elif op in ('eq', 'in'):
+                    # in 的候选值去重，否则同一条件会被重复计数
+                    options = dict.fromkeys(value) if op == 'in' else [value]
+                    for option in options:
+                        self.equals.setdefault((field, 'eq'), {}).setdefault(option, []).append(condition)
+                elif op == 'ne':
+                    self.not_equals.setdefault(field, {}).setdefault(value, []).append(condition)
+                    self.not_equal_all.setdefault(field, []).append(condition)
+                elif op == 'contains':
+                    contains.setdefault(field, {}).setdefault(value, []).append(condition)
+                else:
+                    ranges.setdefault((field, op), []).append((value, condition))
+
+        self.keywords = KeywordMatcher(keyword_owners)
+        self.keyword_owners = keyword_owners
+        self.regex_owners = regex_owners
+        self.regex_prefilter = None
+        if len(regex_owners) > 1:
+            try:
+                self.regex_prefilter = re.compile("|".join(f"(?:{pattern.pattern})" for pattern, _ in regex_owners))
+            except re.error:
+                # 含反向引用等无法合并的正则时不做预筛
+                self.regex_prefilter = None
+        self.ranges: Dict[Tuple[str, str], _RangeIndex] = {}
+        for key, entries in ranges.items():
+            try:
+                self.ranges[key] = _RangeIndex(key[1], entries)
+            except TypeError:
+                # 阈值之间无法比较（类型混杂），逐个比较
+                self.slow.extend((key[0], key[1], threshold, condition) for threshold, condition in entries)
+        self.contains = {field: (KeywordMatcher(keywords), keywords) for field, keywords in contains.items()}
+        self.fields = sorted({field for field, _ in self.equals} | set(self.not_equals) | {field for field, _ in self.ranges}
+                             | set(self.contains) | {field for field, _, _, _ in self.slow})
+
+    def match_text(self, text: str) -> Set[Hashable]:
+        matched: Set[Hashable] = set()
+        for keyword in self.keywords.find(text):
+            matched |= self.keyword_owners[keyword]
+        if self.regex_owners and (self.regex_prefilter is None or self.regex_prefilter.search(text)):
+            for pattern, owner in self.regex_owners:
+                if owner not in matched and pattern.search(text):
+                    matched.add(owner)
+        return matched
+
+    def _field_conditions(self, field: str, value: Any, range_hits: Dict[Tuple[str, str], List[int]] = None) -> List[int]:
+        # 该字段取值满足的条件编号
+        hits: List[int] = []
+        if _hashable(value):
+            hits.extend(self.equals.get((field, 'eq'), {}).get(value, ()))
+            excluded = set(self.not_equals.get(field, {}).get(value, ()))
+        else:
+            # 不可哈希的取值不等于任何（可哈希的）索引值
+            excluded = set()
+        hits.extend(condition for condition in self.not_equal_all.get(field, ()) if condition not in excluded)
+        for op in ('gt', 'ge', 'lt', 'le'):
+            if range_hits is not None and (field, op) in range_hits:
+                hits.extend(range_hits[(field, op)])
+            elif (field, op) in self.ranges:
+                hits.extend(self.ranges[(field, op)].match(value))
+        if field in self.contains and isinstance(value, str):
+            matcher, conditions = self.contains[field]
+            for keyword in matcher.find(value):
+                hits.extend(conditions[keyword])
+        return hits
+
+    def match_record(self, record: Dict[str, Any], range_hits: Dict[Tuple[str, str], List[int]] = None) -> Set[Hashable]:
+        if not self.required:
+            return set()
+        satisfied: Dict[Hashable, int] = {}
+        for field in self.fields:
+            value = get_field(record, field)
+            if value is _MISSING:
+                continue
+            hits = self._field_conditions(field, value, range_hits)
+            for condition in hits:
+                owner = self.owners[condition]
+                satisfied[owner] = satisfied.get(owner, 0) + 1
+        for field, op, expected, condition in self.slow:
+            value = get_field(record, field)
+            if value is not _MISSING and _safe_compare(op, value, expected):
+                owner = self.owners[condition]
+                satisfied[owner] = satisfied.get(owner, 0) + 1
+        return {owner for owner, count in satisfied.items() if count == self.required[owner]}
+
+
+class FilterEngine:
+    """
+    一个 Stream 上所有订阅者的过滤条件。match 返回匹配某条数据的订阅者集合。
+    """
+    def __init__(self):
+        self.specs: Dict[Hashable, FilterSpec] = {}
+        self._compiled: Optional[_Compiled] = None
+        self._lock = threading.Lock()
+        self.evaluations = 0
+
+    def add(self, owner: Hashable, spec: FilterSpec):
+        with self._lock:
+            self.specs[owner] = spec
+            self._compiled = None
+
+    def remove(self, owner: Hashable):
+        with self._lock:
+            if self.specs.pop(owner, None) is not None:
+                self._compiled = None
+
+    def __contains__(self, owner: Hashable) -> bool:
+        return owner in self.specs
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def _get_compiled(self) -> _Compiled:
+        compiled = self._compiled
+        if compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    self._compiled = _Compiled(dict(self.specs))
+                compiled = self._compiled
+        return compiled
+
+    def match(self, data: Any) -> Set[Hashable]:
+        self.evaluations += 1
+        compiled = self._get_compiled()
+        if isinstance(data, str):
+            return compiled.match_text(data)
+        if isinstance(data, dict):
+            return compiled.match_record(data)
+        return set()
+
+    def match_batch(self, items: List[Any]) -> List[Set[Hashable]]:
+        """
+        批量匹配。dict 数据的范围比较按字段一次性计算（安装了 numpy 时向量化）。
+        """
+        self.evaluations += len(items)
+        compiled = self._get_compiled()
+        records = [index for index, item in enumerate(items) if isinstance(item, dict)]
+        range_hits: Dict[int, Dict[Tuple[str, str], List[int]]] = {index: {} for index in records}
+        for key, index in compiled.ranges.items():
+            present = [(position, get_field(items[position], key[0])) for position in records]
+            present = [(position, value) for position, value in present if value is not _MISSING]
+            for (position, _), hits in zip(present, index.match_many([value for _, value in present])):
+                range_hits[position][key] = hits
+        results = []
+        for position, item in enumerate(items):
+            if isinstance(item, str):
+                results.append(compiled.match_text(item))
+            elif isinstance(item, dict):
+                results.append(compiled.match_record(item, range_hits[position]))
+            else:
+                results.append(set())
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        compiled = self._get_compiled()
+        return {
+            'subscribers': len(self.specs),
+            'keywords': len(compiled.keyword_owners),
+            'regex': len(compiled.regex_owners),
+            'field_conditions': len(compiled.owners),
+            'evaluations': self.evaluations,
+        }
@@ -1,73 +1,109 @@
-from openai import OpenAI
-from zhipuai import ZhipuAI
-import os
+import logging
+from typing import Iterator
+from .providers import LLMParams, get_provider, register_provider
+from .resilience import get_policy
+from .rate_limit import get_limiter, estimate_tokens
+from .cache import make_cache_key
+from .singleflight import SingleFlight, AsyncSingleFlight
 
-# 全局的 API keys 字典
-llm_api_keys = {
-    'openai': os.getenv("OPENAI_API_KEY"),
-    'zhipu': os.getenv("ZHIPU_API_KEY"),
-    'qwen': os.getenv("QWEN_API_KEY")
-}
+logger = logging.getLogger(__name__)
+
+# 各 provider 的实现见 providers.py
+
+# 未设置 max_tokens 时，限流按这个输出 token 数估算
+DEFAULT_OUTPUT_TOKENS = 150
+
+# 进程级的 single-flight 组：并发的相同请求（provider / base URL / model / 参数 / system prompt / prompt 均相同）
+# 只向上游发送一次，所有调用方共享结果
+inflight_queries = SingleFlight()
+async_inflight_queries = AsyncSingleFlight()
 
 class LLMQueryClient:
-    def __init__(self, provider: str):
+    """
+    Agent 使用的 LLM 客户端。provider 从注册表中获取，model / max_tokens / temperature / system_prompt
+    未设置时使用 provider 的默认值，timeout 未设置时使用该 provider 容错配置中的超时。
+    请求按 provider 的容错配置重试和熔断，失败时抛出 LLMQueryError。
+    """
+    def __init__(self, provider: str, base_url: str = None, coalesce: bool = True, model: str = None,
+                 max_tokens: int = None, temperature: float = None, timeout: float = None, system_prompt: str = None):
+        self.provider = provider
+        self.backend = get_provider(provider, base_url)
+        self.base_url = self.backend.base_url
+        if timeout is None:
+            timeout = get_policy(provider).timeout
+        self.params = self.backend.resolve(LLMParams(model=model, max_tokens=max_tokens, temperature=temperature,
+                                                     timeout=timeout, system_prompt=system_prompt))
+        self.model = self.params.model
+        self.system_prompt = self.params.system_prompt
+        self.max_tokens = self.params.max_tokens
+        self.coalesce = coalesce
+
+    def _inflight_key(self, prompt: str, params: LLMParams) -> str:
+        return make_cache_key(f"{self.provider}@{self.base_url}", f"{self.model}:{params.max_tokens}:{params.temperature}",
+                              self.system_prompt, prompt)
+
+    def query_llm(self, prompt: str, max_tokens: int = None) -> str:
+        # max_tokens 覆盖本次查询的输出上限（如微批合并的查询需要容纳多条回答）
+        logger.debug("Client querying %s LLM with prompt: %s", self.provider, prompt)
+        params = self.params
+        if max_tokens is not None:
+            params = LLMParams(model=params.model, max_tokens=max_tokens, temperature=params.temperature,
+                               timeout=params.timeout, system_prompt=params.system_prompt)
+        if not self.coalesce:
+            return self._query(prompt, params)
+        response, shared = inflight_queries.do(self._inflight_key(prompt, params), lambda: self._query(prompt, params))
+        if shared:
+            logger.debug("Client %s reused an in-flight response for prompt: %s", self.provider, prompt)
+        return response
+
+    def _query(self, prompt: str, params: LLMParams) -> str:
+        return get_policy(self.provider).call(lambda: self.backend.query(prompt, params))
+
+    def stream_llm(self, prompt: str) -> Iterator[str]:
+        """
+        流式查询：逐个返回 LLM 生成的文本片段。
+        """
+        logger.debug("Client streaming %s LLM with prompt: %s", self.provider, prompt)
+        return get_policy(self.provider).stream(lambda: self.backend.stream(prompt, self.params))
+
+class AsyncLLMQueryClient:
+    """
+    LLMQueryClient 的异步版本，provider 的选择方式相同。
+    每个 provider 的请求经过限流器：信号量限制并发数，令牌桶限制每分钟的请求数和 token 数，
+    因此同一事件循环中的大量 Agent 可以共享连接而不会触发 provider 的 429。
+    """
+    def __init__(self, provider: str, base_url: str = None, max_tokens: int = None, coalesce: bool = True,
+                 model: str = None, temperature: float = None, timeout: float = None, system_prompt: str = None):
         self.provider = provider
-        self.llm_api_key = llm_api_keys.get(provider)
-        if not self.llm_api_key:
-            raise ValueError(f"API key for LLM type '{provider}' not found.")
+        self.backend = get_provider(provider, base_url)
+        self.base_url = self.backend.base_url
+        if timeout is None:
+            timeout = get_policy(provider).timeout
+        self.params = self.backend.resolve(LLMParams(model=model, max_tokens=max_tokens, temperature=temperature,
+                                                     timeout=timeout, system_prompt=system_prompt))
+        self.model = self.params.model
+        self.system_prompt = self.params.system_prompt
+        self.max_tokens = self.params.max_tokens
+        self.coalesce = coalesce
 
-    def query_llm(self, prompt: str) -> str:
-        print(f"Client querying {self.provider} LLM with prompt: {prompt}")
-        
-        if self.provider == "openai":
-            return self._query_openai(prompt)
-        elif self.provider == "zhipu":
-            return self._query_zhipu(prompt)
-        elif self.provider == "qwen":
-            return self._query_qwen(prompt)
-        else:
-            return "Unsupported LLM provider."
+    async def query_llm(self, prompt: str) -> str:
+        logger.debug("Async client querying %s LLM with prompt: %s", self.provider, prompt)
+        if not self.coalesce:
+            return await self._query(prompt)
+        key = make_cache_key(f"{self.provider}@{self.base_url}", f"{self.model}:{self.params.max_tokens}:{self.params.temperature}",
+                             self.system_prompt, prompt)
+        response, _ = await async_inflight_queries.do(key, lambda: self._query(prompt))
+        return response
 
-    def _query_openai(self, prompt: str) -> str:
-        try:
-            client = OpenAI(api_key=self.llm_api_key)
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=150,
-                temperature=0.7,
-                n=1,
-                stop=None
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            return f"An error occurred with OpenAI: {e}"
+    async def _query(self, prompt: str) -> str:
+        # 每次尝试单独经过限流器，退避等待期间不占用并发名额
+        return await get_policy(self.provider).acall(lambda: self._limited_query(prompt))
 
-    def _query_zhipu(self, prompt: str) -> str:
-        try:
-            client = ZhipuAI(api_key=self.llm_api_key) # 填写您自己的APIKey
-            response = client.chat.completions.create(
-                model="glm-4-plus",  # 填写需要调用的模型编码
-                messages=[
-                    {"role": "system", "content": "你是一个乐于解答各种问题的助手，你的任务是为用户提供专业、准确、有见地的建议。"},
-                    {"role": "user", "content": prompt}
-                ],
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            return f"An error occurred with Zhipu: {e}"
+    async def _limited_query(self, prompt: str) -> str:
+        # 限流按预估的输入 token 数加上输出上限计算，未设置 max_tokens 时按 DEFAULT_OUTPUT_TOKENS 估算
+        async with get_limiter(self.provider).limit(estimate_tokens(prompt) + (self.max_tokens or DEFAULT_OUTPUT_TOKENS)):
+            return await self.backend.aquery(prompt, self.params)
 
-    def _query_qwen(self, prompt: str) -> str:
-        # Placeholder for Qwen API integration
-        try:
-            # Implement Qwen API call here
-            return "Qwen response"
-        except Exception as e:
-            return f"An error occurred with Qwen: {e}"
-        
 if __name__ == "__main__":
     client = LLMQueryClient(provider="openai")
     response = client.query_llm("请介绍一下 Python 的装饰器。")
@@ -81,6 +117,7 @@ if __name__ == "__main__":
     response = client.query_llm("请介绍一下 Python 的装饰器。")
     print("Qwen response:", response)
     
-    client = LLMQueryClient(provider="unknown")
-    response = client.query_llm("请介绍一下 Python 的装饰器。")
-    print("Unknown provider response:", response)
\ No newline at end of file
+    try:
+        client = LLMQueryClient(provider="unknown")
+    except ValueError as e:
+        print("Unknown provider:", e)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+from typing import Dict, Optional
+
+"""
+基于 logging 的日志配置。
+框架内各模块使用 logging.getLogger(__name__)，热路径上的日志（emit、转发、LLM 查询等）都是 DEBUG 级别
+且使用 % 参数延迟格式化，级别关闭时几乎没有开销。
+setup_logging 默认通过 QueueHandler 把日志记录交给后台线程格式化和输出，调用线程不会阻塞在 stdout 上。
+"""
+
+ROOT_LOGGER = "streamllm"
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # 同一进程内的队列无需 pickle，跳过 prepare 中的格式化，由监听线程完成
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _logger_name(module: str) -> str:
+    # 支持简写的模块名，如 "stream" -> "streamllm.framework.stream"
+    if module.startswith(ROOT_LOGGER):
+        return module
+    return f"{ROOT_LOGGER}.framework.{module}"
+
+
+def setup_logging(level: str = "INFO", module_levels: Dict[str, str] = None, use_queue: bool = True,
+                  fmt: str = DEFAULT_FORMAT, handler: logging.Handler = None):
+    """
+    配置 streamllm 的日志：整体级别、各模块单独的级别，以及是否使用异步队列输出。
+    """
+    global _listener
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    for module, module_level in (module_levels or {}).items():
+        logging.getLogger(_logger_name(module)).setLevel(module_level)
+
+    # 重复调用时替换之前的配置
+    if _listener:
+        _listener.stop()
+        _listener = None
+    for old in list(root.handlers):
+        root.removeHandler(old)
+
+    target = handler or logging.StreamHandler()
+    target.setFormatter(logging.Formatter(fmt))
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        root.addHandler(_DeferredQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+        _listener.start()
+    else:
+        root.addHandler(target)
+    root.propagate = False
+
+
+def _stop_listener():
+    if _listener:
+        _listener.stop()
+
+atexit.register(_stop_listener)
@@ -0,0 +1,391 @@
+import bisect
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+"""
+节点级指标：计数器、仪表和延迟直方图。
+Stream 记录进入 / 处理完成 / 丢弃 / 错误的条数以及 inbox 排队深度，
+Agent 记录处理条数、错误数以及 Handler 耗时、LLM 耗时和端到端耗时（从进入 Stream 到 Handler 完成）。
+registry.render() 输出 Prometheus 文本格式，registry.snapshot() / agent_status() 供 Python 代码和前端使用。
+"""
+
+# 默认的延迟分桶（秒），覆盖从毫秒级的 Handler 到数十秒的 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric:
+    """
+    带标签的指标族，每组标签值对应一个子指标，通过 labels(...) 获取。
+    """
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {values}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values: str):
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def remove_matching(self, label: str, value: str):
+        # 删除某个标签等于 value 的所有子指标（如删除 Stream 时）
+        index = self.labelnames.index(label)
+        with self._lock:
+            for key in [key for key in self._children if key[index] == value]:
+                del self._children[key]
+
+    def children(self) -> List[Tuple[LabelValues, Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def samples(self) -> List[Tuple[str, LabelValues, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def samples(self):
+        return [("", values, None, child.value) for values, child in self.children()]
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], Optional[float]]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        # 读取时再调用 function 取值，适合排队深度这类现成的状态；返回 None 表示不输出
+        self._function = function
+
+    @property
+    def value(self) -> Optional[float]:
+        if self._function:
+            return self._function()
+        return self._value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def samples(self):
+        samples = []
+        for values, child in self.children():
+            value = child.value
+            if value is not None:
+                samples.append(("", values, None, value))
+        return samples
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)   # 最后一个桶为 +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> '_Timer':
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        with self._lock:
+            counts = list(self._counts)
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        # 按分桶线性插值估算分位数（与 Prometheus histogram_quantile 相同的近似方式）
+        cumulative = self.cumulative()
+        total = cumulative[-1][1]
+        if total == 0:
+            return None
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in cumulative:
+            if count >= rank:
+                if bound == math.inf:
+                    return lower_bound
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+
+class _Timer:
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def samples(self):
+        samples = []
+        for values, child in self.children():
+            cumulative = child.cumulative()
+            for bound, count in cumulative:
+                samples.append(("_bucket", values, {'le': _format_value(bound)}, count))
+            samples.append(("_sum", values, None, child.sum))
+            samples.append(("_count", values, None, cumulative[-1][1]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def metrics(self) -> List[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        # Prometheus 文本格式（text/plain; version=0.0.4）
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        以字典形式返回所有指标：计数器 / 仪表为数值，直方图为 count、sum、p50、p99。
+        """
+        result: Dict[str, Dict[str, Any]] = {}
+        for metric in self.metrics():
+            entries = {}
+            for values, child in metric.children():
+                key = ",".join(values)
+                if isinstance(metric, Histogram):
+                    entries[key] = {'count': child.count, 'sum': child.sum,
+                                    'p50': child.quantile(0.5), 'p99': child.quantile(0.99)}
+                else:
+                    value = child.value
+                    if value is not None:
+                        entries[key] = value
+            result[metric.name] = entries
+        return result
+
+
+# 进程级的默认指标注册表
+registry = MetricsRegistry()
+
+STREAM_ITEMS_IN = registry.counter("streamllm_stream_items_in_total", "Items emitted into the stream", ("stream",))
+STREAM_ITEMS_OUT = registry.counter("streamllm_stream_items_out_total", "Items processed by the stream's handlers", ("stream",))
+STREAM_DROPS = registry.counter("streamllm_stream_drops_total", "Items dropped or rejected by backpressure", ("stream", "reason"))
+STREAM_ERRORS = registry.counter("streamllm_stream_errors_total", "Handler failures while processing stream items", ("stream",))
+STREAM_QUEUE_DEPTH = registry.gauge("streamllm_stream_queue_depth", "Items waiting in the stream's handler inboxes", ("stream",))
+
+AGENT_ITEMS = registry.counter("streamllm_agent_items_total", "Items processed by the agent", ("agent",))
+AGENT_ERRORS = registry.counter("streamllm_agent_errors_total", "Agent handler and LLM failures", ("agent",))
+AGENT_IN_FLIGHT = registry.gauge("streamllm_agent_in_flight", "Items the agent is processing right now", ("agent",))
+AGENT_HANDLER_SECONDS = registry.histogram("streamllm_agent_handler_seconds", "Time spent inside the agent's handler", ("agent",))
+AGENT_LLM_SECONDS = registry.histogram("streamllm_agent_llm_seconds", "Time spent waiting for LLM responses", ("agent",))
+AGENT_E2E_SECONDS = registry.histogram("streamllm_agent_e2e_seconds", "Time from stream emit to handler completion", ("agent",))
+AGENT_INPUT_TOKENS = registry.counter("streamllm_agent_llm_input_tokens_total", "Prompt tokens sent to the LLM (local tokenizer count)", ("agent",))
+AGENT_OUTPUT_TOKENS = registry.counter("streamllm_agent_llm_output_tokens_total", "Response tokens received from the LLM (local tokenizer count)", ("agent",))
+PROMPTS_TRUNCATED = registry.counter("streamllm_agent_prompts_truncated_total", "Prompts whose data was truncated to fit max_input_tokens", ("agent",))
+PROMPTS_SUMMARIZED = registry.counter("streamllm_agent_prompts_summarized_total", "Prompts whose data was summarized to fit max_input_tokens", ("agent",))
+PROMPT_TOKENS_REMOVED = registry.counter("streamllm_agent_prompt_tokens_removed_total", "Data tokens removed by prompt truncation", ("agent",))
+
+LLM_HEDGES = registry.counter("streamllm_llm_hedged_requests_total", "Requests sent to another route because the previous one was slow", ("route",))
+LLM_FALLBACKS = registry.counter("streamllm_llm_fallbacks_total", "Requests sent to another route because the previous one failed", ("route",))
+LLM_ROUTE_WINS = registry.counter("streamllm_llm_route_wins_total", "Routed requests answered by the route", ("route",))
+
+# 各 Agent 最近一次处理的结果，用于前端显示处理状态
+_last_status: Dict[str, Tuple[str, float]] = {}
+
+
+def handler_name(handler: Callable) -> str:
+    # Agent 的 process_data 以 Agent 名称作为标签，普通函数使用函数名
+    owner = getattr(handler, '__self__', None)
+    return getattr(owner, 'name', None) or getattr(handler, '__name__', repr(handler))
+
+
+def observe_handler(stream: str, agent: str, enqueued_at: float, started_at: float, error: bool):
+    """
+    一次 Handler 调用结束时由 Stream 调用：更新 Stream 与 Agent 的计数和耗时。
+    时间均为 time.perf_counter() 的值。
+    """
+    finished_at = time.perf_counter()
+    if error:
+        STREAM_ERRORS.labels(stream).inc()
+        AGENT_ERRORS.labels(agent).inc()
+    else:
+        STREAM_ITEMS_OUT.labels(stream).inc()
+        AGENT_ITEMS.labels(agent).inc()
+    AGENT_HANDLER_SECONDS.labels(agent).observe(finished_at - started_at)
+    AGENT_E2E_SECONDS.labels(agent).observe(finished_at - enqueued_at)
+    _last_status[agent] = ("error" if error else "done", time.time())
+
+
+def remove_stream(stream: str):
+    for metric in (STREAM_ITEMS_IN, STREAM_ITEMS_OUT, STREAM_ERRORS, STREAM_QUEUE_DEPTH):
+        metric.remove(stream)
+    STREAM_DROPS.remove_matching("stream", stream)
+
+
+def agent_status(agent: str) -> Dict[str, Any]:
+    """
+    Agent 的处理状态：processing（有正在处理的数据）、error（最近一次处理失败）、done 或 idle，
+    以及计数、LLM 调用的输入 / 输出 token 数、prompt 的截断 / 概括次数和各类耗时的 p50 / p99（秒）。
+    """
+    in_flight = AGENT_IN_FLIGHT.labels(agent).value or 0
+    last = _last_status.get(agent)
+    if in_flight > 0:
+        state = "processing"
+    elif last:
+        state = last[0]
+    else:
+        state = "idle"
+    status = {
+        'state': state,
+        'in_flight': in_flight,
+        'items': AGENT_ITEMS.labels(agent).value,
+        'errors': AGENT_ERRORS.labels(agent).value,
+        'last_update': last[1] if last else None,
+        'input_tokens': AGENT_INPUT_TOKENS.labels(agent).value,
+        'output_tokens': AGENT_OUTPUT_TOKENS.labels(agent).value,
+        'prompts_truncated': PROMPTS_TRUNCATED.labels(agent).value,
+        'prompts_summarized': PROMPTS_SUMMARIZED.labels(agent).value,
+        'prompt_tokens_removed': PROMPT_TOKENS_REMOVED.labels(agent).value,
+    }
+    for key, histogram in (('handler', AGENT_HANDLER_SECONDS), ('llm', AGENT_LLM_SECONDS), ('e2e', AGENT_E2E_SECONDS)):
+        child = histogram.labels(agent)
+        status[f'{key}_p50'] = child.quantile(0.5)
+        status[f'{key}_p99'] = child.quantile(0.99)
+    return status
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def get_metrics() -> Dict[str, Dict[str, Any]]:
+    return registry.snapshot()
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import mmap
+from typing import Any, Dict, Optional, Union
+
+"""
+二进制数据（图像、音频等）的信封。
+Payload 通过 memoryview 引用底层缓冲区（bytes / bytearray / mmap），在 Stream 图中按引用传递，
+前端和日志只看到元数据（大小、类型、哈希），Handler 通过 open() 得到不复制数据的只读文件对象。
+"""
+
+Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+# 常见格式的文件头
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+def sniff_content_type(view: memoryview) -> str:
+    head = bytes(view[:16])
+    for magic, content_type in _MAGIC:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BufferReader(io.RawIOBase):
+    """
+    基于 memoryview 的只读文件对象，可以直接包装 mmap 映射的文件、共享内存或 bytearray 的视图。
+    io.BytesIO 只对 bytes 共享内存（写时复制），传入其他缓冲区时会先复制整份数据；
+    这里 readinto 只复制调用方读取的部分。
+    """
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(self._pos, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+class Payload:
+    def __init__(self, buffer: Buffer, content_type: str = None, name: str = None):
+        self._buffer = buffer   # 保持对底层对象（如 mmap）的引用
+        self.view = memoryview(buffer).cast('B').toreadonly()
+        self.content_type = content_type or sniff_content_type(self.view)
+        self.name = name
+        self._sha256: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, path: str, content_type: str = None) -> 'Payload':
+        # 以 mmap 方式映射文件，不把文件内容读入内存
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, content_type=content_type, name=path)
+
+    @property
+    def size(self) -> int:
+        return self.view.nbytes
+
+    @property
+    def sha256(self) -> str:
+        # 首次访问时计算并缓存
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.view).hexdigest()
+        return self._sha256
+
+    @property
+    def kind(self) -> str:
+        return self.content_type.split('/')[0]
+
+    def open(self) -> BufferReader:
+        return BufferReader(self.view)
+
+    def tobytes(self) -> bytes:
+        # 显式复制出 bytes，仅在确实需要时使用
+        return self.view.tobytes()
+
+    def meta(self) -> Dict[str, Any]:
+        return {'type': self.content_type, 'size': self.size, 'sha256': self.sha256}
+
+    def __len__(self):
+        return self.size
+
+    def __reduce__(self):
+        # memoryview 无法 pickle，序列化时（如写入持久化 Stream 的日志）复制出 bytes
+        return (Payload, (self.tobytes(), self.content_type, self.name))
+
+    def __repr__(self):
+        return f"<Payload {self.content_type} {self.size} bytes>"
+
+
+def is_binary(data: Any) -> bool:
+    return isinstance(data, (bytes, bytearray, memoryview, Payload))
+
+def as_view(data: Any) -> memoryview:
+    # 取得二进制数据的只读视图（不复制）
+    if isinstance(data, Payload):
+        return data.view
+    return memoryview(data).cast('B').toreadonly()
+
+def open_buffer(data: Any) -> BufferReader:
+    # Handler 读取二进制数据的统一入口，不会预先复制整份数据（包括 mmap / 共享内存上的 Payload）
+    return BufferReader(as_view(data))
+
+# Stream 按数据类型分发时使用的类型
+PAYLOAD_KINDS = ("text", "image", "audio", "binary", "dict", "other")
+
+def payload_kind(data: Any) -> str:
+    """
+    数据的类型：文本、图像 / 音频（按 content type 或文件头判断）、其他二进制数据、dict，其余为 other。
+    """
+    if isinstance(data, str):
+        return "text"
+    if isinstance(data, dict):
+        return "dict"
+    if isinstance(data, Payload):
+        content_type = data.content_type
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        content_type = sniff_content_type(as_view(data))
+    else:
+        return "other"
+    kind = content_type.split('/')[0]
+    return kind if kind in ("image", "audio") else "binary"
+
+def describe(data: Any) -> Any:
+    """
+    发送到前端 / 写入日志的数据摘要：二进制数据只给出元数据，其他数据转换为字符串。
+    原始 bytes 不计算哈希（每次都需要扫描整块数据），需要哈希时请使用 Payload，它只计算一次。
+    """
+    if isinstance(data, Payload):
+        return data.meta()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        view = as_view(data)
+        return {'type': sniff_content_type(view), 'size': view.nbytes}
+    return str(data)
@@ -0,0 +1,237 @@
+import logging
+import math
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from .rate_limit import estimate_tokens, _CJK
+from .metrics import PROMPTS_TRUNCATED, PROMPTS_SUMMARIZED, PROMPT_TOKENS_REMOVED
+
+try:
+    import tiktoken
+except ImportError:   # tiktoken 为可选依赖，没有时按字符粗略估计 token 数
+    tiktoken = None
+
+"""
+按 token 预算构建 prompt：指令部分保持完整，数据部分超出 max_input_tokens 时截断（保留开头和结尾）
+或分块让 LLM 先概括再拼接（summarize）。
+token 数使用本地分词器计算：安装了 tiktoken 时使用模型对应的编码（未知模型使用 cl100k_base），
+否则沿用限流器的估算（中文字符 1 个 token，其余 4 个字符 1 个 token）。不同 provider 的分词器不同，结果是近似值。
+"""
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_MODES = ("truncate", "summarize")
+
+# 数据超出 token 预算时逐块概括所用的提示
+SUMMARIZE_PROMPT = "请用简洁的语言概括以下内容，保留关键的数字、名称和异常信息：\n"
+DEFAULT_MAX_CHUNKS = 4   # summarize 模式下每条数据最多的概括调用次数
+
+_BLOCK = 1024   # 估算截断位置时按块扫描的字符数
+
+
+class Tokenizer:
+    """
+    计算 token 数，并按 token 数截取文本的开头 / 结尾或切分文本。
+    """
+    def __init__(self, encoding=None):
+        self.encoding = encoding
+        self.name = encoding.name if encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return estimate_tokens(text)
+
+    def head(self, text: str, tokens: int) -> str:
+        if tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+        return text[:_prefix_chars(text, tokens)]
+
+    def tail(self, text: str, tokens: int) -> str:
+        if tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[-tokens:])
+        return text[len(text) - _prefix_chars(text[::-1], tokens):]
+
+    def split(self, text: str, tokens: int) -> List[str]:
+        # 切分为每块不超过 tokens 个 token 的文本
+        if self.encoding is not None:
+            ids = self.encoding.encode(text, disallowed_special=())
+            return [self.encoding.decode(ids[i:i + tokens]) for i in range(0, len(ids), tokens)]
+        chunks = []
+        while text:
+            end = max(1, _prefix_chars(text, tokens))
+            chunks.append(text[:end])
+            text = text[end:]
+        return chunks
+
+
+def _char_cost(text: str) -> float:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) / 4
+
+def _prefix_chars(text: str, tokens: int) -> int:
+    # 估算下不超过 tokens 个 token 的最长前缀长度：先按块累加，再在超出的块内逐字符查找
+    used = 0.0
+    pos = 0
+    while pos < len(text):
+        cost = _char_cost(text[pos:pos + _BLOCK])
+        if used + cost > tokens:
+            break
+        used += cost
+        pos += _BLOCK
+    else:
+        return len(text)
+    for char in text[pos:pos + _BLOCK]:
+        cost = 1 if _CJK.match(char) else 0.25
+        if used + cost > tokens:
+            break
+        used += cost
+        pos += 1
+    return pos
+
+
+_tokenizers: Dict[Optional[str], Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+def get_tokenizer(model: str = None) -> Tokenizer:
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(model)
+        if tokenizer is None:
+            tokenizer = Tokenizer(_load_encoding(model))
+            _tokenizers[model] = tokenizer
+        return tokenizer
+
+def _load_encoding(model: Optional[str]):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # 编码文件需要联网下载，离线环境下退回估算
+        logger.warning("Failed to load tiktoken encoding for %s, estimating tokens instead: %s", model, e)
+        return None
+
+def count_tokens(text: str, model: str = None) -> int:
+    return get_tokenizer(model).count(text)
+
+
+class PromptBuilder:
+    """
+    一个 Agent 的 prompt 预算。max_input_tokens 为 system prompt、指令和数据合计的上限，为 None 时不限制。
+    overflow 为 truncate 时保留数据的开头和结尾，中间以省略标记代替；为 summarize 时把数据切成最多 max_chunks 块，
+    由 summarize 回调（参数为各块的概括 prompt 和每块回答的 token 上限）一次并发概括后再拼接，
+    数据大到 max_chunks 块也放不下时先截断，概括后仍然超出（或概括失败）时再截断。
+    截断、概括的次数和删去的 token 数按 Agent 记录在指标中。
+    """
+    def __init__(self, name: str, max_input_tokens: int = None, overflow: str = "truncate", model: str = None,
+                 system_prompt: str = None, summarize: Callable[[List[str], int], List[str]] = None,
+                 max_chunks: int = DEFAULT_MAX_CHUNKS):
+        if overflow not in OVERFLOW_MODES:
+            raise ValueError(f"Unknown prompt overflow mode: {overflow}")
+        if overflow == "summarize" and summarize is None:
+            raise ValueError("summarize overflow needs a summarize function")
+        if max_chunks < 1:
+            raise ValueError("max_chunks must be at least 1")
+        self.name = name
+        self.max_input_tokens = max_input_tokens
+        self.overflow = overflow
+        self.summarize = summarize
+        self.max_chunks = max_chunks
+        self.tokenizer = get_tokenizer(model)
+        self.system_tokens = self.tokenizer.count(system_prompt) if system_prompt else 0
+        self._local = threading.local()
+
+    def validate(self, instruction: str):
+        # 创建 Agent 时检查指令本身是否已经用完预算，避免每条数据处理时才报错
+        if self.max_input_tokens is None:
+            return
+        if self.max_input_tokens - self.system_tokens - self.tokenizer.count(instruction) <= 0:
+            raise ValueError(f"max_input_tokens {self.max_input_tokens} leaves no room for the data "
+                             f"after the system prompt and instruction")
+
+    @contextmanager
+    def shared(self, count: int, overhead: int = 0):
+        """
+        微批中 count 条数据合并为一次调用时，在此范围内构建的每条 prompt 只分到 1/count 的预算，
+        overhead 为合并时额外加入的 token 数（编号和说明）。只影响当前线程。
+        """
+        self._local.share = (count, overhead)
+        try:
+            yield
+        finally:
+            self._local.share = None
+
+    def _available(self) -> int:
+        # 指令和数据可用的 token 数
+        available = self.max_input_tokens - self.system_tokens
+        share = getattr(self._local, 'share', None)
+        if share:
+            count, overhead = share
+            available = (available - overhead) // count
+        return available
+
+    def build(self, instruction: str, content: str) -> str:
+        if self.max_input_tokens is None:
+            return instruction + content
+        budget = self._available() - self.tokenizer.count(instruction)
+        if budget <= 0:
+            if getattr(self._local, 'share', None) is None:
+                raise ValueError(f"max_input_tokens {self.max_input_tokens} leaves no room for the data")
+            # 微批中每条数据分到的预算过小，至少保留一点数据
+            budget = 1
+        tokens = self.tokenizer.count(content)
+        if tokens <= budget:
+            return instruction + content
+        if self.overflow == "summarize":
+            summarized = self._summarize(content, tokens, budget)
+            if summarized is not None:
+                PROMPTS_SUMMARIZED.labels(self.name).inc()
+                content = summarized
+                tokens = self.tokenizer.count(content)
+                if tokens <= budget:
+                    return instruction + content
+        PROMPTS_TRUNCATED.labels(self.name).inc()
+        return instruction + self._truncate(content, tokens, budget)
+
+    def _truncate(self, content: str, tokens: int, budget: int) -> str:
+        # 日志类数据的开头和结尾通常最有用：保留 2/3 的开头和 1/3 的结尾
+        marker = f"\n...（已省略约 {tokens - budget} 个 token）...\n"
+        room = budget - self.tokenizer.count(marker)
+        if room <= 0:
+            PROMPT_TOKENS_REMOVED.labels(self.name).inc(tokens - budget)
+            return self.tokenizer.head(content, budget)
+        head = room * 2 // 3
+        PROMPT_TOKENS_REMOVED.labels(self.name).inc(tokens - room)
+        return self.tokenizer.head(content, head) + marker + self.tokenizer.tail(content, room - head)
+
+    def _summarize(self, content: str, tokens: int, budget: int) -> Optional[str]:
+        # 每块加上概括提示后不超过 max_input_tokens，最多 max_chunks 块；失败时返回 None 退回截断
+        chunk_limit = self.max_input_tokens - self.system_tokens - self.tokenizer.count(SUMMARIZE_PROMPT)
+        if chunk_limit <= 0:
+            return None
+        if tokens > chunk_limit * self.max_chunks:
+            # 数据大到 max_chunks 块也放不下，先截断到可以概括的大小
+            content = self._truncate(content, tokens, chunk_limit * self.max_chunks)
+            tokens = self.tokenizer.count(content)
+        chunk_tokens = min(chunk_limit, math.ceil(tokens / self.max_chunks))
+        chunks = self.tokenizer.split(content, chunk_tokens)
+        # 估算的 token 数有取整误差，切分结果可能多出一块，放宽块大小重新切分
+        while len(chunks) > self.max_chunks and chunk_tokens < chunk_limit:
+            chunk_tokens += 1
+            chunks = self.tokenizer.split(content, chunk_tokens)
+        chunks = chunks[:self.max_chunks]
+        # 每块的概括只分到数据预算的一部分，拼接后通常不需要再截断
+        max_tokens = max(1, budget // len(chunks))
+        try:
+            summaries = self.summarize([SUMMARIZE_PROMPT + chunk for chunk in chunks], max_tokens)
+        except Exception as e:
+            logger.warning("Failed to summarize oversized prompt data, truncating instead: %s", e)
+            return None
+        return "\n".join(summaries)
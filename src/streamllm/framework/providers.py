@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, Union
+from .client_pool import client_pool
+from .resilience import DEFAULT_TIMEOUT
+
+"""
+LLM provider 注册表。
+每个 provider 是一个类，提供同步的 query、流式的 stream 和异步的 aquery，调用时传入 LLMParams（模型、max_tokens、
+temperature、超时、system prompt），因此每个 Agent 可以为同一个 provider 选择不同的模型和参数。
+provider 出错时直接抛出异常，由 LLMQueryClient 统一处理重试和熔断。
+内置 openai、zhipu、qwen（阿里云 DashScope 的 OpenAI 兼容接口）以及 openai_compatible（本地或自建的
+OpenAI 兼容服务，如 vLLM、Ollama），其他 provider 通过 register_provider 注册。
+"""
+
+
+class LLMParams:
+    """
+    单次查询的参数，未设置的字段使用 provider 的默认值。
+    """
+    def __init__(self, model: str = None, max_tokens: int = None, temperature: float = None,
+                 timeout: float = None, system_prompt: str = None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self.system_prompt = system_prompt
+
+    def __repr__(self):
+        return (f"LLMParams(model={self.model!r}, max_tokens={self.max_tokens}, temperature={self.temperature}, "
+                f"timeout={self.timeout})")
+
+
+class LLMProvider:
+    """
+    provider 基类。子类至少实现 query；stream 默认一次性返回完整回答，aquery 默认在线程中执行 query。
+    """
+    name = "base"
+    display_name = "LLM"
+    default_model: Optional[str] = None
+    default_max_tokens: Optional[int] = None
+    default_temperature: Optional[float] = None
+    default_system_prompt = "You are a helpful assistant."
+    api_key_env: Optional[str] = None
+    base_url_env: Optional[str] = None
+    default_base_url: Optional[str] = None
+    requires_api_key = True
+
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = None):
+        self.api_key = api_key or (os.getenv(self.api_key_env) if self.api_key_env else None)
+        self.base_url = base_url or (os.getenv(self.base_url_env) if self.base_url_env else None) or self.default_base_url
+        if model:
+            self.default_model = model
+        if self.requires_api_key and not self.api_key:
+            raise ValueError(f"API key for LLM type '{self.name}' not found.")
+
+    def resolve(self, params: LLMParams = None) -> LLMParams:
+        # 用 provider 的默认值补全参数
+        params = params or LLMParams()
+        return LLMParams(
+            model=params.model or self.default_model,
+            max_tokens=params.max_tokens if params.max_tokens is not None else self.default_max_tokens,
+            temperature=params.temperature if params.temperature is not None else self.default_temperature,
+            timeout=params.timeout if params.timeout is not None else DEFAULT_TIMEOUT,
+            system_prompt=params.system_prompt or self.default_system_prompt,
+        )
+
+    def query(self, prompt: str, params: LLMParams = None) -> str:
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def stream(self, prompt: str, params: LLMParams = None) -> Iterator[str]:
+        yield self.query(prompt, params)
+
+    async def aquery(self, prompt: str, params: LLMParams = None) -> str:
+        return await asyncio.to_thread(self.query, prompt, params)
+
+
+class ChatCompletionsProvider(LLMProvider):
+    """
+    使用 chat.completions 接口的 provider（OpenAI SDK 以及接口相同的 zhipuai SDK）。
+    client_kind 为客户端池中的客户端类型，同步和异步客户端都从进程级的客户端池获取。
+    """
+    client_kind = "openai"
+
+    def _client(self):
+        return client_pool.get_client(self.client_kind, self.api_key, self.base_url)
+
+    def _async_client(self):
+        return client_pool.get_async_client(self.client_kind, self.api_key, self.base_url)
+
+    def _request(self, prompt: str, params: LLMParams) -> Dict[str, Any]:
+        params = self.resolve(params)
+        messages: List[Dict[str, str]] = []
+        if params.system_prompt:
+            messages.append({"role": "system", "content": params.system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        request = {'model': params.model, 'messages': messages, 'timeout': params.timeout}
+        if params.max_tokens is not None:
+            request['max_tokens'] = params.max_tokens
+        if params.temperature is not None:
+            request['temperature'] = params.temperature
+        return request
+
+    def query(self, prompt: str, params: LLMParams = None) -> str:
+        response = self._client().chat.completions.create(**self._request(prompt, params))
+        return response.choices[0].message.content.strip()
+
+    def stream(self, prompt: str, params: LLMParams = None) -> Iterator[str]:
+        response = self._client().chat.completions.create(stream=True, **self._request(prompt, params))
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aquery(self, prompt: str, params: LLMParams = None) -> str:
+        response = await self._async_client().chat.completions.create(**self._request(prompt, params))
+        return response.choices[0].message.content.strip()
+
+
+class OpenAIProvider(ChatCompletionsProvider):
+    name = "openai"
+    display_name = "OpenAI"
+    default_model = "gpt-4"
+    default_max_tokens = 150
+    default_temperature = 0.7
+    api_key_env = "OPENAI_API_KEY"
+    base_url_env = "OPENAI_BASE_URL"
+
+
+class ZhipuProvider(ChatCompletionsProvider):
+    name = "zhipu"
+    display_name = "Zhipu"
+    default_model = "glm-4-plus"
+    default_system_prompt = "你是一个乐于解答各种问题的助手，你的任务是为用户提供专业、准确、有见地的建议。"
+    api_key_env = "ZHIPU_API_KEY"
+    base_url_env = "ZHIPU_BASE_URL"
+    client_kind = "zhipu"
+
+
+class QwenProvider(ChatCompletionsProvider):
+    # 通义千问：DashScope 的 OpenAI 兼容模式
+    name = "qwen"
+    display_name = "Qwen"
+    default_model = "qwen-plus"
+    api_key_env = "QWEN_API_KEY"
+    base_url_env = "QWEN_BASE_URL"
+    default_base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = None):
+        super().__init__(api_key=api_key or os.getenv("DASHSCOPE_API_KEY"), base_url=base_url, model=model)
+
+
+class OpenAICompatibleProvider(ChatCompletionsProvider):
+    # 本地或自建的 OpenAI 兼容服务（vLLM、Ollama、LM Studio 等），通常不需要 API key
+    name = "openai_compatible"
+    display_name = "OpenAI-compatible endpoint"
+    api_key_env = "LOCAL_LLM_API_KEY"
+    base_url_env = "LOCAL_LLM_BASE_URL"
+    default_base_url = "http://localhost:8000/v1"
+    requires_api_key = False
+
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = None):
+        super().__init__(api_key=api_key, base_url=base_url, model=model or os.getenv("LOCAL_LLM_MODEL"))
+        # OpenAI SDK 要求 api_key 非空
+        self.api_key = self.api_key or "EMPTY"
+
+
+# 名称 -> provider 类或已创建的实例
+_registry: Dict[str, Union[Type[LLMProvider], LLMProvider]] = {}
+# 类型名称 -> provider 类，供 llm_providers 的 type 查找；不会被同名的已配置实例覆盖
+_types: Dict[str, Type[LLMProvider]] = {}
+# (名称, base_url) -> 实例，同一配置的 Agent 共享
+_instances: Dict[Tuple[str, Optional[str]], LLMProvider] = {}
+_lock = threading.Lock()
+
+
+def register_provider(name: str, provider: Union[Type[LLMProvider], LLMProvider]):
+    """
+    注册 provider：传入类时按需创建（可按 base_url 创建多个实例），传入实例时所有 Agent 共享该实例。
+    """
+    with _lock:
+        _registry[name] = provider
+        if isinstance(provider, type):
+            _types[name] = provider
+        for key in [key for key in _instances if key[0] == name]:
+            del _instances[key]
+
+
+def configure_providers(config: Dict[str, Dict[str, Any]]):
+    """
+    DSL 的 llm_providers 部分：为某个类型的 provider 起一个名称并指定地址、key 和默认模型，例如
+    llm_providers: {local: {type: openai_compatible, base_url: "http://localhost:11434/v1", model: llama3}}
+    """
+    for name, conf in (config or {}).items():
+        conf = dict(conf)
+        kind = conf.pop('type', name)
+        with _lock:
+            provider_class = _types.get(kind)
+        if provider_class is None:
+            raise ValueError(f"Unknown LLM provider type: {kind}")
+        _check_options(name, provider_class, conf)
+        register_provider(name, provider_class(**conf))
+
+
+def _check_options(name: str, provider_class: Type[LLMProvider], conf: Dict[str, Any]):
+    # 配置中的字段必须是 provider 构造函数的参数，拼写错误时给出可读的错误而不是 TypeError
+    parameters = inspect.signature(provider_class).parameters
+    if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return
+    unknown = sorted(set(conf) - set(parameters))
+    if unknown:
+        raise ValueError(f"Unknown options for LLM provider {name}: {', '.join(unknown)} "
+                         f"(expected: {', '.join(parameters)})")
+
+
+def get_provider(name: str, base_url: str = None) -> LLMProvider:
+    with _lock:
+        provider = _registry.get(name)
+        if provider is None:
+            raise ValueError(f"Unsupported LLM provider: {name}")
+        if isinstance(provider, LLMProvider):
+            return provider
+        key = (name, base_url)
+        instance = _instances.get(key)
+        if instance is None:
+            instance = provider(base_url=base_url)
+            _instances[key] = instance
+        return instance
+
+
+def list_providers() -> List[str]:
+    with _lock:
+        return list(_registry)
+
+
+for _provider in (OpenAIProvider, ZhipuProvider, QwenProvider, OpenAICompatibleProvider):
+    register_provider(_provider.name, _provider)
@@ -0,0 +1,96 @@
+import asyncio
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+"""
+按 provider 的异步限流：信号量限制并发请求数，令牌桶限制每分钟请求数（RPM）和每分钟 token 数（TPM）。
+同一个事件循环中的所有 AsyncLLMQueryClient 共享同一组限流器。
+"""
+
+DEFAULT_LIMITS = {'concurrency': 16, 'rpm': 300, 'tpm': 60000}
+
+# 各 provider 的默认限制，可通过 configure_provider_limits 或 DSL 中的 llm_limits 修改
+provider_limits: Dict[str, Dict[str, int]] = {
+    'openai': {'concurrency': 16, 'rpm': 500, 'tpm': 60000},
+    'zhipu': {'concurrency': 16, 'rpm': 300, 'tpm': 60000},
+    'qwen': {'concurrency': 16, 'rpm': 300, 'tpm': 60000},
+}
+
+_CJK = re.compile(r"[\u3000-\u9fff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估计 token 数：中文字符按 1 个 token，其余按 4 个字符 1 个 token
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class TokenBucket:
+    """
+    令牌桶：以 rate_per_minute / 60 的速度补充令牌，容量为一分钟的配额。
+    """
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        # 超过容量的请求按容量扣减，避免永远等待
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class ProviderLimiter:
+    def __init__(self, concurrency: int, rpm: int, tpm: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    @asynccontextmanager
+    async def limit(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+        async with self.semaphore:
+            yield
+
+
+# asyncio 原语绑定事件循环，因此按 (provider, 事件循环) 保存限流器。
+# 键为事件循环对象本身（id 在循环销毁后可能被复用），已关闭的事件循环的限流器在创建新限流器时清理
+_limiters: Dict[Tuple[str, asyncio.AbstractEventLoop], ProviderLimiter] = {}
+
+def configure_provider_limits(provider: str, concurrency: int = None, rpm: int = None, tpm: int = None):
+    limits = provider_limits.setdefault(provider, dict(DEFAULT_LIMITS))
+    previous = dict(limits)
+    for key, value in (('concurrency', concurrency), ('rpm', rpm), ('tpm', tpm)):
+        if value is not None:
+            limits[key] = value
+    if limits == previous:
+        return
+    # 丢弃已创建的限流器，下次使用时按新配置重建
+    for key in [k for k in _limiters if k[0] == provider]:
+        del _limiters[key]
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    key = (provider, asyncio.get_running_loop())
+    limiter = _limiters.get(key)
+    if limiter is None:
+        for closed in [k for k in _limiters if k[1].is_closed()]:
+            del _limiters[closed]
+        limits = provider_limits.get(provider, DEFAULT_LIMITS)
+        limiter = ProviderLimiter(limits['concurrency'], limits['rpm'], limits['tpm'])
+        _limiters[key] = limiter
+    return limiter
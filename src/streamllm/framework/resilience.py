@@ -0,0 +1,271 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+"""
+LLM 调用的容错：单次请求超时、带抖动的指数退避重试，以及按 provider 的熔断器。
+provider 失败时抛出 LLMQueryError（不再把错误信息当作回答返回），
+熔断器打开期间直接抛出 CircuitOpenError，避免所有 worker 都卡在故障的 provider 上。
+"""
+
+T = TypeVar("T")
+
+DEFAULT_TIMEOUT = 60.0   # 单次请求的超时（秒）
+
+
+class LLMQueryError(Exception):
+    """
+    LLM 查询失败。retryable 表示该错误是否值得重试（超时、连接错误、429、5xx）。
+    """
+    def __init__(self, provider: str, message: str, retryable: bool = False, cause: BaseException = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.retryable = retryable
+        self.cause = cause
+
+
+class LLMTimeoutError(LLMQueryError):
+    pass
+
+
+class CircuitOpenError(LLMQueryError):
+    pass
+
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def is_timeout(error: BaseException) -> bool:
+    return isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__
+
+def is_retryable(error: BaseException) -> bool:
+    # 按状态码和异常类型判断，兼容 openai / zhipuai / httpx 的异常而不依赖具体的 SDK
+    if isinstance(error, LLMQueryError):
+        return error.retryable
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS or status >= 500
+    name = type(error).__name__
+    return is_timeout(error) or isinstance(error, ConnectionError) or "Connection" in name or "Transport" in name
+
+def wrap_error(provider: str, error: BaseException) -> LLMQueryError:
+    if isinstance(error, LLMQueryError):
+        return error
+    error_class = LLMTimeoutError if is_timeout(error) else LLMQueryError
+    return error_class(provider, f"{type(error).__name__}: {error}", retryable=is_retryable(error), cause=error)
+
+
+class RetryPolicy:
+    """
+    指数退避 + 全抖动：第 n 次重试前等待 uniform(0, min(max_delay, base_delay * 2^n)) 秒。
+    """
+    def __init__(self, retries: int = 2, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内的请求直接失败；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        # 放行时返回本次请求是否为半开状态的试探请求
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        raise CircuitOpenError(self.name, "circuit breaker is open, failing fast")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # 请求被取消或调用方放弃（未得出结果）时释放半开状态的试探名额，不计为成功或失败
+        with self._lock:
+            self._trial_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class ProviderPolicy:
+    """
+    一个 provider 的容错配置：timeout 为单次请求的超时，deadline 为包含重试在内的总时限（可选）。
+    """
+    def __init__(self, provider: str, timeout: float = DEFAULT_TIMEOUT, deadline: float = None, retries: int = 2,
+                 base_delay: float = 0.5, max_delay: float = 8.0, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.provider = provider
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retry = RetryPolicy(retries, base_delay, max_delay)
+        self.breaker = CircuitBreaker(provider, failure_threshold, reset_timeout)
+
+    def _next_delay(self, attempt: int, error: LLMQueryError, started: float) -> Optional[float]:
+        # 返回下一次重试前的等待时间，不再重试时返回 None
+        if not error.retryable or attempt >= self.retry.retries:
+            return None
+        delay = self.retry.delay(attempt)
+        if self.deadline is not None and time.monotonic() - started + delay >= self.deadline:
+            return None
+        return delay
+
+    def call(self, fn: Callable[[], T]) -> T:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = fn()
+            except Exception as e:
+                error = wrap_error(self.provider, e)
+                self._record(error, trial)
+                delay = self._next_delay(attempt, error, started)
+                if delay is None:
+                    raise error from e
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                result = await asyncio.wait_for(fn(), self.timeout) if self.timeout else await fn()
+            except asyncio.CancelledError:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            except Exception as e:
+                error = wrap_error(self.provider, e)
+                self._record(error, trial)
+                delay = self._next_delay(attempt, error, started)
+                if delay is None:
+                    raise error from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stream(self, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        # 流式请求只在收到第一个片段之前重试，之后的错误直接抛出
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            try:
+                chunks = fn()
+                first = next(chunks, None)
+            except Exception as e:
+                error = wrap_error(self.provider, e)
+                self._record(error, trial)
+                delay = self._next_delay(attempt, error, started)
+                if delay is None:
+                    raise error from e
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            break
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        except Exception as e:
+            error = wrap_error(self.provider, e)
+            self._record(error, trial)
+            raise error from e
+        except BaseException:
+            # 调用方提前关闭生成器（GeneratorExit）等情况下释放试探名额
+            if trial:
+                self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+
+    def _record(self, error: LLMQueryError, trial: bool):
+        # 只有 provider 侧的故障（可重试的错误）计入熔断；请求本身的错误（如 400）不能说明 provider 是否正常，
+        # 不改变熔断器的状态和失败计数，只释放本次占用的试探名额
+        if error.retryable:
+            self.breaker.record_failure()
+        elif trial:
+            self.breaker.release_trial()
+
+
+_policies: Dict[str, ProviderPolicy] = {}
+_policies_lock = threading.Lock()
+
+def get_policy(provider: str) -> ProviderPolicy:
+    with _policies_lock:
+        policy = _policies.get(provider)
+        if policy is None:
+            policy = ProviderPolicy(provider)
+            _policies[provider] = policy
+        return policy
+
+# provider -> 创建当前策略时使用的配置
+_policy_configs: Dict[str, Dict[str, Any]] = {}
+
+def configure_resilience(provider: str, **kwargs):
+    # DSL 的 llm_resilience 部分：provider -> {timeout, deadline, retries, base_delay, max_delay, failure_threshold, reset_timeout}
+    # 配置未变化时保留已有的策略，熔断器的状态（如仍处于打开状态）不会被重置
+    with _policies_lock:
+        if provider in _policies and _policy_configs.get(provider) == kwargs:
+            return
+        _policies[provider] = ProviderPolicy(provider, **kwargs)
+        _policy_configs[provider] = dict(kwargs)
+
+def get_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _policies_lock:
+        return {provider: policy.breaker.get_stats() for provider, policy in _policies.items()}
@@ -0,0 +1,234 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterator, List, Optional, Union
+from .llm import LLMQueryClient
+from .resilience import LLMQueryError, CircuitBreaker, get_policy, wrap_error
+from .metrics import LLM_HEDGES, LLM_FALLBACKS, LLM_ROUTE_WINS
+from .tracing import tracer
+
+"""
+LLMQueryClient 之上的多 provider 路由：
+- 备选：当前路由失败（重试后仍失败或熔断）时立即改用下一个路由；
+- 对冲（hedging）：当前路由在 hedge_after 时间内没有回答时，同时向下一个路由发出请求，
+  保留最先返回的回答，取消其余请求；
+- strategy 为 latency 时按观测到的延迟和错误率给路由排序，否则按配置顺序。
+
+同步的 provider 调用无法在执行中中断：被取消的请求如果尚未开始就不再发出，已发出的在后台完成后丢弃结果。
+"""
+
+logger = logging.getLogger(__name__)
+
+MIN_SAMPLES = 20       # 按分位数计算对冲时间所需的最少样本数
+ERROR_PENALTY = 4.0    # latency 策略中错误率对得分的放大系数
+
+# 对冲请求和候选路由在这个线程池中执行
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-route")
+
+
+class RouteStats:
+    """
+    路由最近的延迟窗口和错误率（指数滑动平均），同一 provider / model 的所有 Agent 共享。
+    """
+    def __init__(self, window: int = 256, alpha: float = 0.1):
+        self.latencies = deque(maxlen=window)
+        self.alpha = alpha
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: bool):
+        with self._lock:
+            if not error:
+                self.latencies.append(latency)
+            self.error_rate += self.alpha * ((1.0 if error else 0.0) - self.error_rate)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def score(self) -> float:
+        # 越小越好；样本不足的路由得分为 0，会被优先尝试以积累样本
+        median = self.quantile(0.5)
+        if median is None:
+            return 0.0
+        return median * (1 + ERROR_PENALTY * self.error_rate)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'samples': len(self.latencies), 'p50': self.quantile(0.5), 'p95': self.quantile(0.95),
+                'error_rate': round(self.error_rate, 4)}
+
+
+_stats: Dict[str, RouteStats] = {}
+_stats_lock = threading.Lock()
+
+def get_route_stats(name: str) -> RouteStats:
+    with _stats_lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = RouteStats()
+            _stats[name] = stats
+        return stats
+
+def list_route_stats() -> Dict[str, Dict[str, Any]]:
+    with _stats_lock:
+        stats = dict(_stats)
+    return {name: route.get_stats() for name, route in stats.items()}
+
+
+class Route:
+    def __init__(self, client: LLMQueryClient):
+        self.client = client
+        self.name = f"{client.provider}/{client.model}"
+        self.stats = get_route_stats(self.name)
+
+    def query(self, prompt: str, hedged: bool, max_tokens: int = None) -> str:
+        start = time.perf_counter()
+        with tracer.span(f"route {self.name}", hedged=hedged):
+            try:
+                response = self.client.query_llm(prompt, max_tokens=max_tokens)
+            except Exception:
+                self.stats.record(time.perf_counter() - start, error=True)
+                raise
+        self.stats.record(time.perf_counter() - start, error=False)
+        return response
+
+    def available(self) -> bool:
+        return get_policy(self.client.provider).breaker.state != CircuitBreaker.OPEN
+
+
+class LLMRouter:
+    """
+    与 LLMQueryClient 接口相同（query_llm / stream_llm，provider / model / system_prompt / max_tokens 为第一个路由的值），
+    可以直接替换 Agent 的 client。
+    hedge_after 为秒数或 "p95" 这样的分位数（按当前路由观测到的延迟计算，样本不足时使用 hedge_default），
+    为 None 时不对冲，只在失败时改用下一个路由。
+    """
+    def __init__(self, clients: List[LLMQueryClient], hedge_after: Union[float, str, None] = None,
+                 hedge_default: float = None, strategy: str = "fixed"):
+        if not clients:
+            raise ValueError("LLMRouter needs at least one route")
+        if strategy not in ("fixed", "latency"):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.routes = [Route(client) for client in clients]
+        self.hedge_quantile = _parse_quantile(hedge_after) if isinstance(hedge_after, str) else None
+        self.hedge_after = None if isinstance(hedge_after, str) else hedge_after
+        self.hedge_default = hedge_default
+        self.strategy = strategy
+        primary = self.routes[0].client
+        self.provider = primary.provider
+        self.model = primary.model
+        self.system_prompt = primary.system_prompt
+        self.max_tokens = primary.max_tokens
+
+    def ordered_routes(self) -> List[Route]:
+        # 熔断中的路由排在最后；latency 策略下其余路由按得分排序
+        if self.strategy == "latency":
+            routes = sorted(self.routes, key=lambda route: route.stats.score())
+        else:
+            routes = list(self.routes)
+        return sorted(routes, key=lambda route: not route.available())
+
+    def _hedge_delay(self, route: Route) -> Optional[float]:
+        if self.hedge_quantile is not None:
+            delay = route.stats.quantile(self.hedge_quantile)
+            return delay if delay is not None else self.hedge_default
+        return self.hedge_after
+
+    def query_llm(self, prompt: str, max_tokens: int = None) -> str:
+        routes = self.ordered_routes()
+        pending: Dict[Future, Route] = {}
+        last_error: Optional[LLMQueryError] = None
+        next_index = 0
+
+        def launch(hedged: bool) -> Route:
+            nonlocal next_index
+            route = routes[next_index]
+            next_index += 1
+            # 在调用方的上下文中执行，追踪 span 挂在当前链路上
+            context = contextvars.copy_context()
+            pending[_pool.submit(context.run, route.query, prompt, hedged, max_tokens)] = route
+            return route
+
+        current = launch(hedged=False)
+        try:
+            while pending:
+                delay = self._hedge_delay(current) if next_index < len(routes) else None
+                done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    # 当前路由超过对冲时间仍未回答，同时请求下一个路由
+                    LLM_HEDGES.labels(current.name).inc()
+                    logger.debug("Route %s is slow, hedging to %s", current.name, routes[next_index].name)
+                    current = launch(hedged=True)
+                    continue
+                for future in done:
+                    route = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        last_error = wrap_error(route.client.provider, e)
+                        logger.warning("Route %s failed: %s", route.name, last_error)
+                        continue
+                    LLM_ROUTE_WINS.labels(route.name).inc()
+                    return response
+                if not pending and next_index < len(routes):
+                    # 所有已发出的请求都失败，改用下一个路由
+                    LLM_FALLBACKS.labels(routes[next_index - 1].name).inc()
+                    current = launch(hedged=False)
+            raise last_error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def stream_llm(self, prompt: str) -> Iterator[str]:
+        # 流式查询不对冲，只在收到第一个片段之前失败时改用下一个路由
+        routes = self.ordered_routes()
+        for index, route in enumerate(routes):
+            start = time.perf_counter()
+            try:
+                chunks = route.client.stream_llm(prompt)
+                first = next(chunks, None)
+            except LLMQueryError as e:
+                route.stats.record(time.perf_counter() - start, error=True)
+                if index == len(routes) - 1:
+                    raise
+                logger.warning("Route %s failed: %s", route.name, e)
+                LLM_FALLBACKS.labels(route.name).inc()
+                continue
+            LLM_ROUTE_WINS.labels(route.name).inc()
+            if first is not None:
+                yield first
+            yield from chunks
+            route.stats.record(time.perf_counter() - start, error=False)
+            return
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {route.name: route.stats.get_stats() for route in self.routes}
+
+
+def _parse_quantile(value: str) -> float:
+    # "p95" -> 0.95，"p99.9" -> 0.999
+    if not value.startswith("p"):
+        raise ValueError(f"Invalid hedge_after: {value}")
+    return float(value[1:]) / 100
+
+
+def build_router(llm_type: str, routing: Dict[str, Any], **params) -> LLMRouter:
+    """
+    由 Agent 的 DSL 配置创建路由，例如
+    llm_type: openai
+    llm_routing: {fallbacks: [{llm_type: qwen, model: qwen-turbo}, {model: gpt-4o-mini}], hedge_after: p95, hedge_default: 5}
+    备选路由未设置的字段（llm_type、model、max_tokens、temperature、timeout）继承 Agent 自身的配置。
+    """
+    clients = [LLMQueryClient(provider=llm_type, **params)]
+    for fallback in routing.get('fallbacks', []):
+        fallback = dict(fallback)
+        provider = fallback.pop('llm_type', llm_type)
+        clients.append(LLMQueryClient(provider=provider, **{**params, **fallback}))
+    return LLMRouter(clients, hedge_after=routing.get('hedge_after'), hedge_default=routing.get('hedge_default'),
+                     strategy=routing.get('strategy', 'fixed'))
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from typing import Any, Callable, Awaitable, Dict, Tuple
+
+"""
+single-flight 请求合并：同一时刻相同键的多个调用只执行一次，所有调用方共享其结果（或异常）。
+与缓存不同，调用完成后结果不会保留。
+"""
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0   # 实际执行的次数
+        self.shared = 0     # 复用其他调用结果的次数
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        执行 fn 或等待正在执行的相同调用，返回 (结果, 是否为共享结果)。
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result, not leader
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的 asyncio 版本，按事件循环分别合并（键为事件循环对象本身，而不是可能被复用的 id）。
+    """
+    def __init__(self):
+        self._calls: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        future = self._calls.get(call_key)
+        if future is not None:
+            self.shared += 1
+            # shield 避免某个等待者被取消时连带取消共享的调用
+            return await asyncio.shield(future), True
+
+        future = loop.create_future()
+        self._calls[call_key] = future
+        self.executed += 1
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._calls[call_key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {'executed': self.executed, 'shared': self.shared, 'in_flight': len(self._calls)}
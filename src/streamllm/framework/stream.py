@@ -1,76 +1,420 @@
-from typing import Callable, Any, List
+import logging
+import asyncio
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Any, FrozenSet, Iterable, List, Dict, Optional, Set, Tuple, Union
 from flask_socketio import SocketIO
+from .dispatcher import AsyncDispatcher, HandlerWorker, DEFAULT_CAPACITY, BACKPRESSURE_POLICIES
+from .topology import RouteStep, check_edge, recompile
+from .payload import describe, payload_kind, PAYLOAD_KINDS
+from .stream_log import LogRecord, open_stream_log
+from .filter_engine import FilterEngine, FilterSpec
+from .telemetry import get_telemetry
+from .tracing import tracer
+from .metrics import STREAM_ITEMS_IN, STREAM_DROPS, STREAM_QUEUE_DEPTH, AGENT_IN_FLIGHT, handler_name, observe_handler
+
+logger = logging.getLogger(__name__)
+
+# Stream 的分发模式
+# async: emit 只负责把数据放入每个 Handler 的 inbox，由后台 worker 并发处理（默认）
+# inline: 在调用 emit 的线程中依次调用每个 Handler（原有的同步行为）
+STREAM_MODES = ("async", "inline")
+
+class StreamFullError(Exception):
+    """
+    policy 为 reject 的 Stream 在 inbox 已满时抛出。
+    """
+    pass
 
 class Stream:
     """
     StreamManager 负责管理所有的 Stream 实例，包括创建、查找和删除 Stream。
     它确保不同的 Stream 能够被有效地组织和访问。
     """
-    def __init__(self, name: str, socketio: SocketIO):
+    def __init__(self, name: str, socketio: SocketIO, mode: str = "async", capacity: int = DEFAULT_CAPACITY, policy: str = "block",
+                 persistent: Union[bool, Dict[str, Any]] = None):
+        if mode not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode: {mode}")
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
         self.name = name
         self.handlers: List[Callable[[Any], None]] = []
         self.connections: List['Stream'] = []
+        self.upstreams: List['Stream'] = []
+        # 预编译的下游路由（拓扑序、去重），连接变化时增量重建
+        self.route: Tuple[RouteStep, ...] = ()
         self.socketio = socketio
+        self.telemetry = get_telemetry(socketio)
+        self.mode = mode
+        self.capacity = capacity
+        self.policy = policy
+        self.stats = {'emitted': 0, 'dropped': 0, 'rejected': 0, 'filtered': 0}
+        self._stats_lock = threading.Lock()
+        self.workers: Dict[Callable[[Any], None], HandlerWorker] = {}
+        self.dispatcher = AsyncDispatcher.get_instance() if mode == "async" else None
+        # persistent 时每条数据先写入持久化日志，订阅者按 offset 提交进度，重启或新订阅时可以从日志回放
+        self.log = open_stream_log(name, persistent) if persistent else None
+        self._log_lock = threading.Lock()
+        self._catching_up: Set[Callable[[Any], None]] = set()   # 正在回放历史数据的 Handler，暂不接收新数据
+        # Handler 声明接受的数据类型和过滤条件：handler -> (类型集合或 None, predicate 或 None)
+        self.filters: Dict[Callable[[Any], None], Tuple[Optional[FrozenSet[str]], Optional[Callable[[Any], bool]]]] = {}
+        # 按数据类型预先计算的 Handler 列表，emit 时直接查表；没有 Handler 声明类型时为 None
+        self._by_kind: Optional[Dict[str, List[Callable[[Any], None]]]] = None
+        self._has_predicates = False
+        # 以 FilterSpec 声明的过滤条件编译到同一个引擎中，每条数据只匹配一次
+        self.filter_engine = FilterEngine()
+        # 持久化 Stream 中各订阅者已开始处理、尚未确认的 offset（按分发顺序）-> 处理结果（None 为处理中）。
+        # Handler 返回 Future 时（如微批处理），数据在 Future 结束后才确认；offset 只提交到最早的未确认数据之前
+        self._unacked: Dict[str, "OrderedDict[int, Optional[bool]]"] = {}
+        self._ack_lock = threading.Lock()
+        # 排队深度在读取指标时计算；使用弱引用，不延长 Stream 的生命周期
+        ref = weakref.ref(self)
+        STREAM_QUEUE_DEPTH.labels(name).set_function(lambda: ref() and ref()._queue_depth())
 
-    def register_handler(self, handler: Callable[[Any], None]):
+    def register_handler(self, handler: Callable[[Any], None], replay_from: Union[str, int] = None,
+                         kinds: Iterable[str] = None, predicate: Callable[[Any], bool] = None):
+        """
+        kinds 为 Handler 接受的数据类型（见 payload.PAYLOAD_KINDS），predicate 为额外的过滤条件
+        （函数或 FilterSpec，后者由 Stream 的过滤引擎统一匹配），不符合的数据不会被分发给该 Handler。
+        persistent 的 Stream 中，replay_from 为 earliest 或 offset 时先回放历史数据；
+        未指定时从该订阅者上次提交的 offset 继续（例如进程重启后），新订阅者只接收新数据。
+        """
+        if kinds is not None:
+            kinds = frozenset(kinds)
+            unknown = kinds - set(PAYLOAD_KINDS)
+            if unknown:
+                raise ValueError(f"Unknown payload kind(s): {', '.join(sorted(unknown))}")
+        start = self._replay_start(handler, replay_from) if self.log else None
+        if kinds is not None or predicate is not None:
+            self.filters[handler] = (kinds, predicate)
+        if isinstance(predicate, FilterSpec):
+            self.filter_engine.add(handler, predicate)
         self.handlers.append(handler)
-        print(f"Handler {handler.__name__} registered to Stream {self.name}")
+        self._reindex()
+        if self.dispatcher and handler not in self.workers:
+            self.workers[handler] = self.dispatcher.create_worker(
+                f"{self.name}.{handler_name(handler)}", handler, self.capacity, invoke=partial(self._invoke, handler))
+        logger.info("Handler %s registered to Stream %s", handler_name(handler), self.name)
+        if start is not None:
+            self._replay(handler, start)
+
+    def _reindex(self):
+        # Handler 或其声明变化时重建类型索引（整体替换，emit 中读取的总是完整的索引）
+        if any(kinds is not None for kinds, _ in self.filters.values()):
+            self._by_kind = {kind: [handler for handler in self.handlers
+                                    if self.filters.get(handler, (None, None))[0] is None
+                                    or kind in self.filters[handler][0]]
+                             for kind in PAYLOAD_KINDS}
+        else:
+            self._by_kind = None
+        self._has_predicates = any(predicate is not None for _, predicate in self.filters.values())
+
+    def _accepts(self, handler: Callable[[Any], None], data: Any, matched: Set[Callable[[Any], None]] = None) -> bool:
+        # matched 为过滤引擎对这条数据的匹配结果（已计算时传入）
+        kinds, predicate = self.filters.get(handler, (None, None))
+        if kinds is not None and payload_kind(data) not in kinds:
+            return False
+        if predicate is None:
+            return True
+        if matched is not None and handler in self.filter_engine:
+            return handler in matched
+        try:
+            return bool(predicate(data))
+        except Exception as e:
+            logger.warning("Stream %s: predicate of %s failed: %s", self.name, handler_name(handler), e)
+            return False
+
+    def _targets(self, data: Any) -> List[Callable[[Any], None]]:
+        # 按数据类型查索引，再执行各 Handler 的过滤条件
+        if self._by_kind is not None:
+            kind = payload_kind(data)
+            handlers = self._by_kind[kind]
+            if logger.isEnabledFor(logging.DEBUG) and len(handlers) < len(self.handlers):
+                logger.debug("Stream %s: skipping %s for %s data", self.name,
+                             [handler_name(handler) for handler in self.handlers if handler not in handlers], kind)
+        else:
+            handlers = self.handlers
+        if self._has_predicates:
+            matched = self.filter_engine.match(data) if len(self.filter_engine) else None
+            handlers = [handler for handler in handlers if self._passes(handler, data, matched)]
+        return handlers
+
+    def _passes(self, handler: Callable[[Any], None], data: Any, matched: Optional[Set[Callable[[Any], None]]]) -> bool:
+        # 类型已由索引筛选，这里只检查过滤条件
+        predicate = self.filters.get(handler, (None, None))[1]
+        if predicate is None:
+            return True
+        if matched is not None and handler in self.filter_engine:
+            return handler in matched
+        try:
+            return bool(predicate(data))
+        except Exception as e:
+            logger.warning("Stream %s: predicate of %s failed: %s", self.name, handler_name(handler), e)
+            return False
+
+    def _replay_start(self, handler: Callable[[Any], None], replay_from: Union[str, int, None]):
+        # 返回开始回放的 offset，不需要回放时返回 None
+        subscriber = handler_name(handler)
+        committed = self.log.committed_offset(subscriber)
+        if replay_from == "earliest":
+            start = self.log.start_offset
+        elif isinstance(replay_from, int):
+            start = replay_from
+        elif replay_from in (None, "committed") and committed is not None:
+            start = committed
+        else:
+            # 新订阅者从当前位置开始，并记下该位置，重启后不会漏掉期间写入的数据
+            self.log.commit(subscriber, self.log.end_offset)
+            return None
+        if start < self.log.start_offset:
+            logger.warning("Stream %s: offset %d of %s is past retention, replaying from %d", self.name, start,
+                           subscriber, self.log.start_offset)
+            start = self.log.start_offset
+        return start if start < self.log.end_offset else None
+
+    def _replay(self, handler: Callable[[Any], None], start: int):
+        logger.info("Stream %s replaying offsets %d-%d to %s", self.name, start, self.log.end_offset, handler_name(handler))
+        if not self.dispatcher:
+            for record in self.log.read(start, self.log.end_offset - start):
+                if self._accepts(handler, record.data):
+                    self._invoke(handler, record, time.perf_counter())
+            return
+        with self._log_lock:
+            self._catching_up.add(handler)
+        threading.Thread(target=self._catch_up, args=(handler, start), name=f"replay-{self.name}", daemon=True).start()
+
+    def _catch_up(self, handler: Callable[[Any], None], offset: int):
+        # 按顺序把日志中的数据交给该 Handler，追上日志末尾后再切换为接收新数据
+        while handler in self.workers:
+            records = self.log.read(offset)
+            if not records:
+                with self._log_lock:
+                    if offset >= self.log.end_offset:
+                        self._catching_up.discard(handler)
+                        return
+                continue
+            # 回放按批读取，过滤引擎对整批数据一次匹配
+            batch_matched = self.filter_engine.match_batch([record.data for record in records]) \
+                if handler in self.filter_engine else [None] * len(records)
+            for record, matched in zip(records, batch_matched):
+                worker = self.workers.get(handler)
+                if worker is None:
+                    break
+                if self._accepts(handler, record.data, matched):
+                    self.dispatcher.submit({handler: worker}, record)
+            offset = records[-1].offset + 1
+        with self._log_lock:
+            self._catching_up.discard(handler)
 
     def unregister_handler(self, handler: Callable[[Any], None]):
         if handler in self.handlers:
             self.handlers.remove(handler)
-            print(f"Handler {handler.__name__} unregistered from Stream {self.name}")
+            if handler not in self.handlers:
+                self.filters.pop(handler, None)
+                self.filter_engine.remove(handler)
+                with self._ack_lock:
+                    self._unacked.pop(handler_name(handler), None)
+                if handler in self.workers:
+                    self.dispatcher.stop_worker(self.workers.pop(handler))
+            self._reindex()
+            logger.info("Handler %s unregistered from Stream %s", handler_name(handler), self.name)
         else:
-            print(f"Handler {handler.__name__} not found in stream {self.name}")
-
-    def emit(self, data: Any):
-        # 优化输出
-        if isinstance(data, bytes):
-            print(f"Stream {self.name} emitting data: <bytes>")
-        elif isinstance(data, str):
-            print(f"Stream {self.name} emitting data: {data}")
+            logger.warning("Handler %s not found in stream %s", handler_name(handler), self.name)
+
+    def emit(self, data: Any, wait: bool = True):
+        # wait 为 False 时 async 模式的入队不阻塞调用方（Agent 把结果发送到输出 Stream 时使用），
+        # 背压在事件循环中等待，被拒绝的数据只记录而不抛出 StreamFullError
+        # 数据摘要只计算一次，各跳的前端事件共用（二进制数据只发送元数据）
+        # 摘要只在遥测或 DEBUG 日志需要时计算
+        summary = describe(data) if self.telemetry or logger.isEnabledFor(logging.DEBUG) else None
+        # 追踪：本 Stream 的 span 是这条数据的根（在 Handler 中再次 emit 时则是该 Handler span 的子 span），
+        # 每个下游 Stream 的 span 挂在路由中第一个上游的 span 下
+        with tracer.span(f"stream {self.name}", stream=self.name) as root:
+            self._deliver(data, summary, wait)
+            hops = {id(self): root}
+
+            # 按预编译的路由把数据传递到所有下游流 (和 forward功能有重叠)
+            # 路由已按拓扑序展开且每个下游只出现一次，这里是扁平循环，没有递归
+            for stream, parents in self.route:
+                for parent in parents:
+                    logger.debug("Stream %s forwarding data to stream %s", parent.name, stream.name)
+
+                    if self.telemetry:
+                        self.telemetry.record_flow(parent.name, summary, target=stream.name)
+
+                try:
+                    with tracer.span(f"stream {stream.name}", parent=hops.get(id(parents[0])), stream=stream.name,
+                                     upstreams=[parent.name for parent in parents]) as hop:
+                        hops[id(stream)] = hop
+                        stream._deliver(data, summary, wait)
+                except StreamFullError as e:
+                    logger.warning("Stream %s failed to forward data: %s", self.name, e)
+
+    def _deliver(self, data: Any, summary: Any, wait: bool = True):
+        # 把数据交给本 Stream 的 Handlers（按引用传递，不复制）
+        logger.debug("Stream %s emitting data: %s", self.name, summary)
+
+        # 没有 Handler 声明类型或过滤条件时所有 Handler 都接收，不计算数据类型
+        handlers = self._targets(data) if self.filters else self.handlers
+        filtered = len(self.handlers) - len(handlers)
+        if filtered:
+            self._count('filtered', filtered)
+        workers = self.workers if not filtered else {handler: self.workers[handler] for handler in handlers if handler in self.workers}
+        if self.log:
+            # 写入日志与选择接收者在同一把锁中完成，正在回放的 Handler 会从日志中读到这条数据
+            with self._log_lock:
+                data = self.log.append(data)
+                workers = {handler: worker for handler, worker in workers.items() if handler not in self._catching_up}
+            self.log.wait_durable(data.offset)
+
+        if self.dispatcher and not wait:
+            self.dispatcher.submit_nowait(workers, data, self.policy, on_done=self._on_submitted)
+        elif self.dispatcher:
+            try:
+                dropped = self.dispatcher.submit(workers, data, self.policy)
+            except asyncio.QueueFull:
+                self._rejected()
+                raise StreamFullError(f"Stream {self.name} is full (capacity {self.capacity}), data rejected")
+            self._dropped(dropped)
         else:
-            print(f"Stream {self.name} emitting data: <unknown>")
+            enqueued_at = time.perf_counter()
+            for handler in handlers:
+                self._invoke(handler, data, enqueued_at)
+        self._count('emitted')
+        STREAM_ITEMS_IN.labels(self.name).inc()
+
+        # 向前端发送数据流事件（由遥测聚合器合并后批量推送）
+        if self.telemetry:
+            self.telemetry.record_flow(self.name, summary)
+
+    def _on_submitted(self, future):
+        # submit_nowait 完成入队时在事件循环线程中调用
+        try:
+            self._dropped(future.result())
+        except asyncio.QueueFull:
+            self._rejected()
+            logger.warning("Stream %s is full (capacity %d), data rejected", self.name, self.capacity)
+
+    def _rejected(self):
+        self._count('rejected')
+        STREAM_DROPS.labels(self.name, self.policy).inc()
 
-        # 向前端发送数据流事件
-        if self.socketio:
-            self.socketio.emit('data_flow', {
-                'stream': self.name,
-                'data': str(data),
-                'action': 'emit'
-            })
+    def _dropped(self, dropped: int):
+        if dropped:
+            self._count('dropped', dropped)
+            STREAM_DROPS.labels(self.name, self.policy).inc(dropped)
+            logger.debug("Stream %s dropped %d item(s) (%s)", self.name, dropped, self.policy)
 
-        for handler in self.handlers:
-            handler(data)
+    def _invoke(self, handler: Callable[[Any], None], data: Any, enqueued_at: float):
+        # 调用 Handler 并记录处理中数量、耗时和错误（异常继续向上抛出）
+        # 持久化 Stream 中 data 为 LogRecord，处理成功后提交该订阅者的 offset；
+        # Handler 返回 Future 时（微批）在 Future 完成后才提交
+        agent = handler_name(handler)
+        record = data if isinstance(data, LogRecord) else None
+        if record:
+            data = record.data
+            with self._ack_lock:
+                self._unacked.setdefault(agent, OrderedDict())[record.offset] = None
+        in_flight = AGENT_IN_FLIGHT.labels(agent)
+        in_flight.inc()
+        started_at = time.perf_counter()
+        error = False
+        result = None
+        try:
+            with tracer.span(f"handle {agent}", agent=agent, stream=self.name, queue_wait=started_at - enqueued_at):
+                result = handler(data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            in_flight.dec()
+            observe_handler(self.name, agent, enqueued_at, started_at, error)
+            if record:
+                if isinstance(result, Future):
+                    result.add_done_callback(lambda future: self._ack(
+                        agent, record.offset, not future.cancelled() and future.exception() is None))
+                else:
+                    self._ack(agent, record.offset, not error)
 
-        # 将数据传递到连接的流 (和 forward功能有重叠)
-        for stream in self.connections:
-            print(f"Stream {self.name} forwarding data to stream {stream.name}")
+    def _ack(self, agent: str, offset: int, ok: bool):
+        # 从最早的数据开始，连续处理完的部分中最后一条成功的数据之后的位置即可提交。
+        # 失败的数据与之前一样不单独提交，但不会阻止之后成功的数据提交
+        with self._ack_lock:
+            unacked = self._unacked.get(agent)
+            if unacked is None or offset not in unacked:
+                return
+            unacked[offset] = ok
+            commit = None
+            while unacked:
+                first, done = next(iter(unacked.items()))
+                if done is None:
+                    break
+                unacked.popitem(last=False)
+                if done:
+                    commit = first + 1
+        if commit is not None:
+            self.log.commit(agent, commit)
 
-            if self.socketio:
-                self.socketio.emit('data_flow', {
-                    'stream': self.name,
-                    'target_stream': stream.name,
-                    'data': str(data),
-                    'action': 'forward'
-                })
+    def _queue_depth(self) -> int:
+        return sum(worker.qsize() for worker in list(self.workers.values()))
 
-            stream.emit(data)
+    def _count(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def get_stats(self) -> Dict[str, int]:
+        # 返回计数器以及各 Handler inbox 当前的排队深度
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['queued'] = {handler_name(handler): worker.qsize() for handler, worker in self.workers.items()}
+        if self.log:
+            stats['log'] = self.log.get_stats()
+        if len(self.filter_engine):
+            stats['filter_engine'] = self.filter_engine.get_stats()
+        return stats
+
+    def close(self):
+        # 删除 Stream 时调用：停止各 Handler 的 worker（丢弃尚未处理的数据），刷盘并关闭持久化日志
+        self.clear_handlers()
+        if self.log:
+            self.log.close()
 
     def clear_handlers(self):
         self.handlers.clear()
-        print(f"All handlers cleared from stream {self.name}")
+        self.filters.clear()
+        self.filter_engine = FilterEngine()
+        self._reindex()
+        for worker in self.workers.values():
+            self.dispatcher.stop_worker(worker)
+        self.workers.clear()
+        with self._ack_lock:
+            self._unacked.clear()
+        logger.info("All handlers cleared from stream %s", self.name)
 
     """
     Stream类增加了连接其他流的功能，使得一个流可以将数据传递到另一个流。
     新增的方法包括connect_stream和disconnect_stream，用于管理流之间的连接。
     """
     def connect_stream(self, stream: 'Stream'):
+        # 会形成环的连接直接拒绝（抛出 CycleError）
         if stream not in self.connections:
+            check_edge(self, stream)
             self.connections.append(stream)
-            print(f"Stream {self.name} connected to stream {stream.name}")
+            stream.upstreams.append(self)
+            recompile(self)
+            logger.info("Stream %s connected to stream %s", self.name, stream.name)
 
     def disconnect_stream(self, stream: 'Stream'):
         if stream in self.connections:
             self.connections.remove(stream)
-            print(f"Stream {self.name} disconnected from stream {stream.name}")
\ No newline at end of file
+            stream.upstreams.remove(self)
+            recompile(self)
+            logger.info("Stream %s disconnected from stream %s", self.name, stream.name)
+
+    def get_route(self) -> List[str]:
+        # 预编译路由中的下游 Stream 名称（拓扑序）
+        return [stream.name for stream, _ in self.route]
\ No newline at end of file
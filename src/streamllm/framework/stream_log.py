@@ -0,0 +1,334 @@
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional
+
+"""
+Stream 的持久化日志：只追加的分段文件，按 offset 寻址。
+- 每个分段文件预分配 segment_bytes 大小（稀疏文件）并通过 mmap 写入，文件名为该分段第一条记录的 offset；
+- 记录格式为 [offset u64][timestamp f64][length u32][crc32 u32][pickle 数据]，重启时逐条校验，
+  遇到不完整或校验失败的记录即认为日志到此为止（崩溃时未写完的记录被丢弃）；
+- 刷盘由后台线程批量完成（group fsync）：fsync 为 group 时 append 的调用方等待包含该记录的刷盘，
+  一次刷盘期间到达的所有 append 合并到下一次刷盘中；interval 时每 fsync_interval 秒刷盘一次而不等待，
+  none 时由操作系统决定；
+- 每个订阅者（Agent）的已提交 offset 保存在 offsets.json 中，由刷盘线程定期写入，重启后从该位置继续
+  （至少一次：崩溃前已处理但未写入的 offset 会被重新处理）；
+- 按总大小（retention_bytes）或时间（retention_seconds）删除最旧的分段，当前写入的分段不会被删除。
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+FSYNC_MODES = ("group", "interval", "none")
+RETENTION_CHECK_INTERVAL = 60.0   # 没有新分段时按时间检查保留策略的最长间隔（秒）
+# 持久化 Stream 的默认目录，未指定 path 时使用 <STREAMLLM_LOG_DIR>/<stream 名称>
+STREAM_LOG_DIR = os.getenv("STREAMLLM_LOG_DIR", "stream_logs")
+
+_HEADER = struct.Struct("<QdII")
+_OFFSETS_FILE = "offsets.json"
+
+
+class LogRecord:
+    """
+    日志中的一条记录。持久化 Stream 把它交给 Handler worker，处理完成后按 offset 提交。
+    """
+    __slots__ = ('offset', 'timestamp', 'data')
+
+    def __init__(self, offset: int, timestamp: float, data: Any):
+        self.offset = offset
+        self.timestamp = timestamp
+        self.data = data
+
+    def __repr__(self):
+        return f"LogRecord(offset={self.offset}, timestamp={self.timestamp})"
+
+
+class Segment:
+    def __init__(self, path: str, base_offset: int, capacity: int):
+        self.path = path
+        self.base_offset = base_offset
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        size = os.path.getsize(path)
+        if size < capacity:
+            self.file.truncate(capacity)
+        self.capacity = max(size, capacity)
+        self.mm = mmap.mmap(self.file.fileno(), self.capacity)
+        self.positions = array('Q')   # 每条记录在文件中的起始位置
+        self.size = 0
+        self.last_timestamp = 0.0
+        if exists:
+            self._recover()
+
+    def _recover(self):
+        # 从头扫描记录，直到遇到不连续的 offset、越界或 crc 不匹配
+        position = 0
+        while position + _HEADER.size <= self.capacity:
+            offset, timestamp, length, crc = _HEADER.unpack_from(self.mm, position)
+            end = position + _HEADER.size + length
+            if offset != self.base_offset + len(self.positions) or length == 0 or end > self.capacity:
+                break
+            if zlib.crc32(self.mm[position + _HEADER.size:end]) != crc:
+                break
+            self.positions.append(position)
+            self.last_timestamp = timestamp
+            position = end
+        self.size = position
+
+    @property
+    def next_offset(self) -> int:
+        return self.base_offset + len(self.positions)
+
+    def append(self, timestamp: float, payload: bytes) -> bool:
+        # 空间不足时返回 False，由调用方切换到新的分段
+        end = self.size + _HEADER.size + len(payload)
+        if end > self.capacity:
+            return False
+        _HEADER.pack_into(self.mm, self.size, self.next_offset, timestamp, len(payload), zlib.crc32(payload))
+        self.mm[self.size + _HEADER.size:end] = payload
+        self.positions.append(self.size)
+        self.size = end
+        self.last_timestamp = timestamp
+        return True
+
+    def read(self, offset: int) -> LogRecord:
+        position = self.positions[offset - self.base_offset]
+        _, timestamp, length, _ = _HEADER.unpack_from(self.mm, position)
+        start = position + _HEADER.size
+        # 复制出记录的字节，分段被删除后 LogRecord 仍然有效
+        return LogRecord(offset, timestamp, self.mm[start:start + length])
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+class StreamLog:
+    def __init__(self, path: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES, retention_bytes: int = None,
+                 retention_seconds: float = None, fsync: str = "group", fsync_interval: float = 1.0):
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"Unknown fsync mode: {fsync}")
+        self.path = path
+        self.segment_bytes = segment_bytes
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        os.makedirs(path, exist_ok=True)
+
+        self.segments: List[Segment] = []
+        for file_name in sorted((name for name in os.listdir(path) if name.endswith(".log")), key=lambda name: int(name[:-4])):
+            self.segments.append(Segment(os.path.join(path, file_name), int(file_name[:-4]), segment_bytes))
+        if not self.segments:
+            self.segments.append(self._new_segment(0))
+        self.committed: Dict[str, int] = self._load_offsets()
+        self._enforce_retention()
+
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)   # 刷盘完成时通知等待的 append
+        self._wakeup = threading.Condition(self._lock)    # 有新数据时唤醒刷盘线程
+        self.flushed_offset = self.end_offset
+        self._offsets_dirty = False
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"stream-log-{os.path.basename(path)}", daemon=True)
+        self._flusher.start()
+        logger.info("Stream log %s opened: offsets %d-%d in %d segment(s)", path, self.start_offset,
+                    self.end_offset, len(self.segments))
+
+    @property
+    def start_offset(self) -> int:
+        return self.segments[0].base_offset
+
+    @property
+    def end_offset(self) -> int:
+        # 下一条记录的 offset
+        return self.segments[-1].next_offset
+
+    def _new_segment(self, base_offset: int) -> Segment:
+        return Segment(os.path.join(self.path, f"{base_offset:020d}.log"), base_offset, self.segment_bytes)
+
+    def append(self, data: Any) -> LogRecord:
+        """
+        追加一条记录并返回它。数据写入 mmap 后立即返回，持久化由 wait_durable 等待。
+        """
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        timestamp = time.time()
+        with self._lock:
+            if self._closed:
+                raise ValueError(f"Stream log {self.path} is closed")
+            active = self.segments[-1]
+            if not active.append(timestamp, payload):
+                self._roll()
+                active = self.segments[-1]
+                if not active.append(timestamp, payload):
+                    raise ValueError(f"Record of {len(payload)} bytes does not fit in a {self.segment_bytes} byte segment")
+            offset = active.next_offset - 1
+            if self.fsync == "group":
+                self._wakeup.notify()
+        return LogRecord(offset, timestamp, data)
+
+    def wait_durable(self, offset: int):
+        # fsync 为 group 时等待包含该记录的批量刷盘完成
+        if self.fsync != "group":
+            return
+        with self._lock:
+            self._flushed.wait_for(lambda: self.flushed_offset > offset or self._closed)
+
+    def _roll(self):
+        # 在 _lock 中调用：刷盘并封存当前分段，开始新的分段，再按保留策略删除旧分段
+        active = self.segments[-1]
+        active.flush()
+        self.flushed_offset = max(self.flushed_offset, active.next_offset)
+        self.segments.append(self._new_segment(active.next_offset))
+        self._enforce_retention()
+
+    def _enforce_retention(self):
+        now = time.time()
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            too_large = self.retention_bytes is not None and sum(s.size for s in self.segments) > self.retention_bytes
+            too_old = self.retention_seconds is not None and now - oldest.last_timestamp > self.retention_seconds
+            if not (too_large or too_old):
+                break
+            self.segments.pop(0)
+            oldest.close()
+            os.remove(oldest.path)
+            logger.info("Stream log %s removed segment %d (retention)", self.path, oldest.base_offset)
+
+    def read(self, offset: int, max_records: int = 256) -> List[LogRecord]:
+        """
+        从 offset 开始读取最多 max_records 条记录（offset 早于保留范围时从最早的记录开始）。
+        """
+        records = []
+        with self._lock:
+            offset = max(offset, self.start_offset)
+            index = bisect_right([segment.base_offset for segment in self.segments], offset) - 1
+            while index < len(self.segments) and len(records) < max_records:
+                segment = self.segments[index]
+                while offset < segment.next_offset and len(records) < max_records:
+                    records.append(segment.read(offset))
+                    offset += 1
+                index += 1
+        for record in records:
+            record.data = pickle.loads(record.data)
+        return records
+
+    def commit(self, subscriber: str, offset: int):
+        # offset 为订阅者下一条要处理的记录，只会前进
+        with self._lock:
+            if offset > self.committed.get(subscriber, -1):
+                self.committed[subscriber] = offset
+                self._offsets_dirty = True
+
+    def committed_offset(self, subscriber: str) -> Optional[int]:
+        with self._lock:
+            return self.committed.get(subscriber)
+
+    def _load_offsets(self) -> Dict[str, int]:
+        try:
+            with open(os.path.join(self.path, _OFFSETS_FILE), 'r', encoding='utf-8') as file:
+                return {name: int(offset) for name, offset in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logger.warning("Stream log %s failed to load committed offsets: %s", self.path, e)
+            return {}
+
+    def _save_offsets(self):
+        # 先写临时文件再替换，避免崩溃时留下半个文件
+        path = os.path.join(self.path, _OFFSETS_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as file:
+            json.dump(self.committed, file)
+        os.replace(path + ".tmp", path)
+        self._offsets_dirty = False
+
+    def _flush_loop(self):
+        saved_at = time.monotonic()
+        retention_at = time.monotonic()
+        # 保留策略平时在封存分段时执行；不再写入的 Stream 不会封存分段，由刷盘线程定期按时间检查
+        retention_interval = min(self.retention_seconds, RETENTION_CHECK_INTERVAL) \
+            if self.retention_seconds is not None else None
+        while True:
+            with self._lock:
+                if self.fsync == "group":
+                    # 有未刷盘的记录时立即刷盘，否则最多等待 fsync_interval 秒再检查已提交的 offset
+                    self._wakeup.wait_for(lambda: self._closed or self.flushed_offset < self.end_offset,
+                                          timeout=self.fsync_interval)
+                else:
+                    self._wakeup.wait(self.fsync_interval)
+                if self._closed:
+                    return
+                active = self.segments[-1]
+                target = self.end_offset
+                # offset 最多每 fsync_interval 秒写入一次
+                if self._offsets_dirty and time.monotonic() - saved_at >= self.fsync_interval:
+                    self._save_offsets()
+                    saved_at = time.monotonic()
+                if retention_interval is not None and time.monotonic() - retention_at >= retention_interval:
+                    self._enforce_retention()
+                    retention_at = time.monotonic()
+                if self.flushed_offset == target:
+                    continue
+            if self.fsync != "none":
+                try:
+                    active.flush()
+                except ValueError:
+                    # 分段已被封存（封存时已刷盘）
+                    pass
+            with self._lock:
+                self.flushed_offset = max(self.flushed_offset, target)
+                self._flushed.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.end_offset
+            return {
+                'start_offset': self.start_offset,
+                'end_offset': end,
+                'flushed_offset': self.flushed_offset,
+                'segments': len(self.segments),
+                'bytes': sum(segment.size for segment in self.segments),
+                'committed': dict(self.committed),
+                'lag': {name: end - offset for name, offset in self.committed.items()},
+            }
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify_all()
+            self._flushed.notify_all()
+        if self._flusher:
+            self._flusher.join()
+        with self._lock:
+            self.flushed_offset = self.end_offset
+            self._save_offsets()
+            for segment in self.segments:
+                segment.flush()
+                segment.close()
+        logger.info("Stream log %s closed at offset %d", self.path, self.flushed_offset)
+
+
+def open_stream_log(name: str, config: Any) -> StreamLog:
+    """
+    由 Stream 的 persistent 配置创建日志：True 使用默认配置，dict 可设置 path、segment_bytes、
+    retention_bytes、retention_hours / retention_seconds、fsync 和 fsync_interval。
+    """
+    config = dict(config) if isinstance(config, dict) else {}
+    path = config.pop('path', None) or os.path.join(STREAM_LOG_DIR, name)
+    retention_hours = config.pop('retention_hours', None)
+    if retention_hours is not None:
+        config['retention_seconds'] = retention_hours * 3600
+    return StreamLog(path, **config)
@@ -1,7 +1,12 @@
+import logging
 from .stream import Stream
-from typing import Any
+from .dispatcher import AsyncDispatcher, DEFAULT_CAPACITY
+from .metrics import remove_stream
+from typing import Any, Dict, List, Union
 from flask_socketio import SocketIO
 
+logger = logging.getLogger(__name__)
+
 class StreamManager:
     """
     Stream 类负责管理一个数据流，并允许注册多个处理器（Handlers）来处理进入的数据。
@@ -11,11 +16,12 @@ class StreamManager:
         self.streams = {}
         self.socketio = socketio
 
-    def create_stream(self, name: str) -> Stream:
+    def create_stream(self, name: str, mode: str = "async", capacity: int = DEFAULT_CAPACITY, policy: str = "block",
+                      persistent: Union[bool, Dict[str, Any]] = None) -> Stream:
         if name in self.streams:
-            print(f"Stream {name} already exists.")
+            logger.warning("Stream %s already exists.", name)
             return self.streams[name]
-        stream = Stream(name, self.socketio)
+        stream = Stream(name, self.socketio, mode=mode, capacity=capacity, policy=policy, persistent=persistent)
         self.streams[name] = stream
         return stream
 
@@ -27,8 +33,26 @@ class StreamManager:
 
     def delete_stream(self, name: str):
         if name in self.streams:
+            # 先断开与其他 Stream 的连接，使相关路由重新编译
+            stream = self.streams[name]
+            for upstream in list(stream.upstreams):
+                upstream.disconnect_stream(stream)
+            for downstream in list(stream.connections):
+                stream.disconnect_stream(downstream)
             del self.streams[name]
-            print(f"Stream {name} deleted.")
+            stream.close()
+            remove_stream(name)
+            logger.info("Stream %s deleted.", name)
 
     def list_streams(self):
         return list(self.streams.values())
+
+    def get_dispatch_plan(self) -> Dict[str, List[str]]:
+        # 每个 Stream 预编译的下游路由
+        return {name: stream.get_route() for name, stream in self.streams.items()}
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        # 等待所有 async 模式 Stream 中已入队的数据处理完成
+        if not any(stream.mode == "async" for stream in self.streams.values()):
+            return True
+        return AsyncDispatcher.get_instance().wait_idle(timeout)
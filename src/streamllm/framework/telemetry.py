@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from flask_socketio import SocketIO
+
+"""
+前端遥测聚合。
+Stream 的 data_flow 和 Agent 的 agent_response 不再逐条 socketio.emit，而是先在内存中合并，
+每隔 interval 秒以一个 telemetry 帧批量推送：包含每个节点 / 每条边的计数和截断后的最新数据预览。
+浏览器可以通过 subscribe_nodes 事件只订阅关心的节点。
+"""
+
+DEFAULT_INTERVAL = 0.1
+DEFAULT_PREVIEW_CHARS = 120
+ALL_NODES_ROOM = "telemetry_all"   # 未设置过滤条件的客户端所在的房间
+
+
+def _preview(value: Any, limit: int) -> Any:
+    if isinstance(value, str) and len(value) > limit:
+        return value[:limit] + "..."
+    return value
+
+
+class TelemetryAggregator:
+    def __init__(self, socketio: SocketIO, interval: float = DEFAULT_INTERVAL, preview_chars: int = DEFAULT_PREVIEW_CHARS):
+        self.socketio = socketio
+        self.interval = interval
+        self.preview_chars = preview_chars
+        self.filters: Dict[str, Set[str]] = {}   # 客户端 sid -> 订阅的节点
+        self._lock = threading.Lock()
+        self._reset()
+        self._task = None
+
+    def _reset(self):
+        self.streams: Dict[str, Dict[str, Any]] = {}
+        self.edges: Dict[Tuple[str, str], int] = {}
+        self.agents: Dict[str, Dict[str, Any]] = {}
+
+    def _ensure_started(self):
+        if self._task is None:
+            # 使用 SocketIO 的后台任务，兼容 eventlet / gevent / threading 各种异步模式
+            self._task = self.socketio.start_background_task(self._run)
+
+    def record_flow(self, stream: str, summary: Any, target: str = None):
+        with self._lock:
+            if target is None:
+                entry = self.streams.setdefault(stream, {'count': 0})
+                entry['count'] += 1
+                entry['preview'] = _preview(summary, self.preview_chars)
+            else:
+                self.edges[(stream, target)] = self.edges.get((stream, target), 0) + 1
+            self._ensure_started()
+
+    def record_response(self, agent: str, response: str, partial: bool = False):
+        with self._lock:
+            entry = self.agents.setdefault(agent, {'count': 0, 'partial': ''})
+            if partial:
+                # 流式片段在一帧内拼接，前端按帧追加
+                entry['partial'] = _preview(entry['partial'] + response, self.preview_chars)
+            else:
+                entry['count'] += 1
+                entry['preview'] = _preview(response, self.preview_chars)
+                entry['partial'] = ''
+            self._ensure_started()
+
+    def set_filter(self, sid: str, nodes: Optional[Iterable[str]]):
+        with self._lock:
+            if nodes:
+                self.filters[sid] = set(nodes)
+            else:
+                self.filters.pop(sid, None)
+
+    def remove_client(self, sid: str):
+        with self._lock:
+            self.filters.pop(sid, None)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            streams, edges, agents = self.streams, self.edges, self.agents
+            filters = dict(self.filters)
+            self._reset()
+        if not (streams or edges or agents):
+            return
+        frame = {
+            'ts': time.time(),
+            'streams': streams,
+            'edges': [{'source': s, 'target': t, 'count': c} for (s, t), c in edges.items()],
+            'agents': agents,
+        }
+        self.socketio.emit('telemetry', frame, to=ALL_NODES_ROOM)
+        for sid, nodes in filters.items():
+            filtered = {
+                'ts': frame['ts'],
+                'streams': {k: v for k, v in streams.items() if k in nodes},
+                'edges': [e for e in frame['edges'] if e['source'] in nodes or e['target'] in nodes],
+                'agents': {k: v for k, v in agents.items() if k in nodes},
+            }
+            if filtered['streams'] or filtered['edges'] or filtered['agents']:
+                self.socketio.emit('telemetry', filtered, to=sid)
+
+
+# 每个 SocketIO 实例共享一个聚合器
+_aggregators: Dict[int, TelemetryAggregator] = {}
+_aggregators_lock = threading.Lock()
+
+def get_telemetry(socketio: SocketIO) -> Optional[TelemetryAggregator]:
+    if socketio is None:
+        return None
+    with _aggregators_lock:
+        aggregator = _aggregators.get(id(socketio))
+        if aggregator is None:
+            aggregator = TelemetryAggregator(socketio)
+            _aggregators[id(socketio)] = aggregator
+        return aggregator
@@ -0,0 +1,89 @@
+from typing import Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .stream import Stream
+
+"""
+Stream 连接图的拓扑编译。
+每个 Stream 持有一份预先计算好的不可变路由：从它出发可达的所有下游 Stream，按拓扑序排列，
+每个下游只出现一次（菱形连接不会重复投递），并附带指向它的上游 Stream 列表（用于前端展示转发边）。
+Stream.emit 只需顺序遍历这份路由，不再递归。
+连接发生变化时，只重新编译受影响的 Stream（变化的 Stream 及其所有上游）。
+"""
+
+# 路由中的一步：(下游 Stream, 可达子图中连接到它的上游 Stream 们)
+RouteStep = Tuple['Stream', Tuple['Stream', ...]]
+
+
+class CycleError(ValueError):
+    """
+    添加的连接会在 Stream 图中形成环。
+    """
+    pass
+
+
+def reachable(source: 'Stream') -> List['Stream']:
+    # 从 source 出发可达的所有 Stream（不含 source 自身，除非存在环）
+    seen = {}
+    stack = list(source.connections)
+    while stack:
+        stream = stack.pop()
+        if id(stream) in seen:
+            continue
+        seen[id(stream)] = stream
+        stack.extend(stream.connections)
+    return list(seen.values())
+
+
+def compile_route(source: 'Stream') -> Tuple[RouteStep, ...]:
+    """
+    对 source 可达的子图做拓扑排序（Kahn 算法），生成扁平的路由。
+    """
+    nodes = reachable(source)
+    if any(stream is source for stream in nodes):
+        raise CycleError(f"Stream {source.name} is part of a cycle")
+    members = {id(source): source}
+    members.update((id(stream), stream) for stream in nodes)
+
+    parents: Dict[int, List['Stream']] = {id(stream): [] for stream in nodes}
+    for stream in members.values():
+        for target in stream.connections:
+            parents[id(target)].append(stream)
+
+    indegree = {key: len(value) for key, value in parents.items()}
+    route: List[RouteStep] = []
+    ready = [source]
+    while ready:
+        stream = ready.pop(0)
+        if stream is not source:
+            route.append((stream, tuple(parents[id(stream)])))
+        for target in stream.connections:
+            indegree[id(target)] -= 1
+            if indegree[id(target)] == 0:
+                ready.append(target)
+    return tuple(route)
+
+
+def ancestors(stream: 'Stream') -> List['Stream']:
+    # 所有能到达 stream 的上游 Stream
+    seen = {}
+    stack = list(stream.upstreams)
+    while stack:
+        upstream = stack.pop()
+        if id(upstream) in seen:
+            continue
+        seen[id(upstream)] = upstream
+        stack.extend(upstream.upstreams)
+    return list(seen.values())
+
+
+def check_edge(source: 'Stream', target: 'Stream'):
+    # 添加 source -> target 前检查是否会形成环
+    if target is source or any(step[0] is source for step in target.route):
+        raise CycleError(f"Connecting stream {source.name} to {target.name} would create a cycle")
+
+
+def recompile(stream: 'Stream'):
+    # 增量重建：连接变化只影响 stream 自身及其上游的路由
+    for affected in [stream] + ancestors(stream):
+        affected.route = compile_route(affected)
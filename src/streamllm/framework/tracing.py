@@ -0,0 +1,230 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+"""
+端到端追踪。
+每条进入 Stream 的数据都带有追踪上下文（trace id + 当前 span），沿 connections 转发、ForwardingHandlerAgent
+再次 emit、Handler 处理以及 handle_response 逐跳生成 span，从而把 Agent 的回答关联回最初的输入。
+上下文保存在 contextvars 中：inline 模式天然在同一线程内传递，async 模式下分发器在入队时复制上下文，
+worker 在该上下文中执行 Handler。
+未设置任何 exporter 时追踪关闭，不创建 span 也不导出。
+"""
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Dict[str, Any] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start = time.time()
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'attributes': self.attributes,
+        }
+
+    def __repr__(self):
+        return f"<Span {self.name} trace={self.trace_id} span={self.span_id}>"
+
+
+class SpanExporter:
+    """
+    span 结束时调用 export，实现时应尽量快（在 Handler 线程中执行）。
+    """
+    def export(self, span: Span):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    # 把 span 保存在内存中，用于测试和调试
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def get_spans(self, trace_id: str = None) -> List[Span]:
+        with self._lock:
+            return [span for span in self.spans if trace_id is None or span.trace_id == trace_id]
+
+    def trace_ids(self) -> List[str]:
+        with self._lock:
+            return list(dict.fromkeys(span.trace_id for span in self.spans))
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+class JSONExporter(SpanExporter):
+    # 每个 span 写入一行 JSON（JSON Lines）
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("streamllm_current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def use_span(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    # 把已有的 span 设为当前上下文（例如微批处理中逐条恢复每条数据的上下文）
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+class Tracer:
+    def __init__(self):
+        self.exporters: List[SpanExporter] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: SpanExporter):
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter: SpanExporter):
+        if exporter in self.exporters:
+            self.exporters.remove(exporter)
+            exporter.shutdown()
+
+    def start_span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        # parent 默认为当前上下文中的 span，没有时开始一条新的 trace
+        parent = parent or current_span()
+        if parent is None:
+            return Span(name, _new_id(16), None, attributes)
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+
+    def end_span(self, span: Span, end: float = None):
+        span.end = end if end is not None else time.time()
+        for exporter in list(self.exporters):
+            exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, parent: Optional[Span] = None, **attributes) -> Iterator[Optional[Span]]:
+        """
+        在 with 块内把新 span 设为当前上下文，结束时导出。追踪关闭时直接返回 None。
+        """
+        if not self.exporters:
+            yield None
+            return
+        span = self.start_span(name, parent, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.set_attribute('error', repr(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def event(self, name: str, **attributes) -> Optional[Span]:
+        # 记录一个没有持续时间的 span（如 Agent 产生回答）
+        if not self.exporters:
+            return None
+        span = self.start_span(name, **attributes)
+        self.end_span(span, span.start)
+        return span
+
+
+# 进程级的 tracer
+tracer = Tracer()
+
+
+def summarize_trace(spans: List[Span]) -> Dict[str, Any]:
+    """
+    汇总一条 trace：总耗时、各类 span 的数量（扇出）、Handler 累计耗时，
+    以及关键路径（从根 span 到最晚结束的 span 的链路）。
+    """
+    if not spans:
+        return {}
+    by_id = {span.span_id: span for span in spans}
+    start = min(span.start for span in spans)
+    last = max(spans, key=lambda span: span.end or span.start)
+    path = []
+    span = last
+    while span is not None:
+        path.append(span)
+        span = by_id.get(span.parent_id)
+    path.reverse()
+    kinds: Dict[str, int] = {}
+    for span in spans:
+        kind = span.name.split(" ", 1)[0]
+        kinds[kind] = kinds.get(kind, 0) + 1
+    return {
+        'trace_id': spans[0].trace_id,
+        'duration': (last.end or last.start) - start,
+        'spans': len(spans),
+        'fan_out': kinds,
+        'handler_time': sum(span.duration or 0 for span in spans if span.name.startswith("handle ")),
+        'critical_path': [{'name': span.name, 'offset': span.start - start, 'duration': span.duration} for span in path],
+    }
+
+
+def configure_tracing(exporter: str = None, path: str = None) -> Optional[SpanExporter]:
+    """
+    按名称添加 exporter：memory 或 json（需要 path）。返回创建的 exporter。
+    """
+    if exporter is None:
+        return None
+    if exporter == "memory":
+        instance = InMemoryExporter()
+    elif exporter == "json":
+        if not path:
+            raise ValueError("JSON trace exporter requires a path")
+        instance = JSONExporter(path)
+    else:
+        raise ValueError(f"Unknown trace exporter: {exporter}")
+    tracer.add_exporter(instance)
+    return instance
@@ -0,0 +1,544 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple, Union
+from .filter_engine import get_field, _MISSING
+from .payload import describe
+
+"""
+窗口聚合：把 Stream 中的数据按窗口汇总，每个窗口只输出一条摘要，下游（通常是调用 LLM 的 Agent）处理的数据量大幅减少。
+- tumbling：固定大小、互不重叠的窗口；
+- sliding：大小为 size、每 slide 前进一次的重叠窗口。数据按 slide 切成 pane，每条数据只聚合进一个 pane，
+  窗口结果由最近 size / slide 个 pane 合并得到；
+- session：同一 key 的数据间隔超过 gap 时结束会话。
+size / slide 为整数时按条数计，为 "30s"、"5m" 这样的字符串（或浮点秒数）时按处理时间计，时间窗口按 slide 对齐。
+聚合状态随数据增量更新，不保存原始数据；窗口状态只在内存中，进程重启时未结束的窗口会丢失。
+"""
+
+logger = logging.getLogger(__name__)
+
+WINDOW_KINDS = ("tumbling", "sliding", "session")
+DEFAULT_KEY_IDLE = 600.0   # 按 key 开窗的按条数窗口中，key 空闲多久（秒）后释放其状态
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h)\s*$")
+_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_size(value: Union[int, float, str]) -> Tuple[str, float]:
+    # 返回 ("count", 条数) 或 ("time", 秒数)
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid window size: {value}")
+    if isinstance(value, int):
+        if value < 1:
+            raise ValueError(f"Invalid window size: {value}")
+        return "count", value
+    if isinstance(value, float):
+        if value <= 0:
+            raise ValueError(f"Invalid window size: {value}")
+        return "time", value
+    match = _DURATION.match(str(value))
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid window size: {value}")
+    return "time", float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def _value(data: Any, field: Optional[str]) -> Any:
+    # 聚合的值：field 为 dict 数据中的字段（支持 a.b），未设置时为数据本身
+    if field is None:
+        return data
+    if not isinstance(data, dict):
+        return _MISSING
+    return get_field(data, field)
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Aggregate:
+    """
+    增量聚合：add 加入一个值，merge 合并另一个同类状态（滑动窗口合并 pane 时使用），result 给出结果。
+    """
+    name = "aggregate"
+
+    def __init__(self, field: str = None):
+        self.field = field
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}_{self.field}" if self.field else self.name
+
+    def new(self) -> "Aggregate":
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def add(self, data: Any):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def merge(self, other: "Aggregate"):
+        raise NotImplementedError("Subclasses should implement this method")
+
+    def result(self) -> Any:
+        raise NotImplementedError("Subclasses should implement this method")
+
+
+class CountAggregate(Aggregate):
+    name = "count"
+
+    def __init__(self, field: str = None):
+        super().__init__(field)
+        self.count = 0
+
+    def new(self):
+        return CountAggregate(self.field)
+
+    def add(self, data: Any):
+        if _value(data, self.field) is not _MISSING:
+            self.count += 1
+
+    def merge(self, other: "CountAggregate"):
+        self.count += other.count
+
+    def result(self) -> int:
+        return self.count
+
+
+class SumAggregate(Aggregate):
+    name = "sum"
+
+    def __init__(self, field: str = None):
+        super().__init__(field)
+        self.total = 0
+
+    def new(self):
+        return SumAggregate(self.field)
+
+    def add(self, data: Any):
+        value = _value(data, self.field)
+        if _is_number(value):
+            self.total += value
+
+    def merge(self, other: "SumAggregate"):
+        self.total += other.total
+
+    def result(self) -> Union[int, float]:
+        return self.total
+
+
+class MinAggregate(Aggregate):
+    name = "min"
+
+    def __init__(self, field: str = None):
+        super().__init__(field)
+        self.value = None
+
+    def new(self):
+        return type(self)(self.field)
+
+    def _better(self, value, current) -> bool:
+        return value < current
+
+    def add(self, data: Any):
+        value = _value(data, self.field)
+        if _is_number(value) and (self.value is None or self._better(value, self.value)):
+            self.value = value
+
+    def merge(self, other: "MinAggregate"):
+        if other.value is not None and (self.value is None or self._better(other.value, self.value)):
+            self.value = other.value
+
+    def result(self) -> Optional[Union[int, float]]:
+        return self.value
+
+
+class MaxAggregate(MinAggregate):
+    name = "max"
+
+    def _better(self, value, current) -> bool:
+        return value > current
+
+
+class TopKAggregate(Aggregate):
+    """
+    出现次数最多的 k 个值。pane 中保留完整计数，合并后再取前 k 个，滑动窗口的结果是精确的。
+    """
+    name = "topk"
+
+    def __init__(self, field: str = None, k: int = 5):
+        super().__init__(field)
+        self.k = k
+        self.counts: Counter = Counter()
+
+    def new(self):
+        return TopKAggregate(self.field, self.k)
+
+    def add(self, data: Any):
+        value = _value(data, self.field)
+        if value is _MISSING:
+            return
+        if not isinstance(value, Hashable):
+            value = str(value)
+        self.counts[value] += 1
+
+    def merge(self, other: "TopKAggregate"):
+        self.counts.update(other.counts)
+
+    def result(self) -> List[Tuple[Any, int]]:
+        return self.counts.most_common(self.k)
+
+
+class ConcatAggregate(Aggregate):
+    """
+    拼接文本，总长度超过 max_chars 后不再拼接，只记录被省略的条数。
+    """
+    name = "concat"
+
+    def __init__(self, field: str = None, separator: str = "\n", max_chars: int = 4000):
+        super().__init__(field)
+        self.separator = separator
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.chars = 0
+        self.omitted = 0
+
+    def new(self):
+        return ConcatAggregate(self.field, self.separator, self.max_chars)
+
+    def _append(self, text: str):
+        if self.chars + len(text) > self.max_chars:
+            self.omitted += 1
+            return
+        self.parts.append(text)
+        self.chars += len(text) + len(self.separator)
+
+    def add(self, data: Any):
+        value = _value(data, self.field)
+        if value is _MISSING:
+            return
+        self._append(value if isinstance(value, str) else str(describe(value)))
+
+    def merge(self, other: "ConcatAggregate"):
+        for text in other.parts:
+            self._append(text)
+        self.omitted += other.omitted
+
+    def result(self) -> str:
+        text = self.separator.join(self.parts)
+        if self.omitted:
+            text += f"{self.separator}...（省略 {self.omitted} 条）"
+        return text
+
+
+AGGREGATES: Dict[str, type] = {
+    'count': CountAggregate,
+    'sum': SumAggregate,
+    'min': MinAggregate,
+    'max': MaxAggregate,
+    'topk': TopKAggregate,
+    'concat': ConcatAggregate,
+}
+
+
+def build_aggregates(specs: List[Union[str, Dict[str, Any]]]) -> List[Aggregate]:
+    """
+    由 DSL 配置创建聚合，例如 [count, {sum: value}, {max: temperature}, {topk: device, k: 3}, {concat: message, max_chars: 2000}]。
+    字符串表示对数据本身聚合；dict 中与聚合同名的键为字段，其余键为该聚合的参数。
+    """
+    aggregates = []
+    for spec in specs:
+        if isinstance(spec, str):
+            name, field, options = spec, None, {}
+        else:
+            names = [key for key in spec if key in AGGREGATES]
+            if len(names) != 1:
+                raise ValueError(f"Invalid aggregate: {spec}")
+            name = names[0]
+            options = {key: value for key, value in spec.items() if key != name}
+            field = spec[name] if isinstance(spec[name], str) else None
+        if name not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {name}")
+        try:
+            aggregates.append(AGGREGATES[name](field, **options))
+        except TypeError:
+            raise ValueError(f"Invalid options for aggregate {name}: {options}")
+    labels = [aggregate.label for aggregate in aggregates]
+    if len(set(labels)) != len(labels):
+        raise ValueError(f"Duplicate aggregates: {labels}")
+    return aggregates
+
+
+class _Pane:
+    # 一个 pane（或整个窗口）的聚合状态
+    def __init__(self, prototypes: List[Aggregate]):
+        self.aggregates = [aggregate.new() for aggregate in prototypes]
+        self.count = 0
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def add(self, data: Any, now: float):
+        for aggregate in self.aggregates:
+            aggregate.add(data)
+        self.count += 1
+        if self.first is None:
+            self.first = now
+        self.last = now
+
+    def merge(self, other: "_Pane"):
+        for aggregate, theirs in zip(self.aggregates, other.aggregates):
+            aggregate.merge(theirs)
+        self.count += other.count
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = other.last if self.last is None else max(self.last, other.last)
+
+
+class _KeyState:
+    # 一个 key 的窗口状态：count 窗口按序保存 pane，time 窗口按 pane 编号保存
+    def __init__(self):
+        self.panes: Deque[_Pane] = deque()
+        self.by_index: Dict[int, _Pane] = {}
+        self.current: Optional[_Pane] = None
+        self.last_seen = 0.0
+        self.next_end: Optional[int] = None   # 下一个要输出的时间窗口的最后一个 pane 编号
+
+
+class WindowOperator:
+    """
+    窗口算子。add 在处理数据的线程中调用；时间窗口和会话窗口另有一个后台线程在窗口到期时输出，
+    没有新数据到达时窗口也会按时结束。每个结束的窗口以 dict 的形式交给 emit：
+    {window, key（设置了 key_by 时）, start, end, count, <聚合名>_<字段>: 结果, ...}。
+    窗口结束且没有剩余数据的 key 立即释放；按条数的窗口按 key 开窗时，key 超过 idle 没有新数据也会释放，
+    未结束的窗口作为不完整的窗口输出（与 flush 相同），内存不随出现过的 key 的数量增长。
+    """
+    def __init__(self, emit: Callable[[Dict[str, Any]], None], kind: str = "tumbling",
+                 size: Union[int, float, str] = None, slide: Union[int, float, str] = None,
+                 gap: Union[float, str] = None, aggregates: List[Union[str, Dict[str, Any]]] = None,
+                 key_by: str = None, idle: Union[float, str] = DEFAULT_KEY_IDLE):
+        if kind not in WINDOW_KINDS:
+            raise ValueError(f"Unknown window kind: {kind}")
+        self.kind = kind
+        self.emit = emit
+        self.key_by = key_by
+        self.aggregates = build_aggregates(aggregates or ["count", "concat"])
+        if kind == "session":
+            if gap is None:
+                raise ValueError("session window needs a gap")
+            unit, self.gap = parse_size(gap)
+            if unit != "time":
+                raise ValueError("session gap must be a duration, e.g. 30s")
+            self.unit = "time"
+            self.size = self.slide = None
+        else:
+            if size is None:
+                raise ValueError(f"{kind} window needs a size")
+            self.unit, self.size = parse_size(size)
+            self.slide = self.size
+            if kind == "sliding":
+                if slide is None:
+                    raise ValueError("sliding window needs a slide")
+                slide_unit, self.slide = parse_size(slide)
+                if slide_unit != self.unit:
+                    raise ValueError("size and slide of a sliding window must both be counts or both be durations")
+                ratio = self.size / self.slide
+                if self.slide > self.size or abs(ratio - round(ratio)) > 1e-9:
+                    raise ValueError("window size must be a multiple of slide")
+            self.gap = None
+        # 滑动窗口由多少个 pane 组成
+        self.panes_per_window = int(round(self.size / self.slide)) if self.size else 1
+        # 按条数的窗口没有到期时间，按 key 开窗时由计时线程释放空闲的 key
+        self.idle = None
+        if self.unit == "count" and key_by is not None and idle is not None:
+            idle_unit, self.idle = parse_size(float(idle) if isinstance(idle, int) else idle)
+            if idle_unit != "time":
+                raise ValueError("idle must be a duration, e.g. 10m")
+        self.keys: Dict[Any, _KeyState] = {}
+        self.items_in = 0
+        self.windows_out = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if self.unit == "time" or self.idle is not None:
+            self._thread = threading.Thread(target=self._run, name="window-timer", daemon=True)
+            self._thread.start()
+
+    def _key(self, data: Any) -> Any:
+        if self.key_by is None:
+            return None
+        key = _value(data, self.key_by)
+        if key is _MISSING:
+            return None
+        return key if isinstance(key, Hashable) else str(key)
+
+    def add(self, data: Any):
+        now = time.time()
+        key = self._key(data)
+        with self._lock:
+            self.items_in += 1
+            state = self.keys.get(key)
+            if state is None:
+                state = self.keys[key] = _KeyState()
+            if self.kind == "session":
+                closed = self._add_session(state, key, data, now)
+            elif self.unit == "count":
+                closed = self._add_count(state, key, data, now)
+            else:
+                closed = self._add_time(state, key, data, now)
+            if state.current is None and not state.panes and not state.by_index:
+                # 窗口已输出且没有剩余数据（如按条数的滚动窗口），释放该 key
+                del self.keys[key]
+            self._wakeup.notify()
+        self._emit_all(closed)
+
+    def _add_count(self, state: _KeyState, key: Any, data: Any, now: float) -> List[Dict[str, Any]]:
+        state.last_seen = now
+        if state.current is None:
+            state.current = _Pane(self.aggregates)
+        state.current.add(data, now)
+        if state.current.count < self.slide:
+            return []
+        state.panes.append(state.current)
+        state.current = None
+        if len(state.panes) < self.panes_per_window:
+            return []
+        summary = self._summarize(key, state.panes)
+        state.panes.popleft()
+        return [summary]
+
+    def _add_time(self, state: _KeyState, key: Any, data: Any, now: float) -> List[Dict[str, Any]]:
+        closed = self._expire(key, state, now)
+        # 时钟回拨时不写入已经输出的窗口
+        index = max(int(now // self.slide), state.next_end or 0)
+        pane = state.by_index.get(index)
+        if pane is None:
+            pane = state.by_index[index] = _Pane(self.aggregates)
+        pane.add(data, now)
+        return closed
+
+    def _add_session(self, state: _KeyState, key: Any, data: Any, now: float) -> List[Dict[str, Any]]:
+        closed = []
+        if state.current is not None and now - state.last_seen > self.gap:
+            closed.append(self._summarize(key, [state.current]))
+            state.current = None
+        if state.current is None:
+            state.current = _Pane(self.aggregates)
+        state.current.add(data, now)
+        state.last_seen = now
+        return closed
+
+    def _expire(self, key: Any, state: _KeyState, now: float) -> List[Dict[str, Any]]:
+        # 输出结束时间不晚于 now 的时间窗口：窗口 e 由 pane e-n+1..e 组成，在 pane e 结束时输出。
+        # 滑动窗口中一个 pane 会出现在之后的 n 个窗口中，即使之后没有新数据，这些窗口也都要输出
+        closed = []
+        if not state.by_index:
+            return closed
+        current = int(now // self.slide)
+        n = self.panes_per_window
+        end = min(state.by_index) if state.next_end is None else max(state.next_end, min(state.by_index))
+        while end < current:
+            window = [state.by_index[i] for i in range(end - n + 1, end + 1) if i in state.by_index]
+            if not window:
+                # 窗口中没有数据，直接跳到下一个有数据的 pane
+                later = [i for i in state.by_index if i > end]
+                end = min(later) if later else current
+                continue
+            closed.append(self._summarize(key, window, start=(end - n + 1) * self.slide, end=(end + 1) * self.slide))
+            # 最早的 pane 不再属于之后的窗口
+            state.by_index.pop(end - n + 1, None)
+            end += 1
+        state.next_end = end
+        return closed
+
+    def _summarize(self, key: Any, panes, start: float = None, end: float = None) -> Dict[str, Any]:
+        merged = _Pane(self.aggregates)
+        for pane in panes:
+            merged.merge(pane)
+        summary: Dict[str, Any] = {'window': self.kind}
+        if self.key_by is not None:
+            summary['key'] = key
+        summary['start'] = start if start is not None else merged.first
+        summary['end'] = end if end is not None else merged.last
+        summary['count'] = merged.count
+        self.windows_out += 1
+        for aggregate in merged.aggregates:
+            summary[aggregate.label] = aggregate.result()
+        return summary
+
+    def _emit_all(self, summaries: List[Dict[str, Any]]):
+        for summary in summaries:
+            try:
+                self.emit(summary)
+            except Exception as e:
+                logger.warning("Failed to emit window summary: %s", e)
+
+    def _next_deadline(self) -> Optional[float]:
+        deadlines = []
+        for state in self.keys.values():
+            if self.kind == "session":
+                if state.current is not None:
+                    deadlines.append(state.last_seen + self.gap)
+            elif self.unit == "count":
+                deadlines.append(state.last_seen + self.idle)
+            elif state.by_index:
+                end = min(state.by_index) if state.next_end is None else max(state.next_end, min(state.by_index))
+                deadlines.append((end + 1) * self.slide)
+        return min(deadlines) if deadlines else None
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                deadline = self._next_deadline()
+                timeout = None if deadline is None else max(0.0, deadline - time.time())
+                if timeout is None or timeout > 0:
+                    self._wakeup.wait(timeout)
+                    continue
+                closed = self._advance(time.time())
+            self._emit_all(closed)
+
+    def _advance(self, now: float) -> List[Dict[str, Any]]:
+        # 调用时已持有锁：结束所有到期的窗口和会话
+        closed = []
+        for key, state in list(self.keys.items()):
+            if self.kind == "session":
+                if state.current is not None and now - state.last_seen > self.gap:
+                    closed.append(self._summarize(key, [state.current]))
+                    state.current = None
+            elif self.unit == "count":
+                if now - state.last_seen >= self.idle:
+                    if state.current is not None:
+                        closed.append(self._summarize(key, list(state.panes) + [state.current]))
+                    del self.keys[key]
+                continue
+            else:
+                closed.extend(self._expire(key, state, now))
+            if state.current is None and not state.by_index and not state.panes:
+                del self.keys[key]
+        return closed
+
+    def flush(self):
+        # 立即输出所有未结束的窗口（不完整的窗口也输出），用于停止前保存结果
+        with self._lock:
+            closed = []
+            for key, state in self.keys.items():
+                if state.current is not None:
+                    # 按条数的滑动窗口中，已输出过的 pane 与当前 pane 组成最后一个（不完整的）窗口
+                    closed.append(self._summarize(key, list(state.panes) + [state.current]))
+                elif state.by_index:
+                    closed.append(self._summarize(key, [state.by_index[i] for i in sorted(state.by_index)]))
+            self.keys.clear()
+        self._emit_all(closed)
+
+    def close(self):
+        # 停止计时线程，未结束的窗口不再输出（需要时先调用 flush）
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'kind': self.kind, 'items_in': self.items_in, 'windows_out': self.windows_out,
+                    'open_keys': len(self.keys)}
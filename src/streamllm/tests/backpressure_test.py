@@ -0,0 +1,143 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import threading
+import time
+from streamllm.framework.stream import Stream, StreamFullError
+
+# 有界 inbox 的四种背压策略、reject 策略在 /emit_data 上返回 429、wait_idle 等待在途数据处理完成
+
+
+def _stalled_stream(name: str, policy: str):
+    # capacity 为 1 的 Stream：第一条数据卡在 Handler 中，第二条占满 inbox
+    release = threading.Event()
+    started = threading.Event()
+    received = []
+
+    def handler(data):
+        received.append(data)
+        started.set()
+        release.wait(5)
+
+    stream = Stream(name, None, capacity=1, policy=policy)
+    stream.register_handler(handler)
+    stream.emit(0)
+    assert started.wait(2)
+    stream.emit(1)
+    return stream, received, release
+
+
+def test_block_waits_for_space():
+    stream, received, release = _stalled_stream("backpressure_test_block", "block")
+    returned = threading.Event()
+
+    def emit():
+        stream.emit(2)
+        returned.set()
+
+    threading.Thread(target=emit, daemon=True).start()
+    time.sleep(0.2)
+    assert not returned.is_set(), "emit should wait while the inbox is full"
+    release.set()
+    assert returned.wait(2)
+    assert stream.dispatcher.wait_idle(timeout=2)
+    assert received == [0, 1, 2]
+    stats = stream.get_stats()
+    assert stats['emitted'] == 3 and stats['dropped'] == 0 and stats['rejected'] == 0, stats
+    stream.close()
+
+
+def test_drop_oldest():
+    stream, received, release = _stalled_stream("backpressure_test_drop_oldest", "drop_oldest")
+    stream.emit(2)
+    stream.emit(3)
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2)
+    # inbox 中较旧的 1、2 被新数据挤掉
+    assert received == [0, 3], received
+    stats = stream.get_stats()
+    assert stats['emitted'] == 4 and stats['dropped'] == 2, stats
+    stream.close()
+
+
+def test_drop_newest():
+    stream, received, release = _stalled_stream("backpressure_test_drop_newest", "drop_newest")
+    stream.emit(2)
+    stream.emit(3)
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2)
+    # 新到的 2、3 被丢弃，inbox 中的 1 保留
+    assert received == [0, 1], received
+    stats = stream.get_stats()
+    assert stats['emitted'] == 4 and stats['dropped'] == 2, stats
+    stream.close()
+
+
+def test_reject_raises():
+    stream, received, release = _stalled_stream("backpressure_test_reject", "reject")
+    try:
+        stream.emit(2)
+    except StreamFullError:
+        pass
+    else:
+        raise AssertionError("emit to a full reject stream should raise StreamFullError")
+    # wait=False 时被拒绝的数据只记录，不抛出
+    stream.emit(3, wait=False)
+    time.sleep(0.2)
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2)
+    assert received == [0, 1], received
+    stats = stream.get_stats()
+    assert stats['rejected'] == 2 and stats['dropped'] == 0, stats
+    stream.close()
+
+
+def test_wait_idle():
+    stream, received, release = _stalled_stream("backpressure_test_wait_idle", "block")
+    assert not stream.dispatcher.wait_idle(timeout=0.2), "wait_idle should time out while a handler is busy"
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2)
+    assert received == [0, 1]
+    stream.close()
+
+
+_EMIT_DATA_SCRIPT = """
+import threading
+import backend
+
+release = threading.Event()
+stream = backend.stream_manager.create_stream("backpressure_test_http", capacity=1, policy="reject")
+stream.register_handler(lambda data: release.wait(5))
+client = backend.app.test_client()
+responses = [client.post('/emit_data', json={'stream': 'backpressure_test_http', 'data': i}) for i in range(4)]
+release.set()
+codes = [response.status_code for response in responses]
+assert codes[0] == 200 and codes[-1] == 429, codes
+assert responses[-1].get_json()['stats']['rejected'] >= 1, responses[-1].get_json()
+print("ok")
+"""
+
+
+def test_emit_data_returns_429():
+    # backend 在导入时执行 eventlet.monkey_patch 并按相对路径读取配置，在子进程中以 src/webserver 为工作目录运行；
+    # 配置中的 Agent 在创建时需要 API key，这里不会调用 LLM，没有时使用占位值
+    if importlib.util.find_spec("eventlet") is None or importlib.util.find_spec("flask_socketio") is None:
+        print("eventlet / flask_socketio not installed, skipping /emit_data test")
+        return
+    src = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [src, os.environ.get("PYTHONPATH")])))
+    env.setdefault("QWEN_API_KEY", "test")
+    result = subprocess.run([sys.executable, "-c", _EMIT_DATA_SCRIPT], cwd=os.path.join(src, "webserver"), env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0 and "ok" in result.stdout, result.stderr
+
+
+if __name__ == "__main__":
+    test_block_waits_for_space()
+    test_drop_oldest()
+    test_drop_newest()
+    test_reject_raises()
+    test_wait_idle()
+    test_emit_data_returns_429()
+    print("Backpressure policies behave as configured")
@@ -0,0 +1,93 @@
+import re
+import tempfile
+import threading
+import time
+from streamllm.framework.agent import PromptAgent
+from streamllm.framework.batcher import MicroBatcher, build_batch_prompt, split_batch_response
+from streamllm.framework.providers import LLMProvider, register_provider
+from streamllm.framework.stream import Stream
+
+# 微批处理：按条数 / 等待时间合并，合并的 prompt 一次 LLM 调用、输出上限按条数放大，
+# 持久化 Stream 的 offset 在整批处理完成后才提交
+
+
+class NumberedProvider(LLMProvider):
+    # 按合并 prompt 中的编号逐条回答，记录每次调用的 prompt 和 max_tokens
+    name = "batching_test"
+    requires_api_key = False
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def query(self, prompt, params=None):
+        with self._lock:
+            self.calls.append((prompt, params.max_tokens if params else None))
+        count = len(re.findall(r"^\[\d+\] ", prompt, re.MULTILINE))
+        if not count:
+            return "single answer"
+        return "\n\n".join(f"[{i}] answer {i}" for i in range(1, count + 1))
+
+
+def _wait_for(condition, timeout: float = 2) -> bool:
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_micro_batcher_flushes_by_size_and_wait():
+    batches = []
+    batcher = MicroBatcher(batches.append, batch_size=3, batch_wait=0.2)
+    for i in range(4):
+        batcher.add(i)
+    assert batches == [[0, 1, 2]]
+    assert _wait_for(lambda: len(batches) == 2), "partial batch was not flushed after batch_wait"
+    assert batches[1] == [3]
+    assert batcher.get_histogram() == {1: 1, 3: 1}
+
+
+def test_split_batch_response():
+    assert split_batch_response("[1] a\n\n[2] b\nmore", 2) == ["a", "b\nmore"]
+    assert split_batch_response("[1] a", 2) is None
+    assert build_batch_prompt(["x", "y"]).endswith("[1] x\n\n[2] y")
+
+
+def test_prompt_agent_batches_into_one_call():
+    provider = NumberedProvider()
+    register_provider("batching_test", provider)
+    with tempfile.TemporaryDirectory() as path:
+        stream = Stream("batching_test_in", None, persistent={'path': path})
+        output = Stream("batching_test_out", None)
+        responses = []
+        output.register_handler(responses.append)
+        agent = PromptAgent("BatchingTestAgent", "batching_test", batch_size=3, batch_wait=10, max_tokens=100)
+        agent.subscribe(stream)
+        agent.add_output_stream(output)
+
+        stream.emit("first")
+        stream.emit("second")
+        time.sleep(0.2)
+        # 批未攒满：没有调用 LLM，offset 停留在订阅时的位置
+        assert provider.calls == []
+        assert stream.log.committed_offset(agent.name) == 0
+
+        stream.emit("third")
+        assert _wait_for(lambda: stream.log.committed_offset(agent.name) == 3), stream.log.get_stats()
+        assert len(provider.calls) == 1, provider.calls
+        prompt, max_tokens = provider.calls[0]
+        assert "first" in prompt and "second" in prompt and "third" in prompt
+        assert max_tokens == 300
+        assert stream.dispatcher.wait_idle(timeout=2)
+        assert sorted(responses) == ["answer 1", "answer 2", "answer 3"], responses
+        agent.close()
+        stream.close()
+        output.close()
+
+
+if __name__ == "__main__":
+    test_micro_batcher_flushes_by_size_and_wait()
+    test_split_batch_response()
+    test_prompt_agent_batches_into_one_call()
+    print("Micro-batching merges prompts into one LLM call")
@@ -0,0 +1,59 @@
+import os
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from streamllm.framework.llm import LLMQueryClient
+from streamllm.framework.client_pool import client_pool
+
+# 本地假的 OpenAI 兼容服务，统计建立的 TCP 连接数
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # 支持 keep-alive
+    connections = 0
+    requests = 0
+
+    def setup(self):
+        super().setup()
+        FakeLLMHandler.connections += 1
+
+    def do_POST(self):
+        FakeLLMHandler.requests += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"response {FakeLLMHandler.requests}"}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    # 两个 Agent 各自的 LLMQueryClient 共享同一个底层客户端
+    client1 = LLMQueryClient(provider="openai", base_url=base_url)
+    client2 = LLMQueryClient(provider="openai", base_url=base_url)
+    for i in range(5):
+        print(client1.query_llm(f"prompt {i}"))
+        print(client2.query_llm(f"prompt {i}"))
+
+    print(f"requests: {FakeLLMHandler.requests}, connections: {FakeLLMHandler.connections}, pooled clients: {len(client_pool)}")
+    assert FakeLLMHandler.requests == 10
+    assert FakeLLMHandler.connections == 1, "HTTP connections should be reused across queries"
+    assert len(client_pool) == 1
+
+    client_pool.close()
+    server.shutdown()
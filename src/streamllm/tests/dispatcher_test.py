@@ -0,0 +1,102 @@
+import threading
+import time
+from streamllm.framework.stream import Stream
+
+# emit 只入队不等待 Handler，各 Handler 互不阻塞，单个 Handler 的异常不影响其他 Handler；
+# block 策略下等待空位的 emit 在 Handler 退订 / Stream 删除后返回，wait_idle 不会永远等待
+
+
+def _blocked_stream(name: str):
+    # capacity 为 1 的 Stream：第一条数据卡在 Handler 中，第二条占满 inbox，之后的 emit 等待空位
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(data):
+        started.set()
+        release.wait(5)
+
+    stream = Stream(name, None, capacity=1, policy="block")
+    stream.register_handler(handler)
+    stream.emit(0)
+    assert started.wait(2)
+    stream.emit(1)
+    return stream, handler, release
+
+
+def test_emit_does_not_wait_for_handlers():
+    stream = Stream("dispatcher_test_slow", None)
+    stream.register_handler(lambda data: time.sleep(0.5))
+    started = time.perf_counter()
+    for i in range(5):
+        stream.emit(i)
+    assert time.perf_counter() - started < 0.2, "emit should only enqueue"
+    assert stream.dispatcher.wait_idle(timeout=5)
+    stream.close()
+
+
+def test_handlers_are_isolated():
+    # 慢 Handler 和抛出异常的 Handler 都不影响快 Handler 的处理
+    release = threading.Event()
+    fast = []
+
+    def slow_handler(data):
+        release.wait(5)
+
+    def failing_handler(data):
+        raise RuntimeError("handler failure")
+
+    def fast_handler(data):
+        fast.append(data)
+
+    stream = Stream("dispatcher_test_isolated", None)
+    for handler in (slow_handler, failing_handler, fast_handler):
+        stream.register_handler(handler)
+    for i in range(3):
+        stream.emit(i)
+    deadline = time.time() + 2
+    while len(fast) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    assert fast == [0, 1, 2], fast
+    assert stream.get_stats()['queued']['slow_handler'] == 2
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2)
+    stream.close()
+
+
+def test_unregister_wakes_blocked_emit():
+    stream, handler, release = _blocked_stream("dispatcher_test_unregister")
+    returned = threading.Event()
+
+    def emit():
+        stream.emit(2)
+        returned.set()
+
+    threading.Thread(target=emit, daemon=True).start()
+    time.sleep(0.2)
+    assert not returned.is_set(), "emit should block while the inbox is full"
+    stream.unregister_handler(handler)
+    assert returned.wait(2), "blocked emit did not return after the handler was unregistered"
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2), "wait_idle did not return after the worker was stopped"
+
+
+def test_nowait_emit_to_stopped_worker():
+    # Handler 中向下游 emit 使用 wait=False，入队在事件循环中等待空位
+    stream, handler, release = _blocked_stream("dispatcher_test_nowait")
+    for i in range(3):
+        stream.emit(i + 2, wait=False)
+    time.sleep(0.2)
+    stream.clear_handlers()
+    release.set()
+    assert stream.dispatcher.wait_idle(timeout=2), "pending puts were not released when the worker stopped"
+    # 之后的 emit 没有订阅者，直接返回
+    stream.emit(5)
+    assert stream.dispatcher.wait_idle(timeout=2)
+
+
+if __name__ == "__main__":
+    test_emit_does_not_wait_for_handlers()
+    test_handlers_are_isolated()
+    test_unregister_wakes_blocked_emit()
+    test_nowait_emit_to_stopped_worker()
+    print("Dispatcher isolates handlers and stopped workers release blocked emits")
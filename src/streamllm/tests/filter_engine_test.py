@@ -0,0 +1,75 @@
+import random
+from streamllm.framework.filter_engine import FilterEngine, FilterSpec, FIELD_OPS
+
+# 随机生成过滤条件和数据，检查 FilterEngine 的结果与逐个执行 FilterSpec 一致
+
+FIELDS = ["x", "y", "a.b"]
+VALUES = [0, 1, 2, 1.5, -3, True, False, None, float("nan"), "ERROR", "WARN", "ERROR,WARN", "E", "", "abc",
+          [1], (1,), {"k": 1}]
+OPERANDS = VALUES + [[1, 1], [0, 0], [1, 2, "ERROR"], ("WARN", "E"), {1, 2}, ["ERROR", "ERROR"], [[1], 2]]
+KEYWORDS = ["err", "error", "warn", "ab", "abc", "b", "设备", "设备异常"]
+TEXTS = ["error in abc", "warning", "设备异常告警", "nothing", "", "ab", "WARN err"]
+
+
+def random_spec(rng: random.Random) -> FilterSpec:
+    if rng.random() < 0.3:
+        return FilterSpec(keywords=rng.sample(KEYWORDS, rng.randint(1, 3)),
+                          regex=[r"\d+"] if rng.random() < 0.3 else None)
+    fields = {}
+    for field in rng.sample(FIELDS, rng.randint(1, 3)):
+        if rng.random() < 0.2:
+            # 直接写值等价于 eq（dict 会被当作运算符，这里跳过）
+            fields[field] = rng.choice([value for value in VALUES if not isinstance(value, dict)])
+        else:
+            ops = rng.sample(FIELD_OPS, rng.randint(1, 2))
+            fields[field] = {op: rng.choice(OPERANDS) for op in ops}
+    return FilterSpec(fields=fields)
+
+
+def random_record(rng: random.Random) -> dict:
+    record = {}
+    for field in ("x", "y"):
+        if rng.random() < 0.9:
+            record[field] = rng.choice(VALUES)
+    if rng.random() < 0.7:
+        record["a"] = {"b": rng.choice(VALUES)} if rng.random() < 0.8 else rng.choice(VALUES)
+    return record
+
+
+def test_engine_matches_filter_spec(seed: int = 0, rounds: int = 200):
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(rounds):
+        engine = FilterEngine()
+        specs = {f"s{i}": random_spec(rng) for i in range(rng.randint(1, 8))}
+        for owner, spec in specs.items():
+            engine.add(owner, spec)
+        items = [random_record(rng) for _ in range(20)] + TEXTS + [rng.choice(TEXTS) + " 42"]
+        for item, batch_matched in zip(items, engine.match_batch(items)):
+            expected = {owner for owner, spec in specs.items() if spec(item)}
+            for matched in (engine.match(item), batch_matched):
+                if matched != expected:
+                    mismatches.append((specs, item, matched, expected))
+    assert not mismatches, f"{len(mismatches)} mismatches, first: {mismatches[0]}"
+
+
+def test_in_conditions():
+    cases = [
+        ({"y": {"in": [1, 1]}, "x": {"eq": 1}}, {"x": 0, "y": 1}, False),
+        ({"y": {"in": [0, 0]}}, {"y": 0}, True),
+        ({"level": {"in": "ERROR,WARN"}}, {"level": "ERROR"}, True),
+        ({"x": {"ne": [1]}}, {"x": 1}, True),
+        ({"x": {"ne": 1}}, {"x": [1]}, True),
+    ]
+    for fields, record, expected in cases:
+        engine = FilterEngine()
+        engine.add("owner", FilterSpec(fields=fields))
+        assert FilterSpec(fields=fields)(record) == expected
+        assert (engine.match(record) == {"owner"}) == expected, (fields, record)
+
+
+if __name__ == "__main__":
+    test_in_conditions()
+    for seed in range(5):
+        test_engine_matches_filter_spec(seed)
+    print("FilterEngine agrees with FilterSpec")
@@ -1,7 +1,11 @@
 from streamllm import StreamManager
 from streamllm import TextHandlerAgent, ImageHandlerAgent
+from streamllm import setup_logging
 
 if __name__ == "__main__":
+    # 演示时输出所有日志
+    setup_logging(level="DEBUG")
+
     stream_manager = StreamManager()
     text_stream = stream_manager.create_stream("text")
     image_stream = stream_manager.create_stream("image")
@@ -13,6 +17,7 @@ if __name__ == "__main__":
 
     # 模拟数据流
     text_stream.emit("This is a text message.")
+    stream_manager.wait_idle()
     with open("example.jpg", "rb") as f:
         image_data = f.read()
         # image_stream.emit(image_data)
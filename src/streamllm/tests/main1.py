@@ -1,4 +1,7 @@
-from streamllm import TextHandlerAgent, ImageHandlerAgent, AssistAgent, StreamManager
+from streamllm import TextHandlerAgent, ImageHandlerAgent, AssistAgent, StreamManager, setup_logging
+
+# 演示时输出所有日志
+setup_logging(level="DEBUG")
 
 # 创建Agents
 agent1 = AssistAgent(name="DataAnalyzer", llm_type="qwen")
@@ -20,6 +23,7 @@ image_handler_agent.subscribe(image_stream)
 
 # 模拟数据流
 text_stream.emit("协同处理的文本数据。")
+stream_manager.wait_idle()
 # with open("example.jpg", "rb") as f:
 #     image_data = f.read()
 #     image_stream.emit(image_data)
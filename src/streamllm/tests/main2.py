@@ -2,9 +2,13 @@ from streamllm import StreamManager
 from streamllm import AssistAgent
 from streamllm import AgentStore
 from streamllm import TextHandlerAgent, ImageHandlerAgent, ForwardingHandlerAgent
+from streamllm import setup_logging
 
 # 使用框架
 if __name__ == "__main__":
+    # 演示时输出所有日志
+    setup_logging(level="DEBUG")
+
     # 初始化 StreamManager 和 AgentStore
     stream_manager = StreamManager()
     agent_store = AgentStore()
@@ -46,4 +50,7 @@ if __name__ == "__main__":
     text_stream.emit("这是一个测试文本。")
     with open("example.jpg", "rb") as f:
         image_data = f.read()
-        image_stream.emit(image_data)
\ No newline at end of file
+        image_stream.emit(image_data)
+
+    # 等待异步分发的数据处理完成
+    stream_manager.wait_idle()
\ No newline at end of file
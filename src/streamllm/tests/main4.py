@@ -1,7 +1,11 @@
 from streamllm.framework.dsl_parser import DSLParser
+from streamllm import setup_logging
 
 # 使用框架
 if __name__ == "__main__":
+    # 演示时输出所有日志
+    setup_logging(level="DEBUG")
+
     # 初始化 DSLParser，假设配置文件为 config.yaml
     parser = DSLParser(config_path="config4.yaml")
     parser.parse()
@@ -18,3 +22,6 @@ if __name__ == "__main__":
     # 发送数据
     text_stream.emit("这是一个测试文本。")
     image_stream.emit(open("example.jpg", "rb").read()) # 示例的PNG数据
+
+    # 等待异步分发的数据处理完成
+    stream_manager.wait_idle()
@@ -1,7 +1,11 @@
 from streamllm.framework.dsl_parser import DSLParser
+from streamllm import setup_logging
 
 # 使用框架
 if __name__ == "__main__":
+    # 演示时输出所有日志
+    setup_logging(level="DEBUG")
+
     # 初始化 DSLParser，假设配置文件为 config.yaml
     parser = DSLParser(config_path="config5.yaml")
     parser.parse()
@@ -0,0 +1,94 @@
+from streamllm.framework.prompt_builder import PromptBuilder, SUMMARIZE_PROMPT
+
+# 按 token 预算构建 prompt：超出 max_input_tokens 的数据截断（保留开头和结尾）或分块概括后拼接。
+# token 数用 PromptBuilder 自身的分词器计算，安装或未安装 tiktoken 时结果都成立
+
+INSTRUCTION = "请分析以下文本数据并提供见解："
+CONTENT = "HEAD " + " ".join(f"line {i} ok" for i in range(2000)) + " TAIL"
+
+
+def test_within_budget_is_unchanged():
+    assert PromptBuilder("prompt_test").build(INSTRUCTION, CONTENT) == INSTRUCTION + CONTENT
+    builder = PromptBuilder("prompt_test", max_input_tokens=100)
+    assert builder.build(INSTRUCTION, "short") == INSTRUCTION + "short"
+
+
+def test_truncate_keeps_head_and_tail():
+    builder = PromptBuilder("prompt_test", max_input_tokens=200, system_prompt="You are a helpful assistant.")
+    prompt = builder.build(INSTRUCTION, CONTENT)
+    assert prompt.startswith(INSTRUCTION + "HEAD") and prompt.endswith("TAIL")
+    assert "已省略" in prompt
+    # 分词的边界可能让几个 token 合并或拆开，允许少量误差
+    assert builder.tokenizer.count(prompt) + builder.system_tokens <= 200 + 5
+
+
+def test_validate_instruction_budget():
+    builder = PromptBuilder("prompt_test", max_input_tokens=5)
+    try:
+        builder.validate(INSTRUCTION * 5)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("validate should reject an instruction that uses up the budget")
+
+
+def test_summarize_chunks():
+    calls = []
+
+    def summarize(prompts, max_tokens):
+        calls.append((prompts, max_tokens))
+        return [f"summary {i}" for i in range(len(prompts))]
+
+    builder = PromptBuilder("prompt_test", max_input_tokens=500, overflow="summarize", summarize=summarize, max_chunks=3)
+    prompt = builder.build(INSTRUCTION, CONTENT)
+    assert len(calls) == 1, "all chunks should be summarized in one call"
+    prompts, max_tokens = calls[0]
+    assert 1 <= len(prompts) <= 3
+    assert all(p.startswith(SUMMARIZE_PROMPT) for p in prompts)
+    # 每块加上概括提示后不超过 max_input_tokens
+    assert all(builder.tokenizer.count(p) <= 500 + 5 for p in prompts)
+    assert max_tokens == (500 - builder.tokenizer.count(INSTRUCTION)) // len(prompts)
+    assert prompt == INSTRUCTION + "\n".join(f"summary {i}" for i in range(len(prompts)))
+
+
+def test_summarize_falls_back_to_truncate():
+    def failing(prompts, max_tokens):
+        raise RuntimeError("LLM unavailable")
+
+    def verbose(prompts, max_tokens):
+        return [CONTENT for _ in prompts]
+
+    for summarize in (failing, verbose):
+        builder = PromptBuilder("prompt_test", max_input_tokens=200, overflow="summarize", summarize=summarize)
+        prompt = builder.build(INSTRUCTION, CONTENT)
+        assert "已省略" in prompt
+        assert builder.tokenizer.count(prompt) <= 200 + 5
+
+
+def test_shared_budget():
+    # 微批中每条数据只分到 1/N 的预算
+    builder = PromptBuilder("prompt_test", max_input_tokens=300)
+    alone = builder.tokenizer.count(builder.build(INSTRUCTION, CONTENT))
+    with builder.shared(3, overhead=30):
+        shared = builder.tokenizer.count(builder.build(INSTRUCTION, CONTENT))
+    assert shared <= (300 - 30) // 3 + 5 < alone
+
+
+def test_invalid_options():
+    for kwargs in ({'overflow': "drop"}, {'overflow': "summarize"}, {'max_chunks': 0}):
+        try:
+            PromptBuilder("prompt_test", max_input_tokens=100, **kwargs)
+        except ValueError:
+            continue
+        raise AssertionError(f"PromptBuilder({kwargs}) should raise ValueError")
+
+
+if __name__ == "__main__":
+    test_within_budget_is_unchanged()
+    test_truncate_keeps_head_and_tail()
+    test_validate_instruction_budget()
+    test_summarize_chunks()
+    test_summarize_falls_back_to_truncate()
+    test_shared_budget()
+    test_invalid_options()
+    print("Prompt builder truncates and summarizes oversized data")
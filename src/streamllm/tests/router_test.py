@@ -0,0 +1,102 @@
+import time
+import threading
+from streamllm.framework.llm import LLMQueryClient
+from streamllm.framework.providers import LLMProvider, register_provider
+from streamllm.framework.resilience import LLMQueryError
+from streamllm.framework.router import LLMRouter, build_router
+
+# 多 provider 路由：失败时改用备选路由，当前路由超过 hedge_after 未回答时对冲到下一个路由并保留最先返回的回答
+
+
+class ScriptedProvider(LLMProvider):
+    # 按设定的延迟回答或抛出异常（ValueError 不可重试，不触发重试和熔断），记录调用次数
+    requires_api_key = False
+
+    def __init__(self, answer: str = None, latency: float = 0.0, fail: bool = False):
+        super().__init__()
+        self.answer = answer
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def query(self, prompt, params=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if self.fail:
+            raise ValueError(f"{self.answer} failed")
+        return self.answer
+
+
+def _router(providers, **kwargs) -> LLMRouter:
+    clients = []
+    for name, provider in providers.items():
+        register_provider(name, provider)
+        clients.append(LLMQueryClient(provider=name))
+    return LLMRouter(clients, **kwargs)
+
+
+def test_fallback_on_failure():
+    primary = ScriptedProvider("primary", fail=True)
+    secondary = ScriptedProvider("secondary")
+    router = _router({"router_test_fallback_a": primary, "router_test_fallback_b": secondary})
+    assert router.query_llm("hello") == "secondary"
+    assert primary.calls == 1 and secondary.calls == 1
+
+
+def test_all_routes_fail():
+    router = _router({"router_test_fail_a": ScriptedProvider("a", fail=True),
+                      "router_test_fail_b": ScriptedProvider("b", fail=True)})
+    try:
+        router.query_llm("hello")
+    except LLMQueryError as e:
+        assert "b failed" in str(e)
+    else:
+        raise AssertionError("query_llm should raise when every route fails")
+
+
+def test_hedge_to_faster_route():
+    slow = ScriptedProvider("slow", latency=1.0)
+    fast = ScriptedProvider("fast", latency=0.05)
+    router = _router({"router_test_hedge_a": slow, "router_test_hedge_b": fast}, hedge_after=0.1)
+    started = time.perf_counter()
+    assert router.query_llm("hello") == "fast"
+    assert time.perf_counter() - started < 0.5
+    assert slow.calls == 1 and fast.calls == 1
+
+
+def test_no_hedge_when_primary_is_fast():
+    primary = ScriptedProvider("primary", latency=0.01)
+    secondary = ScriptedProvider("secondary")
+    router = _router({"router_test_nohedge_a": primary, "router_test_nohedge_b": secondary}, hedge_after=0.5)
+    assert router.query_llm("hello") == "primary"
+    assert secondary.calls == 0
+
+
+def test_stream_falls_back_before_first_chunk():
+    router = _router({"router_test_stream_a": ScriptedProvider("a", fail=True),
+                      "router_test_stream_b": ScriptedProvider("b")})
+    assert "".join(router.stream_llm("hello")) == "b"
+
+
+def test_build_router_inherits_agent_params():
+    register_provider("router_test_build_a", ScriptedProvider("a"))
+    register_provider("router_test_build_b", ScriptedProvider("b"))
+    router = build_router("router_test_build_a", {
+        'fallbacks': [{'llm_type': 'router_test_build_b', 'model': 'small'}, {'model': 'other'}],
+        'hedge_after': 'p95', 'hedge_default': 2}, max_tokens=64)
+    assert [route.name for route in router.routes] == \
+        ["router_test_build_a/None", "router_test_build_b/small", "router_test_build_a/other"]
+    assert all(route.client.max_tokens == 64 for route in router.routes)
+    assert router.hedge_quantile == 0.95 and router.hedge_default == 2
+
+
+if __name__ == "__main__":
+    test_fallback_on_failure()
+    test_all_routes_fail()
+    test_hedge_to_faster_route()
+    test_no_hedge_when_primary_is_fast()
+    test_stream_falls_back_before_first_chunk()
+    test_build_router_inherits_agent_params()
+    print("LLM router falls back and hedges across routes")
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from streamllm.framework.singleflight import SingleFlight, AsyncSingleFlight
+
+# single-flight：并发的相同调用只执行一次并共享结果或异常，完成后不保留结果；异步版本按事件循环分别合并
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+    executed = []
+    results = []
+
+    def fn():
+        executed.append(1)
+        release.wait(2)
+        return "answer"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", fn))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(executed) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+    assert all(result == "answer" for result, _ in results)
+    assert flight.get_stats() == {'executed': 1, 'shared': 4, 'in_flight': 0}
+    # 调用完成后不保留结果，再次调用会重新执行
+    assert flight.do("key", lambda: "again") == ("again", False)
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def fn():
+        release.wait(2)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("key", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3 and all(str(e) == "boom" for e in errors)
+    assert flight.get_stats()['in_flight'] == 0
+
+
+def test_async_calls_are_coalesced():
+    flight = AsyncSingleFlight()
+    executed = []
+
+    async def fn():
+        executed.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", fn) for _ in range(4)), flight.do("other", fn))
+
+    results = asyncio.run(main())
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, False]
+    assert len(executed) == 2
+    assert flight.get_stats() == {'executed': 2, 'shared': 3, 'in_flight': 0}
+
+
+def test_async_cancelled_waiter_does_not_cancel_call():
+    flight = AsyncSingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", fn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await leader
+
+    assert asyncio.run(main()) == ("answer", False)
+
+
+def test_async_calls_on_different_loops_are_separate():
+    # 不同事件循环中的 Future 不能互相等待，相同的键在每个事件循环中各执行一次
+    flight = AsyncSingleFlight()
+    started = threading.Barrier(2)
+    results = []
+
+    async def fn():
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def main():
+        started.wait(2)
+        return await flight.do("key", fn)
+
+    threads = [threading.Thread(target=lambda: results.append(asyncio.run(main()))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [("answer", False), ("answer", False)]
+    assert flight.get_stats()['executed'] == 2
+
+
+if __name__ == "__main__":
+    test_concurrent_calls_are_coalesced()
+    test_errors_are_shared()
+    test_async_calls_are_coalesced()
+    test_async_cancelled_waiter_does_not_cancel_call()
+    test_async_calls_on_different_loops_are_separate()
+    print("Single-flight coalesces concurrent calls")
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import time
+from streamllm.framework.stream import Stream
+from streamllm.framework.stream_log import StreamLog, _HEADER
+
+# 持久化日志：崩溃后丢弃不完整的尾部记录，订阅者从已提交的 offset 继续或从指定位置回放，按大小 / 时间删除旧分段
+
+
+def _consumer(received: list):
+    # 订阅者按函数名提交 offset，重新打开 Stream 后用同名的 Handler 继续
+    def consumer(data):
+        received.append(data)
+    return consumer
+
+
+def test_recovery_drops_corrupt_tail():
+    with tempfile.TemporaryDirectory() as path:
+        log = StreamLog(path, segment_bytes=4096)
+        for i in range(3):
+            log.append(f"record {i}")
+        tail = log.segments[0].positions[2]
+        log.close()
+        # 模拟写到一半时崩溃：最后一条记录的数据被破坏，crc 不再匹配
+        segment_path = os.path.join(path, f"{0:020d}.log")
+        with open(segment_path, 'r+b') as file:
+            file.seek(tail + _HEADER.size)
+            file.write(b"\xff\xff")
+
+        log = StreamLog(path, segment_bytes=4096)
+        assert (log.start_offset, log.end_offset) == (0, 2)
+        assert [record.data for record in log.read(0)] == ["record 0", "record 1"]
+        # 之后的记录覆盖被丢弃的尾部
+        assert log.append("record 2 again").offset == 2
+        log.close()
+        log = StreamLog(path, segment_bytes=4096)
+        assert [record.data for record in log.read(0)] == ["record 0", "record 1", "record 2 again"]
+        log.close()
+
+
+def test_resume_from_committed_offset_and_replay():
+    with tempfile.TemporaryDirectory() as path:
+        received = []
+        stream = Stream("stream_log_test_resume", None, persistent={'path': path})
+        consumer = _consumer(received)
+        stream.register_handler(consumer)
+        for i in range(3):
+            stream.emit(i)
+        assert stream.dispatcher.wait_idle(timeout=2)
+        # 订阅者离开期间写入的数据在它重新订阅后补上
+        stream.unregister_handler(consumer)
+        for i in range(3, 5):
+            stream.emit(i)
+        stream.close()
+
+        stream = Stream("stream_log_test_resume", None, persistent={'path': path})
+        assert stream.log.committed_offset("consumer") == 3
+        stream.register_handler(_consumer(received))
+        replayed = []
+        stream.register_handler(_consumer(replayed), replay_from="earliest")
+        from_offset = []
+
+        def from_three(data):
+            from_offset.append(data)
+        stream.register_handler(from_three, replay_from=3)
+        deadline = time.time() + 2
+        while (len(received) < 5 or len(replayed) < 5 or len(from_offset) < 2) and time.time() < deadline:
+            time.sleep(0.01)
+        assert stream.dispatcher.wait_idle(timeout=2)
+        assert received == [0, 1, 2, 3, 4], received
+        assert replayed == [0, 1, 2, 3, 4], replayed
+        assert from_offset == [3, 4], from_offset
+        stream.close()
+
+
+def test_size_retention():
+    with tempfile.TemporaryDirectory() as path:
+        log = StreamLog(path, segment_bytes=256, retention_bytes=600)
+        for i in range(40):
+            log.append("x" * 40)
+        stats = log.get_stats()
+        assert stats['bytes'] <= 600 + 256 and stats['start_offset'] > 0, stats
+        # 早于保留范围的 offset 从最早的记录开始读取
+        assert log.read(0, max_records=1)[0].offset == stats['start_offset']
+        assert stats['segments'] == len([name for name in os.listdir(path) if name.endswith(".log")])
+        log.close()
+
+
+def test_time_retention_without_new_writes():
+    # 不再写入的日志也会由刷盘线程按 retention_seconds 删除旧分段，当前分段保留
+    with tempfile.TemporaryDirectory() as path:
+        log = StreamLog(path, segment_bytes=256, retention_seconds=0.2, fsync_interval=0.05)
+        for i in range(20):
+            log.append("x" * 40)
+        assert len(log.segments) > 1
+        end = log.end_offset
+        deadline = time.time() + 2
+        while len(log.segments) > 1 and time.time() < deadline:
+            time.sleep(0.05)
+        assert len(log.segments) == 1 and log.end_offset == end
+        log.close()
+
+
+if __name__ == "__main__":
+    test_recovery_drops_corrupt_tail()
+    test_resume_from_committed_offset_and_replay()
+    test_size_retention()
+    test_time_retention_without_new_writes()
+    print("Stream log recovers, replays and enforces retention")
@@ -0,0 +1,80 @@
+from streamllm.framework.stream import Stream
+from streamllm.framework.telemetry import TelemetryAggregator, ALL_NODES_ROOM, get_telemetry
+
+# 遥测聚合：逐条的 data_flow / agent_response 合并为每个间隔一个 telemetry 帧，按客户端订阅的节点过滤
+
+
+class RecordingSocketIO:
+    # 记录 emit 的帧；后台任务不启动，由测试调用 flush
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+    def start_background_task(self, target):
+        return target
+
+    def sleep(self, seconds):
+        pass
+
+
+def test_flows_are_merged_into_one_frame():
+    socketio = RecordingSocketIO()
+    stream = Stream("telemetry_test_stream", socketio, mode="inline")
+    downstream = Stream("telemetry_test_downstream", socketio, mode="inline")
+    stream.connect_stream(downstream)
+    for i in range(100):
+        stream.emit(f"item {i}")
+    assert socketio.emitted == [], "telemetry should not be emitted per item"
+
+    get_telemetry(socketio).flush()
+    assert len(socketio.emitted) == 1
+    event, frame, to = socketio.emitted[0]
+    assert event == 'telemetry' and to == ALL_NODES_ROOM
+    assert frame['streams']['telemetry_test_stream']['count'] == 100
+    assert frame['streams']['telemetry_test_downstream']['count'] == 100
+    assert frame['streams']['telemetry_test_stream']['preview'] == "item 99"
+    assert frame['edges'] == [{'source': 'telemetry_test_stream', 'target': 'telemetry_test_downstream', 'count': 100}]
+    # 没有新数据时不推送空帧
+    get_telemetry(socketio).flush()
+    assert len(socketio.emitted) == 1
+
+
+def test_responses_and_previews():
+    socketio = RecordingSocketIO()
+    telemetry = TelemetryAggregator(socketio, preview_chars=5)
+    telemetry.record_response("agent", "abc", partial=True)
+    telemetry.record_response("agent", "defgh", partial=True)
+    telemetry.flush()
+    assert socketio.emitted[-1][1]['agents']['agent'] == {'count': 0, 'partial': "abcde..."}
+    telemetry.record_response("agent", "a long answer")
+    telemetry.record_response("agent", "ok")
+    telemetry.flush()
+    assert socketio.emitted[-1][1]['agents']['agent'] == {'count': 2, 'partial': '', 'preview': "ok"}
+
+
+def test_client_filters():
+    socketio = RecordingSocketIO()
+    telemetry = TelemetryAggregator(socketio)
+    telemetry.set_filter("sid1", ["s1"])
+    telemetry.set_filter("sid2", ["agent"])
+    telemetry.record_flow("s1", "x")
+    telemetry.record_flow("s2", "y")
+    telemetry.record_flow("s2", "y", target="s1")
+    telemetry.flush()
+    frames = {to: frame for _, frame, to in socketio.emitted}
+    # 没有订阅数据的客户端（sid2）不会收到帧
+    assert set(frames) == {ALL_NODES_ROOM, "sid1"}
+    assert set(frames[ALL_NODES_ROOM]['streams']) == {"s1", "s2"}
+    assert set(frames["sid1"]['streams']) == {"s1"}
+    assert frames["sid1"]['edges'] == [{'source': 's2', 'target': 's1', 'count': 1}]
+    telemetry.remove_client("sid1")
+    assert telemetry.filters == {"sid2": {"agent"}}
+
+
+if __name__ == "__main__":
+    test_flows_are_merged_into_one_frame()
+    test_responses_and_previews()
+    test_client_filters()
+    print("Telemetry is batched into frames")
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import yaml
+from streamllm.framework.dsl_parser import DSLParser
+from streamllm.framework.stream import Stream
+from streamllm.framework.topology import CycleError
+
+# Stream 连接图：形成环的连接被拒绝（DSL 中 on_cycle: break 时跳过），菱形连接中每个下游只收到一次数据
+
+
+def _streams(*names):
+    # inline 模式下 emit 同步调用 Handler，便于检查收到的数据
+    streams = {name: Stream(f"topology_test_{name}", None, mode="inline") for name in names}
+    received = {name: [] for name in names}
+    for name, stream in streams.items():
+        stream.register_handler(received[name].append)
+    return streams, received
+
+
+def test_diamond_delivers_once():
+    # a -> b -> d, a -> c -> d
+    s, received = _streams("a", "b", "c", "d")
+    s["a"].connect_stream(s["b"])
+    s["a"].connect_stream(s["c"])
+    s["b"].connect_stream(s["d"])
+    s["c"].connect_stream(s["d"])
+    route = s["a"].get_route()
+    assert sorted(route[:2]) == ["topology_test_b", "topology_test_c"] and route[2] == "topology_test_d", route
+    s["a"].emit("x")
+    assert received == {"a": ["x"], "b": ["x"], "c": ["x"], "d": ["x"]}, received
+    # 断开一条边后增量重建上游的路由
+    s["c"].disconnect_stream(s["d"])
+    s["b"].disconnect_stream(s["d"])
+    assert s["a"].get_route() and "topology_test_d" not in s["a"].get_route()
+
+
+def test_cycle_is_rejected():
+    s, received = _streams("a", "b", "c")
+    s["a"].connect_stream(s["b"])
+    s["b"].connect_stream(s["c"])
+    for source, target in (("c", "a"), ("a", "a"), ("c", "b")):
+        try:
+            s[source].connect_stream(s[target])
+        except CycleError:
+            pass
+        else:
+            raise AssertionError(f"connecting {source} -> {target} should raise CycleError")
+    # 被拒绝的连接没有留下
+    assert s["c"].connections == [] and s["a"].upstreams == []
+    s["a"].emit("x")
+    assert received == {"a": ["x"], "b": ["x"], "c": ["x"]}, received
+
+
+def _parse(config: dict) -> DSLParser:
+    with tempfile.TemporaryDirectory() as path:
+        config_path = os.path.join(path, "config.yaml")
+        with open(config_path, 'w', encoding='utf-8') as file:
+            yaml.safe_dump(config, file)
+        parser = DSLParser(config_path=config_path)
+    parser.parse()
+    return parser
+
+
+def _cyclic_config(prefix: str, on_cycle: str = None) -> dict:
+    config = {'streams': [
+        {'name': f"{prefix}_a", 'mode': 'inline', 'connections': [f"{prefix}_b"]},
+        {'name': f"{prefix}_b", 'mode': 'inline', 'connections': [f"{prefix}_a"]},
+    ]}
+    if on_cycle:
+        config['on_cycle'] = on_cycle
+    return config
+
+
+def test_dsl_on_cycle():
+    try:
+        _parse(_cyclic_config("topology_test_reject"))
+    except CycleError:
+        pass
+    else:
+        raise AssertionError("a cyclic DSL config should raise CycleError by default")
+    parser = _parse(_cyclic_config("topology_test_break", "break"))
+    a = parser.stream_manager.get_stream("topology_test_break_a")
+    b = parser.stream_manager.get_stream("topology_test_break_b")
+    assert a.get_route() == ["topology_test_break_b"] and b.connections == []
+    assert parser.links == [{"source": "topology_test_break_a", "target": "topology_test_break_b"}]
+
+
+if __name__ == "__main__":
+    test_diamond_delivers_once()
+    test_cycle_is_rejected()
+    test_dsl_on_cycle()
+    print("Stream topology rejects cycles and delivers diamonds once")
@@ -0,0 +1,127 @@
+import time
+from streamllm.framework.window import WindowOperator, build_aggregates, parse_size
+
+# 窗口聚合：各类窗口的输出、聚合结果，以及按 key 开窗时 key 状态的释放
+
+
+def _collect(**kwargs):
+    summaries = []
+    return WindowOperator(summaries.append, **kwargs), summaries
+
+
+def _wait_for(condition, timeout: float = 2) -> bool:
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_parse_size():
+    assert parse_size(10) == ("count", 10)
+    assert parse_size("30s") == ("time", 30)
+    assert parse_size("5m") == ("time", 300)
+    assert parse_size(0.5) == ("time", 0.5)
+    for invalid in (0, -1, True, "abc", "0s"):
+        try:
+            parse_size(invalid)
+        except ValueError:
+            continue
+        raise AssertionError(f"parse_size({invalid!r}) should raise ValueError")
+
+
+def test_aggregates():
+    window, summaries = _collect(kind="tumbling", size=4, aggregates=[
+        "count", {'sum': 'value'}, {'min': 'value'}, {'max': 'value'}, {'topk': 'device', 'k': 1},
+        {'concat': 'message', 'max_chars': 8}])
+    for value, device, message in ((3, "a", "one"), (1, "b", "two"), (5, "a", "three"), ("x", "a", "four")):
+        window.add({'value': value, 'device': device, 'message': message})
+    summary = summaries[0]
+    assert summary['count'] == 4 and summary['sum_value'] == 9
+    assert summary['min_value'] == 1 and summary['max_value'] == 5
+    assert summary['topk_device'] == [("a", 3)]
+    assert summary['concat_message'] == "one\ntwo\n...（省略 2 条）"
+    for invalid in ([{'sum': 'x', 'max': 'y'}], ["median"], [{'topk': 'x', 'bad': 1}], ["count", "count"]):
+        try:
+            build_aggregates(invalid)
+        except ValueError:
+            continue
+        raise AssertionError(f"build_aggregates({invalid!r}) should raise ValueError")
+
+
+def test_tumbling_count_by_key():
+    window, summaries = _collect(kind="tumbling", size=2, key_by="device", aggregates=["count", {'sum': 'value'}])
+    for device, value in (("a", 1), ("b", 10), ("a", 2), ("b", 20), ("a", 3)):
+        window.add({'device': device, 'value': value})
+    assert [(s['key'], s['count'], s['sum_value']) for s in summaries] == [("a", 2, 3), ("b", 2, 30)]
+    # 窗口已输出的 key 立即释放，只剩 a 的未结束窗口
+    assert window.get_stats()['open_keys'] == 1
+    window.flush()
+    assert (summaries[-1]['key'], summaries[-1]['count']) == ("a", 1)
+    assert window.get_stats()['open_keys'] == 0
+    window.close()
+
+
+def test_sliding_count():
+    window, summaries = _collect(kind="sliding", size=4, slide=2, aggregates=[{'sum': None}])
+    for i in range(1, 9):
+        window.add(i)
+    # 窗口 [1..4]、[3..6]、[5..8]
+    assert [s['sum'] for s in summaries] == [10, 18, 26]
+    assert all(s['count'] == 4 for s in summaries)
+
+
+def test_tumbling_time_ends_without_new_data():
+    window, summaries = _collect(kind="tumbling", size=0.2, aggregates=["count"])
+    for _ in range(3):
+        window.add("x")
+    # 三条数据可能跨过窗口边界，落在相邻的两个窗口中
+    assert _wait_for(lambda: sum(s['count'] for s in summaries) == 3), "time window did not end without new data"
+    summary = summaries[0]
+    assert abs((summary['end'] - summary['start']) - 0.2) < 1e-6
+    assert window.get_stats()['open_keys'] == 0
+    window.close()
+
+
+def test_sliding_time():
+    window, summaries = _collect(kind="sliding", size=0.4, slide=0.2, aggregates=["count"])
+    window.add("x")
+    # 一个 pane 出现在之后的 size / slide 个窗口中，没有新数据时这些窗口也都会输出
+    assert _wait_for(lambda: len(summaries) == 2, timeout=3), summaries
+    assert [s['count'] for s in summaries] == [1, 1]
+    assert _wait_for(lambda: window.get_stats()['open_keys'] == 0)
+    window.close()
+
+
+def test_session_by_key():
+    window, summaries = _collect(kind="session", gap=0.2, key_by="user", aggregates=["count"])
+    window.add({'user': "a"})
+    window.add({'user': "b"})
+    window.add({'user': "a"})
+    assert summaries == []
+    assert _wait_for(lambda: len(summaries) == 2), summaries
+    assert sorted((s['key'], s['count']) for s in summaries) == [("a", 2), ("b", 1)]
+    assert window.get_stats()['open_keys'] == 0
+    window.close()
+
+
+def test_idle_count_keys_are_released():
+    # 按条数的窗口没有到期时间：key 空闲超过 idle 后输出未结束的窗口并释放状态
+    window, summaries = _collect(kind="tumbling", size=10, key_by="device", aggregates=["count"], idle=0.2)
+    for i in range(50):
+        window.add({'device': f"device-{i}"})
+    assert window.get_stats()['open_keys'] == 50
+    assert _wait_for(lambda: window.get_stats()['open_keys'] == 0), window.get_stats()
+    assert len(summaries) == 50 and all(s['count'] == 1 for s in summaries)
+    window.close()
+
+
+if __name__ == "__main__":
+    test_parse_size()
+    test_aggregates()
+    test_tumbling_count_by_key()
+    test_sliding_count()
+    test_tumbling_time_ends_without_new_data()
+    test_sliding_time()
+    test_session_by_key()
+    test_idle_count_keys_are_released()
+    print("Window operators emit and release keys as configured")
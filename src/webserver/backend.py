@@ -2,13 +2,20 @@ import eventlet
 # 使用 eventlet 作为异步模式
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, request, jsonify
-from flask_socketio import SocketIO, emit
-import threading
+from flask import Flask, Response, render_template, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room
+import os
 from typing import Any
-from streamllm import DSLParser, StreamManager, AgentStore, PromptAgent
+from streamllm import DSLParser, StreamManager, AgentStore, PromptAgent, StreamFullError, setup_logging, render_metrics
+from streamllm.framework.cache import get_cache, list_caches
+from streamllm.framework.telemetry import get_telemetry, ALL_NODES_ROOM
+from streamllm.framework.resilience import get_breaker_stats
+from streamllm.framework.router import list_route_stats
 
 
+# 日志级别可通过环境变量 STREAMLLM_LOG_LEVEL 调整（调试时设为 DEBUG）
+setup_logging(level=os.getenv("STREAMLLM_LOG_LEVEL", "INFO"))
+
 # Flask应用和SocketIO初始化
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
@@ -38,7 +45,7 @@ def add_stream():
     if stream_manager.get_stream(stream_name):
         return jsonify({'status': 'error', 'message': f'Stream {stream_name} already exists.'}), 400
     try:
-        stream = stream_manager.create_stream(stream_name)
+        stream = stream_manager.create_stream(stream_name, persistent=data.get('persistent'))
         return jsonify({'status': 'success', 'stream': stream.name})
     except ValueError as e:
         return jsonify({'status': 'error', 'message': str(e)}), 400
@@ -61,13 +68,24 @@ def get_stream():
     if not stream:
         return jsonify({'status': 'error', 'message': f'Stream {stream_name} does not exist.'}), 404
     handlers = [handler.__name__ for handler in stream.handlers]
-    return jsonify({'status': 'success', 'stream': {'name': stream.name, 'handlers': handlers}})
+    return jsonify({'status': 'success', 'stream': {'name': stream.name, 'handlers': handlers, 'stats': stream.get_stats()}})
 
 @app.route('/list_streams', methods=['GET'])
 def list_streams():
     streams = stream_manager.list_streams()
     return jsonify({'streams': [stream.name for stream in streams]})
 
+@app.route('/dispatch_plan', methods=['GET'])
+def dispatch_plan():
+    # 每个 Stream 预编译的下游路由（拓扑序）
+    return jsonify({'status': 'success', 'plan': stream_manager.get_dispatch_plan()})
+
+@app.route('/stream_stats', methods=['GET'])
+def stream_stats():
+    # 各 Stream 的 emit / 丢弃 / 拒绝计数以及排队深度
+    streams = stream_manager.list_streams()
+    return jsonify({'status': 'success', 'stats': {stream.name: stream.get_stats() for stream in streams}})
+
 
 ### ---------- Agent 相关的 API 端点 ---------- ###
 @app.route('/add_agent', methods=['POST'])
@@ -80,15 +98,27 @@ def add_agent():
     if agent_store.get_agent(agent_name):
         return jsonify({'status': 'error', 'message': f'Agent {agent_name} already exists.'}), 400
     try:
-        agent = agent_store.create_agent(name=agent_name, category=agent_category, llm_type=llm_type)
+        agent = agent_store.create_agent(name=agent_name, category=agent_category, llm_type=llm_type,
+                                         executor=data.get('executor', 'inline'),
+                                         model=data.get('model'), max_tokens=data.get('max_tokens'),
+                                         temperature=data.get('temperature'), timeout=data.get('timeout'),
+                                         llm_routing=data.get('llm_routing'))
         for stream_name in subscribed_streams:
             stream = stream_manager.get_stream(stream_name)
             if stream:
                 agent.subscribe(stream)
+        add_output_streams(agent, data.get('output_streams', []))
         return jsonify({'status': 'success', 'agent': agent.name})
     except ValueError as e:
         return jsonify({'status': 'error', 'message': str(e)}), 400
 
+def add_output_streams(agent, stream_names):
+    # Agent 的每个回答都会发送到这些 Stream
+    for stream_name in stream_names:
+        stream = stream_manager.get_stream(stream_name)
+        if stream:
+            agent.add_output_stream(stream)
+
 #  添加自定义Agent
 @app.route('/add_custom_agent', methods=['POST'])
 def add_custom_agent():
@@ -97,6 +127,12 @@ def add_custom_agent():
     llm_type = data.get('llm_type')
     subscribed_streams = data.get('subscribed_streams', [])
     prompt = data.get('prompt', '')
+    batch_size = int(data.get('batch_size', 1))
+    batch_wait = float(data.get('batch_wait', 1.0))
+    streaming = bool(data.get('streaming', False))
+    partial_stream_name = data.get('partial_stream')
+    dead_letter_name = data.get('dead_letter_stream')
+    cache_config = data.get('cache')
 
     if not agent_name or not llm_type or not prompt:
         return jsonify({'status': 'error', 'message': 'Agent name, LLM API key, and prompt are required.'}), 400
@@ -104,15 +140,27 @@ def add_custom_agent():
     try:
         # 定义一个UserDefinedAgent类继承自BuiltInAgent
         class UserDefinedAgent(PromptAgent):
-            def generate_prompt(self, data: Any) -> str:
-                return prompt + " " + str(data)
+            instructions = (prompt + " ",)
 
-        agent = UserDefinedAgent(name=agent_name, llm_type=llm_type, socketio=socketio)
+            def generate_prompt(self, data: Any) -> str:
+                return self.fit_prompt(prompt + " ", str(data))
+
+        agent = UserDefinedAgent(name=agent_name, llm_type=llm_type, socketio=socketio,
+                                 batch_size=batch_size, batch_wait=batch_wait, streaming=streaming,
+                                 cache=get_cache(cache_config) if cache_config else None,
+                                 routing=data.get('llm_routing'),
+                                 **{key: data[key] for key in ('model', 'max_tokens', 'temperature', 'timeout', 'max_input_tokens', 'overflow')
+                                    if data.get(key) is not None})
+        if partial_stream_name:
+            agent.partial_stream = stream_manager.get_stream(partial_stream_name)
+        if dead_letter_name:
+            agent.dead_letter_stream = stream_manager.get_stream(dead_letter_name)
         agent_store.add_agent(agent)
         for stream_name in subscribed_streams:
             stream = stream_manager.get_stream(stream_name)
             if stream:
                 agent.subscribe(stream)
+        add_output_streams(agent, data.get('output_streams', []))
         return jsonify({'status': 'success', 'agent': agent.name})
     except ValueError as e:
         return jsonify({'status': 'error', 'message': str(e)}), 400
@@ -137,7 +185,11 @@ def get_agent():
     # import pdb; pdb.set_trace()
     agent_handler_name = f"agent_handler_{agent.name}"
     subscribed_streams = [stream.name for stream in stream_manager.list_streams() if any(agent_handler_name in handler.__name__ for handler in stream.handlers)]
-    return jsonify({'status': 'success', 'agent': {'name': agent.name, 'llm_type': agent.llm_type, 'subscribed_streams': subscribed_streams}})
+    agent_info = {'name': agent.name, 'llm_type': agent.llm_type, 'subscribed_streams': subscribed_streams}
+    if getattr(agent, 'batcher', None):
+        agent_info['batch_histogram'] = agent.batcher.get_histogram()
+    agent_info['status'] = agent.get_status()
+    return jsonify({'status': 'success', 'agent': agent_info})
 
 @app.route('/get_built_in_agents', methods=['GET'])
 def get_built_in_agents():
@@ -145,6 +197,32 @@ def get_built_in_agents():
     built_in_agents = [agent.name for agent in agent_store.get_builtin_agents()]
     return jsonify({'agents': built_in_agents})
 
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats():
+    # 开启微批处理的 Agent 的批大小直方图（批大小 -> 次数），用于调整 batch_size / batch_wait
+    histograms = {agent.name: agent.batcher.get_histogram() for agent in agent_store.list_agents() if getattr(agent, 'batcher', None)}
+    return jsonify({'status': 'success', 'histograms': histograms})
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    # 各响应缓存的命中 / 未命中次数、命中率以及节省的 LLM 耗时（秒）
+    return jsonify({'status': 'success', 'caches': {key: cache.get_stats() for key, cache in list_caches().items()}})
+
+@app.route('/breaker_stats', methods=['GET'])
+def breaker_stats():
+    # 各 provider 熔断器的状态（closed / open / half_open）和连续失败次数
+    return jsonify({'status': 'success', 'breakers': get_breaker_stats()})
+
+@app.route('/route_stats', methods=['GET'])
+def route_stats():
+    # 多 provider 路由中各路由（provider/model）的延迟分位数和错误率
+    return jsonify({'status': 'success', 'routes': list_route_stats()})
+
+@app.route('/agent_status', methods=['GET'])
+def agent_status():
+    # 每个 Agent 的处理状态（processing / done / error / idle）、计数以及 Handler / LLM / 端到端耗时的 p50、p99
+    return jsonify({'status': 'success', 'agents': {agent.name: agent.get_status() for agent in agent_store.list_agents()}})
+
 @app.route('/list_agents', methods=['GET'])
 def list_agents():
     agents = agent_store.list_agents()
@@ -169,10 +247,30 @@ def subscribe_stream():
     agent = agent_store.get_agent(agent_name)
     if not stream or not agent:
         return jsonify({'status': 'error', 'message': 'Stream or agent does not exist.'}), 404
-    agent.subscribe(stream)
+    # persistent 的 Stream 可以通过 replay_from（earliest 或 offset）回放历史数据
+    agent.subscribe(stream, replay_from=data.get('replay_from'))
     return jsonify({'status': 'success', 'message': f'Agent {agent_name} subscribed to stream {stream_name}.'})
 
 
+# Agent 的回答发送到指定的 Stream
+@app.route('/add_output_stream', methods=['POST'])
+def add_output_stream():
+    data = request.json
+    stream_name = data.get('stream')
+    agent_name = data.get('agent')
+    if not stream_name or not agent_name:
+        return jsonify({'status': 'error', 'message': 'Stream name and agent name are required.'}), 400
+    stream = stream_manager.get_stream(stream_name)
+    agent = agent_store.get_agent(agent_name)
+    if not stream or not agent:
+        return jsonify({'status': 'error', 'message': 'Stream or agent does not exist.'}), 404
+    try:
+        agent.add_output_stream(stream)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({'status': 'success', 'message': f'Agent {agent_name} outputs to stream {stream_name}.'})
+
+
 ### ---------- Emit 相关的 API 端点 ---------- ###
 @app.route('/emit_data', methods=['POST'])
 def emit_data():
@@ -184,10 +282,19 @@ def emit_data():
     stream = stream_manager.get_stream(stream_name)
     if not stream:
         return jsonify({'status': 'error', 'message': f'Stream {stream_name} does not exist.'}), 400
-    # 在独立线程中发射数据，避免阻塞Flask
-    threading.Thread(target=stream.emit, args=(payload,)).start()
+    # async 模式下 emit 只入队即返回，由 Stream 的有界 inbox 控制在途数据量
+    try:
+        stream.emit(payload)
+    except StreamFullError as e:
+        return jsonify({'status': 'error', 'message': str(e), 'stats': stream.get_stats()}), 429
     return jsonify({'status': 'success', 'message': f'Data emitted to stream {stream_name}.'})
 
+### ---------- 指标 ---------- ###
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus 文本格式的 Stream / Agent 指标
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 ### ---------- Config 相关的 API 端点 ---------- ###
 # 从配置文件加载Graph
 @app.route('/load_graph', methods=['GET'])
@@ -210,12 +317,25 @@ def update_config():
 # SocketIO事件
 @socketio.on('connect')
 def handle_connect():
+    # 默认接收所有节点的遥测帧
+    join_room(ALL_NODES_ROOM)
     print('Client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    get_telemetry(socketio).remove_client(request.sid)
     print('Client disconnected')
 
+# 客户端只订阅部分节点的遥测，nodes 为空时恢复接收全部节点
+@socketio.on('subscribe_nodes')
+def handle_subscribe_nodes(msg):
+    nodes = (msg or {}).get('nodes') or []
+    get_telemetry(socketio).set_filter(request.sid, nodes)
+    if nodes:
+        leave_room(ALL_NODES_ROOM)
+    else:
+        join_room(ALL_NODES_ROOM)
+
 # 运行Flask应用
 if __name__ == "__main__":
     # 使用eventlet作为异步模式
@@ -137,18 +137,27 @@ function updateGraph() {
 }
 
 // SocketIO事件处理
-socket.on('data_flow', function(msg) {
-    console.log('Data Flow:', msg);
+// 后端每隔约 100ms 推送一个聚合后的遥测帧，包含各 Stream / 边 / Agent 的计数和截断的数据预览
+socket.on('telemetry', function(frame) {
+    console.log('Telemetry:', frame);
     // 根据事件更新图表或显示数据流动
-    // 示例：高亮相关节点或添加动态链接
-    // 例如，高亮发射和转发的数据流
-    if(msg.action === 'emit') {
-        highlightStream(msg.stream);
-    } else if(msg.action === 'forward') {
-        highlightLink(msg.stream, msg.target_stream);
-    }
+    // 高亮发射和转发的数据流
+    Object.keys(frame.streams).forEach(function(streamName) {
+        highlightStream(streamName);
+    });
+    frame.edges.forEach(function(edge) {
+        highlightLink(edge.source, edge.target);
+    });
+    Object.keys(frame.agents).forEach(function(agentName) {
+        handleAgentTelemetry(agentName, frame.agents[agentName]);
+    });
 });
 
+// 只接收部分节点的遥测帧，传入空数组恢复接收全部节点
+function subscribeNodes(nodeNames) {
+    socket.emit('subscribe_nodes', {nodes: nodeNames});
+}
+
 function highlightStream(streamName) {
     node.filter(d => d.id === streamName)
         .classed('highlight', true)
@@ -187,12 +196,53 @@ function highlightAgent(agentName) {
         .classed('highlight', false);
 }
 
-socket.on('agent_response', function(msg) {
-    console.log('Agent Response:', msg);
-    // 在UI中显示Agent的响应
-    // alert(`Agent ${msg.agent} 响应: ${msg.response}`);
-    highlightAgent(msg.agent);
-});
+// 流式输出时按 Agent 累积增量片段
+var partialResponses = {};
+
+function handleAgentTelemetry(agentName, stats) {
+    if(stats.partial) {
+        // 第一批片段到达时即高亮，后续片段只累积，避免重复触发动画
+        if(!(agentName in partialResponses)) {
+            partialResponses[agentName] = '';
+            highlightAgent(agentName);
+        }
+        partialResponses[agentName] += stats.partial;
+    }
+    if(stats.count > 0) {
+        delete partialResponses[agentName];
+        // 在UI中显示Agent的响应
+        // alert(`Agent ${agentName} 响应: ${stats.preview}`);
+        highlightAgent(agentName);
+    }
+}
+
+// Agent 处理状态：定期从 /agent_status 拉取，按状态给节点着色，鼠标悬停显示计数和耗时
+var agentStatusColors = {processing: '#1f77b4', done: '#ff7f0e', error: '#d62728', idle: '#ff7f0e'};
+
+function formatSeconds(value) {
+    return value === null ? '-' : (value * 1000).toFixed(0) + 'ms';
+}
+
+function refreshAgentStatus() {
+    fetch('/agent_status')
+        .then(response => response.json())
+        .then(data => {
+            node.filter(d => d.type !== 'stream' && d.id in data.agents)
+                .attr('fill', d => agentStatusColors[data.agents[d.id].state])
+                .each(function(d) {
+                    var status = data.agents[d.id];
+                    var title = d3.select(this).selectAll('title').data([d]);
+                    title.enter().append('title').merge(title)
+                        .text(`${d.id}: ${status.state}\n` +
+                              `items ${status.items}, errors ${status.errors}, in flight ${status.in_flight}\n` +
+                              `handler p50/p99 ${formatSeconds(status.handler_p50)} / ${formatSeconds(status.handler_p99)}\n` +
+                              `LLM p50/p99 ${formatSeconds(status.llm_p50)} / ${formatSeconds(status.llm_p99)}\n` +
+                              `e2e p50/p99 ${formatSeconds(status.e2e_p50)} / ${formatSeconds(status.e2e_p99)}`);
+                });
+        });
+}
+
+setInterval(refreshAgentStatus, 2000);
 
 // 加载All Agents
 function loadAgents() {